@@ -0,0 +1,409 @@
+"""
+Anchor queue module for the PII Authenticator application.
+Keeps a durable local queue of tokens waiting to be stored on-chain and drains it
+from a background worker, so /encrypt never blocks on the blockchain.
+
+ANCHOR_MODE selects how tokens reach the chain:
+    single - one storeToken transaction per token
+    batch  - one storeTokens transaction per window of tokens
+    merkle - one anchorRoot transaction per window; inclusion proofs are kept locally
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from w3_utils import (
+    submit_token_to_blockchain,
+    submit_token_batch_to_blockchain,
+    submit_merkle_root_to_blockchain,
+    get_transaction_status,
+    get_anchored_on_chain,
+    contract_has_functions,
+)
+from merkle import build_tree
+from logger import get_logger
+from metrics import stage
+
+# Get logger
+logger = get_logger()
+
+ANCHOR_QUEUE_PATH = os.getenv("ANCHOR_QUEUE_PATH", os.path.join("storage", "anchor_queue.db"))
+ANCHOR_MAX_ATTEMPTS = int(os.getenv("ANCHOR_MAX_ATTEMPTS", "5"))
+ANCHOR_RETRY_DELAY = float(os.getenv("ANCHOR_RETRY_DELAY", "2.0"))
+ANCHOR_POLL_INTERVAL = float(os.getenv("ANCHOR_POLL_INTERVAL", "1.0"))
+ANCHOR_RECEIPT_TIMEOUT = float(os.getenv("ANCHOR_RECEIPT_TIMEOUT", "300"))
+ANCHOR_BATCH_SIZE = int(os.getenv("ANCHOR_BATCH_SIZE", "50"))
+# Nonces come from the local nonce manager, so many transactions can be in flight
+ANCHOR_MAX_IN_FLIGHT = int(os.getenv("ANCHOR_MAX_IN_FLIGHT", "32"))
+ANCHOR_SUBMIT_CONCURRENCY = int(os.getenv("ANCHOR_SUBMIT_CONCURRENCY", "4"))
+
+ANCHOR_MODE = os.getenv("ANCHOR_MODE", "single").lower()
+# In batch and merkle modes a window closes when it is full or its oldest token has waited long enough
+ANCHOR_WINDOW_SIZE = int(os.getenv("ANCHOR_WINDOW_SIZE", "1000"))
+ANCHOR_WINDOW_SECONDS = float(os.getenv("ANCHOR_WINDOW_SECONDS", "30"))
+
+MODE_SINGLE = "single"
+MODE_BATCH = "batch"
+MODE_MERKLE = "merkle"
+
+if ANCHOR_MODE not in (MODE_SINGLE, MODE_BATCH, MODE_MERKLE):
+    logger.warning(f"⚠️ Unknown ANCHOR_MODE {ANCHOR_MODE!r}, falling back to {MODE_SINGLE}")
+    ANCHOR_MODE = MODE_SINGLE
+
+# Contract methods each windowed mode needs. Deployments compiled before they were
+# added lack them, and every window would fail on-chain, so refuse to start instead.
+_MODE_FUNCTIONS = {
+    MODE_BATCH: ("storeTokens",),
+    MODE_MERKLE: ("anchorRoot", "isRootAnchored"),
+}
+_missing_functions = contract_has_functions(*_MODE_FUNCTIONS.get(ANCHOR_MODE, ()))
+if _missing_functions:
+    raise RuntimeError(
+        f"ANCHOR_MODE={ANCHOR_MODE} needs contract methods {', '.join(_missing_functions)}, "
+        f"which the loaded ABI lacks; recompile and redeploy the contract "
+        f"(npx hardhat compile, then scripts/deploy.js) or use ANCHOR_MODE={MODE_SINGLE}"
+    )
+
+STATUS_PENDING = "pending"
+STATUS_SUBMITTED = "submitted"
+STATUS_ANCHORED = "anchored"
+STATUS_FAILED = "failed"
+
+# A single connection guarded by a lock is plenty for the queue's write rate
+_db_lock = threading.Lock()
+_db = None
+
+_worker_lock = threading.Lock()
+_worker_thread = None
+_wake_event = threading.Event()
+_stop_event = threading.Event()
+_submit_executor = None
+
+def _get_db():
+    """Open the queue database on first use and make sure the schema exists."""
+    global _db
+    if _db is None:
+        directory = os.path.dirname(ANCHOR_QUEUE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _db = sqlite3.connect(ANCHOR_QUEUE_PATH, check_same_thread=False, isolation_level=None)
+        _db.row_factory = sqlite3.Row
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS anchors (
+                token TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                tx_hash TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                submitted_at REAL,
+                next_attempt_at REAL NOT NULL
+            )
+            """
+        )
+        # Columns added after the first release of the queue
+        columns = {row["name"] for row in _db.execute("PRAGMA table_info(anchors)")}
+        for column in ("root", "proof"):
+            if column not in columns:
+                _db.execute(f"ALTER TABLE anchors ADD COLUMN {column} TEXT")
+        _db.execute("CREATE INDEX IF NOT EXISTS idx_anchors_status ON anchors (status, next_attempt_at)")
+        _db.execute("CREATE INDEX IF NOT EXISTS idx_anchors_tx_hash ON anchors (tx_hash)")
+        logger.info(f"✅ Anchor queue opened at {ANCHOR_QUEUE_PATH}")
+    return _db
+
+def enqueue_tokens(tokens, flush=False):
+    """
+    Add several tokens to the anchor queue in one transaction.
+
+    Args:
+        tokens (list): The tokens to anchor on-chain
+        flush (bool): In batch and merkle modes, close the current window right
+            away instead of waiting for ANCHOR_WINDOW_SECONDS
+
+    Returns:
+        str: The anchor status of the tokens (always "pending" for new tokens)
+    """
+    now = time.time()
+    # A window closes once its oldest token is ANCHOR_WINDOW_SECONDS old
+    due_at = now - ANCHOR_WINDOW_SECONDS if flush else now
+    with _db_lock:
+        _get_db().executemany(
+            "INSERT OR IGNORE INTO anchors (token, status, created_at, updated_at, next_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(token, STATUS_PENDING, now, now, due_at) for token in tokens]
+        )
+    logger.debug(f"{len(tokens)} token(s) queued for anchoring")
+
+    start_worker()
+    _wake_event.set()
+    return STATUS_PENDING
+
+def enqueue_token(token):
+    """
+    Add a token to the anchor queue.
+
+    Args:
+        token (str): The token to anchor on-chain
+
+    Returns:
+        str: The anchor status of the token (always "pending" for a new token)
+    """
+    return enqueue_tokens([token])
+
+def get_anchor_status(token):
+    """
+    Look up the anchoring state of a token.
+
+    Args:
+        token (str): The token to look up
+
+    Returns:
+        dict: The status record, or None if the token was never queued
+    """
+    with _db_lock:
+        row = _get_db().execute(
+            "SELECT token, status, tx_hash, attempts, last_error, created_at, updated_at, root, proof "
+            "FROM anchors WHERE token = ?",
+            (token,)
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    status = dict(row)
+    status["proof"] = json.loads(status["proof"]) if status["proof"] else None
+    return status
+
+def get_queued_tokens(since=None):
+    """
+    List tokens in the queue, whatever their status.
+
+    Args:
+        since (float, optional): Only return tokens queued at or after this Unix time
+
+    Returns:
+        list: The queued tokens
+    """
+    with _db_lock:
+        rows = _get_db().execute(
+            "SELECT token FROM anchors WHERE created_at >= ?", (since or 0,)
+        ).fetchall()
+    return [row["token"] for row in rows]
+
+def _mark_retry(token, attempts, error):
+    """Schedule another attempt for a token, or give up after ANCHOR_MAX_ATTEMPTS."""
+    now = time.time()
+    if attempts >= ANCHOR_MAX_ATTEMPTS:
+        status = STATUS_FAILED
+        logger.error(f"❌ Giving up anchoring token {token} after {attempts} attempts: {error}")
+    else:
+        status = STATUS_PENDING
+        logger.warning(f"⚠️ Anchoring attempt {attempts} failed for token {token}: {error}")
+
+    # Exponential backoff between attempts
+    next_attempt_at = now + ANCHOR_RETRY_DELAY * (2 ** max(attempts - 1, 0))
+    with _db_lock:
+        _get_db().execute(
+            "UPDATE anchors SET status = ?, attempts = ?, last_error = ?, tx_hash = NULL, "
+            "root = NULL, proof = NULL, updated_at = ?, next_attempt_at = ? WHERE token = ?",
+            (status, attempts, error, now, next_attempt_at, token)
+        )
+
+def _submit_one(token, attempts):
+    """Send the transaction for a single token and record the result."""
+    with stage("chain_store"):
+        tx_hash = submit_token_to_blockchain(token)
+
+    if not tx_hash:
+        _mark_retry(token, attempts, "Transaction submission failed")
+        return
+
+    now = time.time()
+    with _db_lock:
+        _get_db().execute(
+            "UPDATE anchors SET status = ?, tx_hash = ?, attempts = ?, submitted_at = ?, "
+            "updated_at = ? WHERE token = ?",
+            (STATUS_SUBMITTED, tx_hash, attempts, now, now, token)
+        )
+    logger.debug(f"Token {token} submitted in transaction {tx_hash}")
+
+def _submit_window(rows):
+    """Send one storeTokens or anchorRoot transaction covering a window of tokens."""
+    tokens = [row["token"] for row in rows]
+
+    with stage("chain_store_window"):
+        if ANCHOR_MODE == MODE_MERKLE:
+            root, proofs = build_tree(tokens)
+            tx_hash = submit_merkle_root_to_blockchain(root)
+        else:
+            root, proofs = None, {}
+            tx_hash = submit_token_batch_to_blockchain(tokens)
+
+    if not tx_hash:
+        for row in rows:
+            _mark_retry(row["token"], row["attempts"] + 1, "Batch transaction submission failed")
+        return
+
+    now = time.time()
+    with _db_lock:
+        _get_db().executemany(
+            "UPDATE anchors SET status = ?, tx_hash = ?, attempts = ?, root = ?, proof = ?, "
+            "submitted_at = ?, updated_at = ? WHERE token = ?",
+            [
+                (
+                    STATUS_SUBMITTED, tx_hash, row["attempts"] + 1, root,
+                    json.dumps(proofs[row["token"]]) if root else None,
+                    now, now, row["token"]
+                )
+                for row in rows
+            ]
+        )
+    logger.info(f"✅ Window of {len(tokens)} tokens submitted in transaction {tx_hash}")
+
+def _submit_pending():
+    """Send transactions for pending tokens whose next attempt is due."""
+    global _submit_executor
+    now = time.time()
+    windowed = ANCHOR_MODE != MODE_SINGLE
+    with _db_lock:
+        db = _get_db()
+        in_flight = db.execute(
+            "SELECT COUNT(DISTINCT tx_hash) FROM anchors WHERE status = ?", (STATUS_SUBMITTED,)
+        ).fetchone()[0]
+        if windowed:
+            capacity = ANCHOR_WINDOW_SIZE if in_flight < ANCHOR_MAX_IN_FLIGHT else 0
+        else:
+            capacity = min(ANCHOR_MAX_IN_FLIGHT - in_flight, ANCHOR_BATCH_SIZE)
+        if capacity <= 0:
+            return 0
+        rows = db.execute(
+            "SELECT token, attempts, next_attempt_at FROM anchors WHERE status = ? AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (STATUS_PENDING, now, capacity)
+        ).fetchall()
+
+    if not rows:
+        return 0
+
+    if windowed:
+        # Keep collecting until the window is full or its oldest token is due
+        if len(rows) < ANCHOR_WINDOW_SIZE and now - rows[0]["next_attempt_at"] < ANCHOR_WINDOW_SECONDS:
+            return 0
+        _submit_window(rows)
+        return len(rows)
+
+    if _submit_executor is None:
+        _submit_executor = ThreadPoolExecutor(
+            max_workers=ANCHOR_SUBMIT_CONCURRENCY, thread_name_prefix="anchor-submit"
+        )
+
+    # Send the whole batch without waiting for receipts; _check_submitted follows up
+    futures = [_submit_executor.submit(_submit_one, row["token"], row["attempts"] + 1) for row in rows]
+    for future in futures:
+        future.result()
+
+    return len(rows)
+
+def _check_submitted():
+    """Poll receipts for submitted transactions and record the outcome."""
+    with _db_lock:
+        transactions = _get_db().execute(
+            "SELECT tx_hash, MIN(submitted_at) AS submitted_at FROM anchors WHERE status = ? "
+            "GROUP BY tx_hash LIMIT ?",
+            (STATUS_SUBMITTED, ANCHOR_BATCH_SIZE)
+        ).fetchall()
+
+    for transaction in transactions:
+        tx_hash = transaction["tx_hash"]
+        mined = get_transaction_status(tx_hash)
+
+        if mined is None and time.time() - (transaction["submitted_at"] or 0) <= ANCHOR_RECEIPT_TIMEOUT:
+            continue
+
+        if not mined:
+            if mined is None:
+                error = f"No receipt for {tx_hash} after {ANCHOR_RECEIPT_TIMEOUT:.0f} seconds"
+            else:
+                error = f"Transaction {tx_hash} reverted"
+            with _db_lock:
+                rows = _get_db().execute(
+                    "SELECT token, attempts, root FROM anchors WHERE status = ? AND tx_hash = ?",
+                    (STATUS_SUBMITTED, tx_hash)
+                ).fetchall()
+            if not rows:
+                continue
+
+            # An unconfirmed transaction can still be mined, and a retry of a token an
+            # earlier attempt already stored reverts with "Token already exists", so
+            # check the contract before sending the tokens again
+            stored = get_anchored_on_chain([row["token"] for row in rows], rows[0]["root"])
+            if stored is None and mined is None:
+                # The contract cannot be read either; keep waiting for the receipt
+                continue
+            stored = stored or {}
+            anchored = [row["token"] for row in rows if stored.get(row["token"])]
+            if anchored:
+                with _db_lock:
+                    _get_db().executemany(
+                        "UPDATE anchors SET status = ?, last_error = NULL, updated_at = ? WHERE token = ?",
+                        [(STATUS_ANCHORED, time.time(), token) for token in anchored]
+                    )
+                logger.info(f"✅ {len(anchored)} token(s) already on-chain although {tx_hash} was not confirmed")
+            for row in rows:
+                if not stored.get(row["token"]):
+                    _mark_retry(row["token"], row["attempts"], error)
+            continue
+
+        with _db_lock:
+            anchored = _get_db().execute(
+                "UPDATE anchors SET status = ?, last_error = NULL, updated_at = ? "
+                "WHERE status = ? AND tx_hash = ?",
+                (STATUS_ANCHORED, time.time(), STATUS_SUBMITTED, tx_hash)
+            ).rowcount
+        logger.info(f"✅ {anchored} token(s) anchored on-chain in transaction {tx_hash}")
+
+def _worker_loop():
+    """Drain the queue until stop_worker() is called."""
+    logger.info("Anchor worker started")
+    while not _stop_event.is_set():
+        _wake_event.clear()
+        try:
+            _check_submitted()
+            submitted = _submit_pending()
+        except Exception as e:
+            logger.error(f"❌ Anchor worker iteration failed: {e}")
+            logger.debug(traceback.format_exc())
+            submitted = 0
+
+        # Go straight round again while there is work, otherwise sleep until woken
+        if not submitted:
+            _wake_event.wait(ANCHOR_POLL_INTERVAL)
+    logger.info("Anchor worker stopped")
+
+def start_worker():
+    """Start the background anchor worker if it is not already running."""
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+
+    with _worker_lock:
+        if _worker_thread is not None and _worker_thread.is_alive():
+            return
+        _stop_event.clear()
+        _worker_thread = threading.Thread(target=_worker_loop, name="anchor-worker", daemon=True)
+        _worker_thread.start()
+
+def stop_worker(timeout=5):
+    """Stop the background anchor worker and wait for it to exit."""
+    _stop_event.set()
+    _wake_event.set()
+    if _worker_thread is not None:
+        _worker_thread.join(timeout)
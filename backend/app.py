@@ -1,14 +1,35 @@
 # backend/app.py
+import io
 import os
 import time
-import json
 import traceback
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from dotenv import load_dotenv
-from token_auth import get_or_generate_token, verify_token
-from w3_utils import upload_to_filebase
-from logger import get_logger, log_access
+from token_auth import (
+    get_or_generate_token,
+    issue_token,
+    verify_token,
+    verify_tokens,
+    get_token_status,
+    start_background_services,
+    generate_tokens,
+    issue_tokens,
+)
+from w3_utils import (
+    upload_to_filebase,
+    upload_batch_to_filebase,
+    upload_stream_to_filebase,
+    fetch_from_filebase,
+    stat_in_filebase,
+    open_from_filebase,
+    RECORD_SUFFIXES,
+)
+from storage_backend import STREAM_CHUNK_SIZE
+from record_format import encode_record, record_to_json
+from logger import get_logger, log_access, log_retrieval, begin_access, end_access
+import metrics
+import tracing
 
 # Load environment
 load_dotenv()
@@ -16,15 +37,31 @@ load_dotenv()
 # Get logger
 logger = get_logger()
 
+# Largest number of records accepted by /encrypt_batch in one request
+ENCRYPT_BATCH_MAX_RECORDS = int(os.getenv("ENCRYPT_BATCH_MAX_RECORDS", "1000"))
+# Largest number of tokens accepted by /validate_tokens in one request
+VALIDATE_BATCH_MAX_TOKENS = int(os.getenv("VALIDATE_BATCH_MAX_TOKENS", "1000"))
+# Largest request body accepted, which bounds documents uploaded to /encrypt
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 # Enable CORS for all routes and all origins (for development)
 CORS(app, resources={r"/*": {"origins": "*"}})
+metrics.register_default_collectors()
 
 # Request processing time middleware
 @app.before_request
 def before_request():
     g.start_time = time.time()
     g.request_id = os.urandom(8).hex()
+    begin_access(g.request_id, request.method, request.path, request.remote_addr)
+    # The route pattern, so unknown paths cannot grow the metric label set
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_started(g.metrics_endpoint)
+    tracing.start_trace(f"{request.method} {g.metrics_endpoint}", g.request_id)
+    # Background work (anchoring, token filter) runs in the serving process only
+    start_background_services()
 
 @app.after_request
 def after_request(response):
@@ -34,8 +71,24 @@ def after_request(response):
         response.headers['X-Processing-Time'] = str(elapsed_time)
         logger.debug(f"Request {g.request_id} processed in {elapsed_time:.4f} seconds")
     
+    end_access(response.status_code)
+    g.response_status = response.status_code
     return response
 
+@app.teardown_request
+def teardown_request(exception):
+    # Requests that failed before after_request still get their access entry
+    end_access(500)
+    if hasattr(g, 'metrics_endpoint'):
+        metrics.request_finished(
+            g.metrics_endpoint, request.method, g.get('response_status', 500), time.time() - g.start_time
+        )
+    tracing.end_trace(g.get('response_status', 500))
+
+@app.errorhandler(413)
+def handle_too_large(e):
+    return jsonify({"error": f"Request body exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
 # Error handler
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -48,7 +101,15 @@ def encrypt():
     # Get client IP address
     ip_address = request.remote_addr
     
-    data = request.json
+    if request.mimetype == "multipart/form-data":
+        # Form fields plus an optional "document" file such as a scanned ID.
+        # Werkzeug spools uploaded files to disk, so documents are streamed to
+        # storage without being held whole in memory.
+        data = request.form
+        document = request.files.get("document")
+    else:
+        data = request.json
+        document = None
     user_id = data.get("user_id")
     
     # Extract all PII fields
@@ -72,9 +133,10 @@ def encrypt():
 
     try:
         # Generate token
-        token = get_or_generate_token(user_id)
+        with metrics.stage("token_generate"):
+            token = get_or_generate_token(user_id)
         
-        # Format PII data as JSON
+        # Collect the PII record
         pii_data = {
             "name": name,
             "email": email,
@@ -86,11 +148,33 @@ def encrypt():
             "timestamp": time.time()
         }
         
-        # Convert to JSON string
-        pii_json = json.dumps(pii_data, indent=2)
+        if document is not None and document.filename:
+            # The key is derived from the token only, never from the client's file name
+            with metrics.stage("document_upload"):
+                document_url = upload_stream_to_filebase(f"{token}.document", document.stream)
+            if not document_url:
+                log_access(
+                    endpoint="/encrypt", 
+                    user_id=user_id, 
+                    token=token, 
+                    ip_address=ip_address, 
+                    status="failure", 
+                    details="Document upload failed"
+                )
+                return jsonify({"error": "Document upload failed"}), 500
+            pii_data["document"] = {
+                "file_url": document_url,
+                "file_name": document.filename,
+                "content_type": document.mimetype
+            }
+        
+        # Serialize in the compact record format (see record_format.py)
+        with metrics.stage("record_encode"):
+            record_bytes = encode_record(pii_data)
         
         # Upload to filebase
-        file_url = upload_to_filebase(f"{token}.json", pii_json.encode())
+        with metrics.stage("record_upload"):
+            file_url = upload_to_filebase(f"{token}.json", record_bytes)
 
         if not file_url:
             log_access(
@@ -103,6 +187,9 @@ def encrypt():
             )
             return jsonify({"error": "Filebase upload failed"}), 500
 
+        # Anchor the token only now that its record is stored
+        issue_token(token, user_id)
+
         # Log successful token generation
         log_access(
             endpoint="/encrypt", 
@@ -113,10 +200,15 @@ def encrypt():
             details=f"Token generated and data stored at {file_url}"
         )
         
-        return jsonify({
+        response = {
             "token": token,
-            "file_url": file_url
-        })
+            "file_url": file_url,
+            "anchor_status": "pending"
+        }
+        if "document" in pii_data:
+            response["document_url"] = pii_data["document"]["file_url"]
+        
+        return jsonify(response)
     except Exception as e:
         logger.error(f"Error in /encrypt: {str(e)}")
         logger.error(traceback.format_exc())
@@ -131,6 +223,109 @@ def encrypt():
         
         return jsonify({"error": str(e)}), 500
 
+@app.route("/encrypt_batch", methods=["POST"])
+def encrypt_batch():
+    # Get client IP address
+    ip_address = request.remote_addr
+    
+    data = request.json
+    records = data.get("records") if isinstance(data, dict) else data
+
+    if not isinstance(records, list) or not records:
+        log_access(
+            endpoint="/encrypt_batch", 
+            ip_address=ip_address, 
+            status="failure", 
+            details="No records provided"
+        )
+        return jsonify({"error": "A non-empty list of records is required"}), 400
+
+    if len(records) > ENCRYPT_BATCH_MAX_RECORDS:
+        log_access(
+            endpoint="/encrypt_batch", 
+            ip_address=ip_address, 
+            status="failure", 
+            details=f"Too many records ({len(records)})"
+        )
+        return jsonify({"error": f"At most {ENCRYPT_BATCH_MAX_RECORDS} records per batch"}), 400
+
+    # Validate every record before doing any work
+    results = [None] * len(records)
+    valid_indexes = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or not record.get("user_id") or not record.get("id_number") or not record.get("name"):
+            results[index] = {
+                "index": index,
+                "user_id": record.get("user_id") if isinstance(record, dict) else None,
+                "error": "Missing required fields (user_id, name, id_number)"
+            }
+        else:
+            valid_indexes.append(index)
+
+    try:
+        tokens = generate_tokens(len(valid_indexes))
+        timestamp = time.time()
+        files = {}
+        for index, token in zip(valid_indexes, tokens):
+            record = records[index]
+            pii_data = {
+                "name": record.get("name"),
+                "email": record.get("email"),
+                "dob": record.get("dob"),
+                "phone": record.get("phone"),
+                "id_type": record.get("id_type"),
+                "id_number": record.get("id_number"),
+                "user_id": record.get("user_id"),
+                "timestamp": timestamp
+            }
+            files[f"{token}.json"] = encode_record(pii_data)
+
+        # Upload concurrently, then anchor only the tokens whose records were stored
+        file_urls = upload_batch_to_filebase(files)
+        issued = []
+        for index, token in zip(valid_indexes, tokens):
+            file_url = file_urls.get(f"{token}.json")
+            user_id = records[index].get("user_id")
+            if file_url:
+                issued.append(token)
+                results[index] = {
+                    "index": index,
+                    "user_id": user_id,
+                    "token": token,
+                    "file_url": file_url,
+                    "anchor_status": "pending"
+                }
+            else:
+                results[index] = {"index": index, "user_id": user_id, "error": "Filebase upload failed"}
+        issue_tokens(issued)
+    except Exception as e:
+        logger.error(f"Error in /encrypt_batch: {str(e)}")
+        logger.error(traceback.format_exc())
+        
+        log_access(
+            endpoint="/encrypt_batch", 
+            ip_address=ip_address, 
+            status="error", 
+            details=str(e)
+        )
+        
+        return jsonify({"error": str(e)}), 500
+
+    failed = len(records) - len(issued)
+    log_access(
+        endpoint="/encrypt_batch", 
+        ip_address=ip_address, 
+        status="success" if not failed else "partial", 
+        details=f"{len(issued)} of {len(records)} records enrolled"
+    )
+    
+    # 207 Multi-Status tells the caller to inspect the per-record results
+    return jsonify({
+        "succeeded": len(issued),
+        "failed": failed,
+        "results": results
+    }), 200 if not failed else 207
+
 @app.route("/validate_token", methods=["POST"])
 def validate():
     # Get client IP address
@@ -175,11 +370,264 @@ def validate():
         
         return jsonify({"error": str(e)}), 500
 
+@app.route("/validate_tokens", methods=["POST"])
+def validate_batch():
+    # Get client IP address
+    ip_address = request.remote_addr
+    
+    data = request.json
+    tokens = data.get("tokens") if isinstance(data, dict) else data
+
+    if not isinstance(tokens, list) or not tokens or not all(isinstance(token, str) and token for token in tokens):
+        log_access(
+            endpoint="/validate_tokens", 
+            ip_address=ip_address, 
+            status="failure", 
+            details="Tokens required"
+        )
+        return jsonify({"error": "A non-empty list of tokens is required"}), 400
+
+    if len(tokens) > VALIDATE_BATCH_MAX_TOKENS:
+        log_access(
+            endpoint="/validate_tokens", 
+            ip_address=ip_address, 
+            status="failure", 
+            details=f"Too many tokens ({len(tokens)})"
+        )
+        return jsonify({"error": f"At most {VALIDATE_BATCH_MAX_TOKENS} tokens per request"}), 400
+
+    try:
+        results = verify_tokens(tokens)
+        valid = sum(1 for is_valid in results.values() if is_valid)
+        
+        log_access(
+            endpoint="/validate_tokens", 
+            ip_address=ip_address, 
+            status="success", 
+            details=f"{valid} of {len(results)} distinct tokens valid"
+        )
+        
+        return jsonify({"results": results})
+    except Exception as e:
+        logger.error(f"Error in /validate_tokens: {str(e)}")
+        logger.error(traceback.format_exc())
+        
+        log_access(
+            endpoint="/validate_tokens", 
+            ip_address=ip_address, 
+            status="error", 
+            details=str(e)
+        )
+        
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/token_status", methods=["GET", "POST"])
+def token_status():
+    # Get client IP address
+    ip_address = request.remote_addr
+    
+    if request.method == "POST":
+        token = (request.json or {}).get("token")
+    else:
+        token = request.args.get("token")
+
+    if not token:
+        log_access(
+            endpoint="/token_status", 
+            ip_address=ip_address, 
+            status="failure", 
+            details="Token required"
+        )
+        return jsonify({"error": "Token required"}), 400
+
+    status = get_token_status(token)
+    if status is None:
+        log_access(
+            endpoint="/token_status", 
+            token=token, 
+            ip_address=ip_address, 
+            status="failure", 
+            details="Token not found"
+        )
+        return jsonify({"error": "Token not found"}), 404
+
+    log_access(
+        endpoint="/token_status", 
+        token=token, 
+        ip_address=ip_address, 
+        status="success", 
+        details=f"Anchor status {status['status']}"
+    )
+    
+    return jsonify({
+        "token": token,
+        "anchor_status": status["status"],
+        "tx_hash": status["tx_hash"],
+        "attempts": status["attempts"],
+        "last_error": status["last_error"],
+        "updated_at": status["updated_at"],
+        "merkle_root": status["root"],
+        "merkle_proof": status["proof"]
+    })
+
+def _find_stored_object(token, part):
+    """
+    Locate a token's record or document.
+    
+    Records are small and read repeatedly, so they are read whole through the
+    record cache; documents are only stat-ed here and streamed afterwards.
+    
+    Returns:
+        tuple: (key, stat, data) - data is the record contents, or None for a
+        document; (None, None, None) if nothing is stored
+    """
+    if part == "document":
+        key = f"{token}.document"
+        info = stat_in_filebase(key)
+        return (key, info, None) if info is not None else (None, None, None)
+    
+    for suffix in RECORD_SUFFIXES:
+        key = f"{token}{suffix}"
+        fetched = fetch_from_filebase(key)
+        if fetched is not None:
+            # Served as JSON whatever format the record is stored in
+            data = record_to_json(fetched[0])
+            return key, {"size": len(data), "etag": fetched[1]}, data
+    return None, None, None
+
+@app.route("/retrieve", methods=["GET"])
+def retrieve():
+    """
+    Stream a token's stored record (part=record, the default) or document (part=document).
+    
+    Supports Range requests (206 responses) and conditional GET with ETag and
+    If-None-Match (304 responses). The body is streamed in chunks, so memory use
+    does not depend on the object's size.
+    """
+    # Get client IP address
+    ip_address = request.remote_addr
+    start_time = time.time()
+    
+    token = request.args.get("token")
+    part = request.args.get("part", "record")
+
+    if not token:
+        log_access(
+            endpoint="/retrieve", 
+            ip_address=ip_address, 
+            status="failure", 
+            details="Token required"
+        )
+        return jsonify({"error": "Token required"}), 400
+
+    if part not in ("record", "document"):
+        return jsonify({"error": "part must be 'record' or 'document'"}), 400
+
+    if not verify_token(token):
+        log_access(
+            endpoint="/retrieve", 
+            token=token, 
+            ip_address=ip_address, 
+            status="invalid", 
+            details="Unauthorized retrieval attempt with invalid token"
+        )
+        return jsonify({"error": "Invalid or expired token"}), 401
+
+    try:
+        key, info, data = _find_stored_object(token, part)
+        if key is None:
+            log_access(
+                endpoint="/retrieve", 
+                token=token, 
+                ip_address=ip_address, 
+                status="failure", 
+                details=f"No stored {part}"
+            )
+            return jsonify({"error": f"No {part} stored for this token"}), 404
+
+        size, etag = info["size"], info["etag"]
+        headers = {"ETag": f'"{etag}"', "Accept-Ranges": "bytes"}
+
+        if request.if_none_match.contains(etag):
+            log_retrieval(key, token=token, status=304, total_time=time.time() - start_time)
+            return Response(status=304, headers=headers)
+
+        # A Range is honoured unless If-Range names a different version of the object
+        byte_range = request.range
+        if byte_range is not None and request.if_range.etag not in (None, etag):
+            byte_range = None
+
+        start, end, status = 0, size - 1, 200
+        if byte_range is not None:
+            bounds = byte_range.range_for_length(size)
+            if bounds is None:
+                log_retrieval(key, token=token, status=416, total_time=time.time() - start_time)
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status=416, headers=headers)
+            start, end, status = bounds[0], bounds[1] - 1, 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        if data is not None:
+            stream = io.BytesIO(data[start:end + 1])
+        else:
+            stream = open_from_filebase(key, start, end if status == 206 else None, info)
+        if stream is None:
+            return jsonify({"error": f"No {part} stored for this token"}), 404
+        first_byte_time = time.time() - start_time
+
+        def generate():
+            bytes_sent = 0
+            try:
+                for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b""):
+                    bytes_sent += len(chunk)
+                    yield chunk
+            finally:
+                stream.close()
+                log_retrieval(
+                    key, 
+                    token=token, 
+                    status=status, 
+                    byte_range=headers.get("Content-Range"), 
+                    bytes_sent=bytes_sent, 
+                    first_byte_time=first_byte_time, 
+                    total_time=time.time() - start_time
+                )
+
+        log_access(
+            endpoint="/retrieve", 
+            token=token, 
+            ip_address=ip_address, 
+            status="success", 
+            details=f"Streaming {key} ({status})"
+        )
+
+        headers["Content-Length"] = str(end - start + 1)
+        mimetype = "application/json" if part == "record" else "application/octet-stream"
+        return Response(generate(), status=status, headers=headers, mimetype=mimetype)
+    except Exception as e:
+        logger.error(f"Error in /retrieve: {str(e)}")
+        logger.error(traceback.format_exc())
+        
+        log_access(
+            endpoint="/retrieve", 
+            token=token, 
+            ip_address=ip_address, 
+            status="error", 
+            details=str(e)
+        )
+        
+        return jsonify({"error": str(e)}), 500
+
 # Health check endpoint
 @app.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy", "timestamp": time.time()})
 
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     logger.info("Starting PII Authenticator backend server")
     app.run(debug=True)
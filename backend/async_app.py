@@ -0,0 +1,768 @@
+"""
+Asyncio variant of the PII Authenticator backend, built on aiohttp.
+
+Serves /encrypt, /encrypt_batch, /validate_token, /validate_tokens, /token_status,
+/retrieve, /metrics and /health with the same request and response contracts as
+app.py, but waits on Filebase and Alchemy with async clients so one process can
+keep thousands of requests in flight.
+
+Usage:
+    python async_app.py [--host HOST] [--port PORT]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import traceback
+from aiohttp import web
+from dotenv import load_dotenv
+from token_auth import (
+    get_or_generate_token,
+    issue_token,
+    generate_tokens,
+    issue_tokens,
+    get_token_status,
+    resolve_token_locally,
+    record_verification,
+    start_background_services,
+)
+import async_w3_utils
+from storage_backend import STREAM_CHUNK_SIZE
+from record_format import encode_record, record_to_json
+from logger import get_logger, log_access, log_retrieval, begin_access, end_access
+import metrics
+import tracing
+
+# Load environment
+load_dotenv()
+
+# Get logger
+logger = get_logger()
+
+# Largest document accepted by /encrypt, as in app.py
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Largest number of records accepted by /encrypt_batch in one request, as in app.py
+ENCRYPT_BATCH_MAX_RECORDS = int(os.getenv("ENCRYPT_BATCH_MAX_RECORDS", "1000"))
+# Largest number of tokens accepted by /validate_tokens in one request, as in app.py
+VALIDATE_BATCH_MAX_TOKENS = int(os.getenv("VALIDATE_BATCH_MAX_TOKENS", "1000"))
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+@web.middleware
+async def request_middleware(request, handler):
+    """Request timing, CORS and the catch-all error handler, as in app.py."""
+    start_time = time.time()
+    request["request_id"] = os.urandom(8).hex()
+    begin_access(request["request_id"], request.method, request.path, request.remote)
+    start_background_services()
+
+    # The route pattern, so unknown paths cannot grow the metric label set
+    resource = request.match_info.route.resource
+    endpoint = resource.canonical if resource is not None else "unmatched"
+    metrics.request_started(endpoint)
+    tracing.start_trace(f"{request.method} {endpoint}", request["request_id"])
+    status = 500
+
+    try:
+        if request.method == "OPTIONS":
+            # CORS preflight
+            response = web.Response()
+        else:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                status = e.status
+                end_access(e.status)
+                raise
+            except Exception as e:
+                logger.error(f"Unhandled exception: {str(e)}")
+                logger.error(traceback.format_exc())
+                response = web.json_response({"error": "Internal server error"}, status=500)
+        status = response.status
+    finally:
+        metrics.request_finished(endpoint, request.method, status, time.time() - start_time)
+        tracing.end_trace(status)
+
+    elapsed_time = time.time() - start_time
+    response.headers.update(CORS_HEADERS)
+    response.headers["X-Processing-Time"] = str(elapsed_time)
+    logger.debug(f"Request {request['request_id']} processed in {elapsed_time:.4f} seconds")
+    end_access(response.status)
+    return response
+
+class _DocumentStream:
+    """
+    Async iterator over an uploaded document's chunks that stops at MAX_UPLOAD_BYTES.
+
+    The upload swallows the error raised on overflow, so too_large tells the
+    handler to answer 413 like app.py instead of reporting an upload failure.
+    """
+
+    def __init__(self, part):
+        self.part = part
+        self.size = 0
+        self.too_large = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self.part.read_chunk(STREAM_CHUNK_SIZE)
+        if not chunk:
+            raise StopAsyncIteration
+        self.size += len(chunk)
+        if self.size > MAX_UPLOAD_BYTES:
+            self.too_large = True
+            raise ValueError(f"Document exceeds {MAX_UPLOAD_BYTES} bytes")
+        return chunk
+
+def _too_large_response():
+    """The 413 response app.py gives for a request body over MAX_UPLOAD_BYTES."""
+    return web.json_response({"error": f"Request body exceeds {MAX_UPLOAD_BYTES} bytes"}, status=413)
+
+async def encrypt(request):
+    # Get client IP address
+    ip_address = request.remote
+
+    # Flask rejects bodies over MAX_CONTENT_LENGTH before the handler runs
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return _too_large_response()
+
+    document = None
+    if request.content_type == "multipart/form-data":
+        # The fields are read first; the "document" part, which must come after
+        # them, is left unread so it can be streamed straight to storage
+        data = {}
+        reader = await request.multipart()
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.name == "document" and part.filename:
+                document = part
+                break
+            data[part.name] = await part.text()
+    else:
+        data = await request.json()
+    user_id = data.get("user_id")
+
+    # Extract all PII fields
+    name = data.get("name")
+    email = data.get("email")
+    dob = data.get("dob")
+    phone = data.get("phone")
+    id_type = data.get("id_type")
+    id_number = data.get("id_number")
+
+    # Check for required fields
+    if not user_id or not id_number or not name:
+        log_access(
+            endpoint="/encrypt",
+            user_id=user_id,
+            ip_address=ip_address,
+            status="failure",
+            details="Missing required fields"
+        )
+        return web.json_response({"error": "Missing required fields (user_id, name, id_number)"}, status=400)
+
+    try:
+        # Token generation is local and cheap; the token is anchored by the background worker once the record is stored
+        with metrics.stage("token_generate"):
+            token = get_or_generate_token(user_id)
+
+        # Collect the PII record
+        pii_data = {
+            "name": name,
+            "email": email,
+            "dob": dob,
+            "phone": phone,
+            "id_type": id_type,
+            "id_number": id_number,
+            "user_id": user_id,
+            "timestamp": time.time()
+        }
+
+        if document is not None:
+            document_stream = _DocumentStream(document)
+            with metrics.stage("document_upload"):
+                try:
+                    document_url = await async_w3_utils.upload_stream_to_filebase(
+                        f"{token}.document", document_stream
+                    )
+                except ValueError:
+                    if not document_stream.too_large:
+                        raise
+                    document_url = None
+            if document_stream.too_large:
+                log_access(
+                    endpoint="/encrypt",
+                    user_id=user_id,
+                    token=token,
+                    ip_address=ip_address,
+                    status="failure",
+                    details="Document too large"
+                )
+                return _too_large_response()
+            if not document_url:
+                log_access(
+                    endpoint="/encrypt",
+                    user_id=user_id,
+                    token=token,
+                    ip_address=ip_address,
+                    status="failure",
+                    details="Document upload failed"
+                )
+                return web.json_response({"error": "Document upload failed"}, status=500)
+            pii_data["document"] = {
+                "file_url": document_url,
+                "file_name": document.filename,
+                "content_type": document.headers.get("Content-Type")
+            }
+
+        # Serialize in the compact record format (see record_format.py)
+        with metrics.stage("record_encode"):
+            record_bytes = encode_record(pii_data)
+
+        # Upload to filebase
+        with metrics.stage("record_upload"):
+            file_url = await async_w3_utils.upload_to_filebase(f"{token}.json", record_bytes)
+
+        if not file_url:
+            log_access(
+                endpoint="/encrypt",
+                user_id=user_id,
+                token=token,
+                ip_address=ip_address,
+                status="failure",
+                details="Filebase upload failed"
+            )
+            return web.json_response({"error": "Filebase upload failed"}, status=500)
+
+        # Anchor the token only now that its record is stored; the queue is SQLite, so off the event loop
+        await asyncio.to_thread(issue_token, token, user_id)
+
+        # Log successful token generation
+        log_access(
+            endpoint="/encrypt",
+            user_id=user_id,
+            token=token,
+            ip_address=ip_address,
+            status="success",
+            details=f"Token generated and data stored at {file_url}"
+        )
+
+        response = {
+            "token": token,
+            "file_url": file_url,
+            "anchor_status": "pending"
+        }
+        if "document" in pii_data:
+            response["document_url"] = pii_data["document"]["file_url"]
+
+        return web.json_response(response)
+    except Exception as e:
+        logger.error(f"Error in /encrypt: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        log_access(
+            endpoint="/encrypt",
+            user_id=user_id,
+            ip_address=ip_address,
+            status="error",
+            details=str(e)
+        )
+
+        return web.json_response({"error": str(e)}, status=500)
+
+async def encrypt_batch(request):
+    # Get client IP address
+    ip_address = request.remote
+
+    data = await request.json()
+    records = data.get("records") if isinstance(data, dict) else data
+
+    if not isinstance(records, list) or not records:
+        log_access(
+            endpoint="/encrypt_batch",
+            ip_address=ip_address,
+            status="failure",
+            details="No records provided"
+        )
+        return web.json_response({"error": "A non-empty list of records is required"}, status=400)
+
+    if len(records) > ENCRYPT_BATCH_MAX_RECORDS:
+        log_access(
+            endpoint="/encrypt_batch",
+            ip_address=ip_address,
+            status="failure",
+            details=f"Too many records ({len(records)})"
+        )
+        return web.json_response({"error": f"At most {ENCRYPT_BATCH_MAX_RECORDS} records per batch"}, status=400)
+
+    # Validate every record before doing any work
+    results = [None] * len(records)
+    valid_indexes = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or not record.get("user_id") or not record.get("id_number") or not record.get("name"):
+            results[index] = {
+                "index": index,
+                "user_id": record.get("user_id") if isinstance(record, dict) else None,
+                "error": "Missing required fields (user_id, name, id_number)"
+            }
+        else:
+            valid_indexes.append(index)
+
+    try:
+        tokens = generate_tokens(len(valid_indexes))
+        timestamp = time.time()
+        files = {}
+        for index, token in zip(valid_indexes, tokens):
+            record = records[index]
+            pii_data = {
+                "name": record.get("name"),
+                "email": record.get("email"),
+                "dob": record.get("dob"),
+                "phone": record.get("phone"),
+                "id_type": record.get("id_type"),
+                "id_number": record.get("id_number"),
+                "user_id": record.get("user_id"),
+                "timestamp": timestamp
+            }
+            files[f"{token}.json"] = encode_record(pii_data)
+
+        # Upload concurrently, then anchor only the tokens whose records were stored
+        file_urls = await async_w3_utils.upload_batch_to_filebase(files)
+        issued = []
+        for index, token in zip(valid_indexes, tokens):
+            file_url = file_urls.get(f"{token}.json")
+            user_id = records[index].get("user_id")
+            if file_url:
+                issued.append(token)
+                results[index] = {
+                    "index": index,
+                    "user_id": user_id,
+                    "token": token,
+                    "file_url": file_url,
+                    "anchor_status": "pending"
+                }
+            else:
+                results[index] = {"index": index, "user_id": user_id, "error": "Filebase upload failed"}
+        await asyncio.to_thread(issue_tokens, issued)
+    except Exception as e:
+        logger.error(f"Error in /encrypt_batch: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        log_access(
+            endpoint="/encrypt_batch",
+            ip_address=ip_address,
+            status="error",
+            details=str(e)
+        )
+
+        return web.json_response({"error": str(e)}, status=500)
+
+    failed = len(records) - len(issued)
+    log_access(
+        endpoint="/encrypt_batch",
+        ip_address=ip_address,
+        status="success" if not failed else "partial",
+        details=f"{len(issued)} of {len(records)} records enrolled"
+    )
+
+    # 207 Multi-Status tells the caller to inspect the per-record results
+    return web.json_response({
+        "succeeded": len(issued),
+        "failed": failed,
+        "results": results
+    }, status=200 if not failed else 207)
+
+async def validate(request):
+    # Get client IP address
+    ip_address = request.remote
+
+    data = await request.json()
+    token = data.get("token")
+
+    if not token:
+        log_access(
+            endpoint="/validate_token",
+            ip_address=ip_address,
+            status="failure",
+            details="Token required"
+        )
+        return web.json_response({"error": "Token required"}, status=400)
+
+    try:
+        # Same local checks as token_auth.verify_token, then the async remote lookup.
+        # They read SQLite (anchor queue, chain index), so they run off the event loop.
+        with metrics.stage("local_resolve"):
+            valid, proof, root = await asyncio.to_thread(resolve_token_locally, token)
+        if valid is None:
+            with metrics.stage("remote_verify"):
+                valid = await async_w3_utils.verify_token_on_blockchain(token, proof, root)
+            record_verification(token, valid)
+
+        # Log token validation attempt
+        log_access(
+            endpoint="/validate_token",
+            token=token,
+            ip_address=ip_address,
+            status="success" if valid else "invalid",
+            details=f"Token validation {'successful' if valid else 'failed'}"
+        )
+
+        return web.json_response({"valid": valid})
+    except Exception as e:
+        logger.error(f"Error in /validate_token: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        log_access(
+            endpoint="/validate_token",
+            token=token,
+            ip_address=ip_address,
+            status="error",
+            details=str(e)
+        )
+
+        return web.json_response({"error": str(e)}, status=500)
+
+async def _verify_tokens(tokens):
+    """Verify a list of tokens with the same answers as token_auth.verify_tokens, using async remote lookups."""
+    unique_tokens = list(dict.fromkeys(tokens))
+    logger.info("Verifying %d distinct tokens (%d requested)", len(unique_tokens), len(tokens))
+
+    # The local checks read SQLite, so the whole batch resolves in one thread hop
+    resolved = await asyncio.to_thread(lambda: [resolve_token_locally(token) for token in unique_tokens])
+
+    results = {}
+    remote = []
+    for token, (is_valid, proof, root) in zip(unique_tokens, resolved):
+        if is_valid is not None:
+            results[token] = is_valid
+        elif proof is not None:
+            # Proof checks are local apart from a cached root lookup
+            results[token] = await async_w3_utils.verify_token_on_blockchain(token, proof, root)
+            record_verification(token, results[token])
+        else:
+            remote.append(token)
+
+    if remote:
+        for token, is_valid in (await async_w3_utils.verify_tokens_on_blockchain(remote)).items():
+            results[token] = is_valid
+            record_verification(token, is_valid)
+
+    return results
+
+async def validate_batch(request):
+    # Get client IP address
+    ip_address = request.remote
+
+    data = await request.json()
+    tokens = data.get("tokens") if isinstance(data, dict) else data
+
+    if not isinstance(tokens, list) or not tokens or not all(isinstance(token, str) and token for token in tokens):
+        log_access(
+            endpoint="/validate_tokens",
+            ip_address=ip_address,
+            status="failure",
+            details="Tokens required"
+        )
+        return web.json_response({"error": "A non-empty list of tokens is required"}, status=400)
+
+    if len(tokens) > VALIDATE_BATCH_MAX_TOKENS:
+        log_access(
+            endpoint="/validate_tokens",
+            ip_address=ip_address,
+            status="failure",
+            details=f"Too many tokens ({len(tokens)})"
+        )
+        return web.json_response({"error": f"At most {VALIDATE_BATCH_MAX_TOKENS} tokens per request"}, status=400)
+
+    try:
+        results = await _verify_tokens(tokens)
+        valid = sum(1 for is_valid in results.values() if is_valid)
+
+        log_access(
+            endpoint="/validate_tokens",
+            ip_address=ip_address,
+            status="success",
+            details=f"{valid} of {len(results)} distinct tokens valid"
+        )
+
+        return web.json_response({"results": results})
+    except Exception as e:
+        logger.error(f"Error in /validate_tokens: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        log_access(
+            endpoint="/validate_tokens",
+            ip_address=ip_address,
+            status="error",
+            details=str(e)
+        )
+
+        return web.json_response({"error": str(e)}, status=500)
+
+async def token_status(request):
+    # Get client IP address
+    ip_address = request.remote
+
+    if request.method == "POST":
+        token = (await request.json() or {}).get("token")
+    else:
+        token = request.query.get("token")
+
+    if not token:
+        log_access(
+            endpoint="/token_status",
+            ip_address=ip_address,
+            status="failure",
+            details="Token required"
+        )
+        return web.json_response({"error": "Token required"}, status=400)
+
+    status = await asyncio.to_thread(get_token_status, token)
+    if status is None:
+        log_access(
+            endpoint="/token_status",
+            token=token,
+            ip_address=ip_address,
+            status="failure",
+            details="Token not found"
+        )
+        return web.json_response({"error": "Token not found"}, status=404)
+
+    log_access(
+        endpoint="/token_status",
+        token=token,
+        ip_address=ip_address,
+        status="success",
+        details=f"Anchor status {status['status']}"
+    )
+
+    return web.json_response({
+        "token": token,
+        "anchor_status": status["status"],
+        "tx_hash": status["tx_hash"],
+        "attempts": status["attempts"],
+        "last_error": status["last_error"],
+        "updated_at": status["updated_at"],
+        "merkle_root": status["root"],
+        "merkle_proof": status["proof"]
+    })
+
+async def _find_stored_object(token, part):
+    """Return (key, stat, data) for a token's record or document, as in app.py."""
+    if part == "document":
+        key = f"{token}.document"
+        info = await async_w3_utils.stat_in_filebase(key)
+        return (key, info, None) if info is not None else (None, None, None)
+
+    for suffix in async_w3_utils.RECORD_SUFFIXES:
+        key = f"{token}{suffix}"
+        fetched = await async_w3_utils.fetch_from_filebase(key)
+        if fetched is not None:
+            # Served as JSON whatever format the record is stored in
+            data = record_to_json(fetched[0])
+            return key, {"size": len(data), "etag": fetched[1]}, data
+    return None, None, None
+
+async def _iter_bytes(data):
+    """Yield in-memory bytes in STREAM_CHUNK_SIZE chunks."""
+    for offset in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[offset:offset + STREAM_CHUNK_SIZE]
+
+def _range_for_length(request, size):
+    """
+    Resolve the request's Range header against an object size.
+
+    Returns:
+        tuple: (start, end) inclusive, None if there is no Range header, or
+        False if the range cannot be satisfied
+    """
+    try:
+        byte_range = request.http_range
+    except ValueError:
+        # Malformed Range headers are ignored, as Flask does
+        return None
+    if byte_range.start is None and byte_range.stop is None:
+        return None
+    if byte_range.start is not None and byte_range.start < 0:
+        # Suffix range: the last N bytes
+        return (max(size + byte_range.start, 0), size - 1) if size else False
+    start = byte_range.start or 0
+    end = size - 1 if byte_range.stop is None else min(byte_range.stop - 1, size - 1)
+    return (start, end) if start <= end else False
+
+async def retrieve(request):
+    """
+    Stream a token's stored record or document, with Range and ETag support as in app.py.
+    """
+    # Get client IP address
+    ip_address = request.remote
+    start_time = time.time()
+
+    token = request.query.get("token")
+    part = request.query.get("part", "record")
+
+    if not token:
+        log_access(
+            endpoint="/retrieve",
+            ip_address=ip_address,
+            status="failure",
+            details="Token required"
+        )
+        return web.json_response({"error": "Token required"}, status=400)
+
+    if part not in ("record", "document"):
+        return web.json_response({"error": "part must be 'record' or 'document'"}, status=400)
+
+    valid, proof, root = await asyncio.to_thread(resolve_token_locally, token)
+    if valid is None:
+        valid = await async_w3_utils.verify_token_on_blockchain(token, proof, root)
+        record_verification(token, valid)
+    if not valid:
+        log_access(
+            endpoint="/retrieve",
+            token=token,
+            ip_address=ip_address,
+            status="invalid",
+            details="Unauthorized retrieval attempt with invalid token"
+        )
+        return web.json_response({"error": "Invalid or expired token"}, status=401)
+
+    try:
+        key, info, data = await _find_stored_object(token, part)
+        if key is None:
+            log_access(
+                endpoint="/retrieve",
+                token=token,
+                ip_address=ip_address,
+                status="failure",
+                details=f"No stored {part}"
+            )
+            return web.json_response({"error": f"No {part} stored for this token"}, status=404)
+
+        size, etag = info["size"], info["etag"]
+        headers = {"ETag": f'"{etag}"', "Accept-Ranges": "bytes"}
+
+        if any(tag.value in (etag, "*") for tag in request.if_none_match or ()):
+            log_retrieval(key, token=token, status=304, total_time=time.time() - start_time)
+            return web.Response(status=304, headers=headers)
+
+        # A Range is honoured unless If-Range names a different version of the object
+        bounds = _range_for_length(request, size)
+        if_range = request.headers.get("If-Range")
+        if bounds is not None and if_range and if_range.startswith('"') and if_range != headers["ETag"]:
+            bounds = None
+
+        start, end, status = 0, size - 1, 200
+        if bounds is False:
+            log_retrieval(key, token=token, status=416, total_time=time.time() - start_time)
+            headers["Content-Range"] = f"bytes */{size}"
+            return web.Response(status=416, headers=headers)
+        if bounds is not None:
+            (start, end), status = bounds, 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        if data is not None:
+            chunks = _iter_bytes(data[start:end + 1])
+        else:
+            chunks = await async_w3_utils.open_from_filebase(key, start, end if status == 206 else None, info)
+        if chunks is None:
+            return web.json_response({"error": f"No {part} stored for this token"}, status=404)
+        first_byte_time = time.time() - start_time
+
+        log_access(
+            endpoint="/retrieve",
+            token=token,
+            ip_address=ip_address,
+            status="success",
+            details=f"Streaming {key} ({status})"
+        )
+
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Type"] = "application/json" if part == "record" else "application/octet-stream"
+        response = web.StreamResponse(status=status, headers=headers)
+        bytes_sent = 0
+        try:
+            await response.prepare(request)
+            async for chunk in chunks:
+                await response.write(chunk)
+                bytes_sent += len(chunk)
+            await response.write_eof()
+        finally:
+            await chunks.aclose()
+            log_retrieval(
+                key,
+                token=token,
+                status=status,
+                byte_range=headers.get("Content-Range"),
+                bytes_sent=bytes_sent,
+                first_byte_time=first_byte_time,
+                total_time=time.time() - start_time
+            )
+        return response
+    except (ConnectionResetError, asyncio.CancelledError):
+        # The client went away mid-stream; the retrieval log already has the partial transfer
+        raise
+    except Exception as e:
+        logger.error(f"Error in /retrieve: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        log_access(
+            endpoint="/retrieve",
+            token=token,
+            ip_address=ip_address,
+            status="error",
+            details=str(e)
+        )
+
+        return web.json_response({"error": str(e)}, status=500)
+
+# Health check endpoint
+async def health_check(request):
+    return web.json_response({"status": "healthy", "timestamp": time.time()})
+
+async def on_startup(app):
+    await async_w3_utils.init()
+
+async def on_cleanup(app):
+    await async_w3_utils.close()
+
+# Prometheus scrape endpoint
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render_metrics().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+def create_app():
+    """Build the aiohttp application."""
+    metrics.register_default_collectors()
+    app = web.Application(middlewares=[request_middleware])
+    app.router.add_post("/encrypt", encrypt)
+    app.router.add_post("/encrypt_batch", encrypt_batch)
+    app.router.add_post("/validate_token", validate)
+    app.router.add_post("/validate_tokens", validate_batch)
+    app.router.add_get("/token_status", token_status)
+    app.router.add_post("/token_status", token_status)
+    app.router.add_get("/retrieve", retrieve)
+    app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metrics_endpoint)
+    # Preflight requests are answered by the middleware
+    app.router.add_route("OPTIONS", "/{tail:.*}", health_check)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the asyncio PII Authenticator backend")
+    parser.add_argument("--host", help="Interface to bind (default: 127.0.0.1)", default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on (default: 5000)", type=int, default=5000)
+    args = parser.parse_args()
+
+    logger.info("Starting PII Authenticator async backend server")
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,46 @@
+"""
+Encryption Benchmark for PII Authenticator Backend
+
+Measures the per-record cost of the envelope encryption used by /encrypt
+(encrypt.py): sealing records one at a time and in bulk, opening them, and the
+whole storage pipeline a record goes through before upload (serialization,
+compression and encryption).
+
+Usage:
+    python benchmark_encryption.py [--count N] [--with-document]
+"""
+
+import argparse
+from encrypt import encrypt_record, encrypt_records, decrypt_record
+from record_format import encode_record
+from w3_utils import encode_for_storage, encode_batch_for_storage
+from benchmark_records import make_record, time_per_item
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark envelope encryption of PII records")
+    parser.add_argument("--count", type=int, default=10000, help="Number of records (default: 10000)")
+    parser.add_argument("--with-document", action="store_true", help="Include document metadata in each record")
+    args = parser.parse_args()
+
+    records = dict(make_record(args.with_document) for _ in range(args.count))
+    items = [(encode_record(record), f"{token}.json".encode()) for token, record in records.items()]
+    sealed = [encrypt_record(plaintext, associated_data) for plaintext, associated_data in items]
+    files = {associated_data.decode(): plaintext for plaintext, associated_data in items}
+
+    timings = {
+        "encrypt (one record)": time_per_item(lambda item: encrypt_record(*item), items),
+        "encrypt (bulk)": time_per_item(lambda batch: encrypt_records(batch), [items]) / len(items),
+        "decrypt": time_per_item(lambda pair: decrypt_record(pair[0], pair[1][1]), list(zip(sealed, items))),
+        "pipeline (one record)": time_per_item(
+            lambda pair: encode_for_storage(pair[0], encode_record(pair[1])),
+            [(f"{token}.json", record) for token, record in records.items()]
+        ),
+        "pipeline (bulk)": time_per_item(lambda batch: encode_batch_for_storage(batch), [files]) / len(files),
+    }
+
+    print(f"{args.count} records, {sum(len(p) for p, _ in items) / len(items):.1f} bytes on average\n")
+    for name, micros in timings.items():
+        print(f"{name:<24}{micros:>10.2f} µs/record")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Record Format Benchmark for PII Authenticator Backend
+
+Compares the legacy indented JSON records with the compact record format
+(record_format.py): stored bytes, serialization and parse time, and the time
+to write the records to a storage backend.
+
+Usage:
+    python benchmark_records.py [--count N] [--backend local|memory] [--with-document]
+"""
+
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+from storage_backend import LocalDirectoryBackend, MemoryBackend
+from record_format import encode_record, decode_record
+
+def make_record(with_document=False):
+    """Build a record shaped like the ones /encrypt stores."""
+    token = "".join(random.choices(string.ascii_uppercase + string.digits, k=10))
+    record = {
+        "name": random.choice(["Alice Johnson", "Bob Smith", "Carol Díaz", "Dmitri Ivanov"]),
+        "email": f"user{random.randint(1, 10**6)}@example.com",
+        "dob": f"19{random.randint(50, 99)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+        "phone": f"+1-555-{random.randint(1000000, 9999999)}",
+        "id_type": random.choice(["passport", "drivers_license", "national_id"]),
+        "id_number": f"ID{random.randint(10**8, 10**9)}",
+        "user_id": f"user_{random.randint(1, 10**6)}",
+        "timestamp": time.time(),
+    }
+    if with_document:
+        record["document"] = {
+            "file_url": f"https://s3.filebase.com/pii-authenticator/{token}.document",
+            "file_name": "id_scan.png",
+            "content_type": "image/png",
+        }
+    return token, record
+
+def time_per_item(function, items, rounds=5):
+    """Run function over items and return the best mean time per item in microseconds."""
+    best = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e6
+
+def time_uploads(backend_name, files, rounds=3):
+    """Write every file to a fresh backend and return the best total time in seconds."""
+    best = None
+    for _ in range(rounds):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = LocalDirectoryBackend(directory) if backend_name == "local" else MemoryBackend()
+            start_time = time.perf_counter()
+            for key, data in files.items():
+                backend.put(key, data)
+            elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stored PII record formats")
+    parser.add_argument("--count", type=int, default=10000, help="Number of records (default: 10000)")
+    parser.add_argument("--backend", choices=["local", "memory"], default="local", help="Storage backend for the upload timing")
+    parser.add_argument("--with-document", action="store_true", help="Include document metadata in each record")
+    args = parser.parse_args()
+
+    records = dict(make_record(args.with_document) for _ in range(args.count))
+    formats = {
+        "json (indent=2)": (lambda record: json.dumps(record, indent=2).encode(), json.loads),
+        "compact v1": (encode_record, decode_record),
+    }
+
+    print(f"{args.count} records, {args.backend} storage\n")
+    print(f"{'format':<18}{'avg bytes':>10}{'total KB':>10}{'encode µs':>11}{'parse µs':>10}{'upload s':>10}")
+
+    for name, (encode, decode) in formats.items():
+        encoded = {f"{token}.json": encode(record) for token, record in records.items()}
+        sizes = [len(data) for data in encoded.values()]
+
+        encode_time = time_per_item(encode, list(records.values()))
+        parse_time = time_per_item(decode, list(encoded.values()))
+
+        upload_time = time_uploads(args.backend, encoded)
+
+        print(
+            f"{name:<18}{sum(sizes) / len(sizes):>10.1f}{sum(sizes) / 1024:>10.1f}"
+            f"{encode_time:>11.2f}{parse_time:>10.2f}{upload_time:>10.3f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Bloom filter module for the PII Authenticator application.
+A compact probabilistic set: membership tests can return false positives but
+never false negatives, so a miss proves a token was never issued.
+"""
+
+import os
+import math
+import struct
+import hashlib
+import threading
+
+# Snapshot header: magic, version, bit count, hash count, item count
+_SNAPSHOT_MAGIC = b"PIIBF"
+_SNAPSHOT_HEADER = struct.Struct(">5sBQIQ")
+_SNAPSHOT_VERSION = 1
+
+class BloomFilter:
+    """Thread-safe Bloom filter using double hashing over a single BLAKE2b digest."""
+
+    def __init__(self, capacity=1000000, error_rate=0.001, num_bits=None, num_hashes=None):
+        """
+        Args:
+            capacity (int): Expected number of items
+            error_rate (float): Target false positive rate at capacity
+            num_bits (int, optional): Explicit bit count, overriding capacity/error_rate
+            num_hashes (int, optional): Explicit hash count, overriding capacity/error_rate
+        """
+        if num_bits is None:
+            num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        if num_hashes is None:
+            num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = 0
+        self._bits = bytearray((num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        """Add an item to the filter."""
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        positions = self._positions(item)
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+
+    def estimated_false_positive_rate(self):
+        """Estimate the current false positive rate from the number of items added."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path):
+        """
+        Write the filter to a snapshot file atomically.
+
+        Args:
+            path (str): The snapshot file path
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            header = _SNAPSHOT_HEADER.pack(
+                _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, self.num_bits, self.num_hashes, self.count
+            )
+            bits = bytes(self._bits)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a filter from a snapshot file written by save().
+
+        Args:
+            path (str): The snapshot file path
+
+        Returns:
+            BloomFilter: The restored filter
+        """
+        with open(path, "rb") as f:
+            header = f.read(_SNAPSHOT_HEADER.size)
+            magic, version, num_bits, num_hashes, count = _SNAPSHOT_HEADER.unpack(header)
+            if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported Bloom filter snapshot: {path}")
+            bits = f.read()
+
+        bloom = cls(num_bits=num_bits, num_hashes=num_hashes)
+        if len(bits) != len(bloom._bits):
+            raise ValueError(f"Truncated Bloom filter snapshot: {path}")
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        return bloom
@@ -0,0 +1,321 @@
+"""
+Chain indexer module for the PII Authenticator application.
+Follows TokenStored events emitted by the TokenAuth contract and keeps the stored
+token hashes in a local SQLite index, so token verification can be answered with
+a local key lookup instead of an S3 listing or a contract call.
+
+The indexer reads the chain with block-range eth_getLogs pages, checkpoints the
+last indexed block together with its hash, and rewinds past any reorganised
+blocks.
+
+A hit is always trusted. A miss is only trusted with CHAIN_INDEX_TRUST_MISSES,
+because the index cannot see tokens stored before CHAIN_INDEXER_START_BLOCK, on a
+contract compiled without the TokenStored event, or by another host since the
+last poll; even then only while the index has recently caught up with the chain
+head. Otherwise a miss is reported as unknown and the caller checks remotely.
+
+If CHAIN_INDEXER_ENABLED is set but the indexer cannot run (no TokenStored event
+in the loaded ABI, dev mode or no contract), start() logs a warning saying why.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import traceback
+from web3 import Web3
+from w3_utils import web3, contract, contract_abi, BLOCKCHAIN_DEV_MODE, CHAIN_CALL_TIMEOUT
+from io_executor import run_with_deadline
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+CHAIN_INDEXER_ENABLED = os.getenv("CHAIN_INDEXER_ENABLED", "false").lower() == "true"
+# Report missing tokens as definitely not stored. Only safe when every token was
+# anchored through this contract, deployed at CHAIN_INDEXER_START_BLOCK with the
+# TokenStored event, and no other host anchors tokens.
+CHAIN_INDEX_TRUST_MISSES = os.getenv("CHAIN_INDEX_TRUST_MISSES", "false").lower() == "true"
+CHAIN_INDEX_PATH = os.getenv("CHAIN_INDEX_PATH", os.path.join("storage", "token_index.db"))
+# Block the contract was deployed in; nothing before it needs scanning
+CHAIN_INDEXER_START_BLOCK = int(os.getenv("CHAIN_INDEXER_START_BLOCK", "0"))
+CHAIN_INDEXER_PAGE_SIZE = int(os.getenv("CHAIN_INDEXER_PAGE_SIZE", "2000"))
+CHAIN_INDEXER_POLL_INTERVAL = float(os.getenv("CHAIN_INDEXER_POLL_INTERVAL", "12"))
+# How many recent checkpoints (block number and hash) are kept to find the fork point after a reorg
+CHAIN_INDEXER_REORG_DEPTH = int(os.getenv("CHAIN_INDEXER_REORG_DEPTH", "64"))
+# A missing token is only reported as absent if the index reached the head this recently
+CHAIN_INDEX_MAX_LAG = float(os.getenv("CHAIN_INDEX_MAX_LAG", "60"))
+
+TOKEN_STORED_TOPIC = Web3.keccak(text="TokenStored(bytes32)")
+
+# Contracts compiled before the event was added never emit it, so there is nothing to index
+EMITS_TOKEN_STORED = any(
+    item.get("type") == "event" and item.get("name") == "TokenStored" for item in contract_abi
+)
+
+_db_lock = threading.Lock()
+_db = None
+
+_thread = None
+_start_lock = threading.Lock()
+_stop_event = threading.Event()
+
+# Freshness watermark: the chain head and when the index last caught up with it
+_head_block = None
+_synced_at = 0.0
+
+def _get_db():
+    """Open the index database on first use and make sure the schema exists."""
+    global _db
+    if _db is None:
+        directory = os.path.dirname(CHAIN_INDEX_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _db = sqlite3.connect(CHAIN_INDEX_PATH, check_same_thread=False, isolation_level=None)
+        _db.row_factory = sqlite3.Row
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=NORMAL")
+        _db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tokens (
+                token_hash BLOB PRIMARY KEY,
+                block_number INTEGER NOT NULL,
+                tx_hash TEXT NOT NULL,
+                log_index INTEGER NOT NULL
+            )
+            """
+        )
+        _db.execute("CREATE INDEX IF NOT EXISTS idx_tokens_block ON tokens (block_number)")
+        # One row per checkpoint; the newest is where indexing resumes
+        _db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                block_number INTEGER PRIMARY KEY,
+                block_hash BLOB NOT NULL
+            )
+            """
+        )
+        logger.info(f"✅ Chain index opened at {CHAIN_INDEX_PATH}")
+    return _db
+
+def _token_hash(token):
+    """The key the contract stores a token under: keccak256(abi.encodePacked(token))."""
+    return bytes(Web3.keccak(text=token))
+
+def _get_checkpoint():
+    """Return (block_number, block_hash) of the newest checkpoint, or None."""
+    with _db_lock:
+        row = _get_db().execute(
+            "SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC LIMIT 1"
+        ).fetchone()
+    return (row["block_number"], bytes(row["block_hash"])) if row else None
+
+def _get_block_hash(block_number):
+    block = run_with_deadline("eth.get_block", CHAIN_CALL_TIMEOUT, web3.eth.get_block, block_number)
+    return bytes(block["hash"])
+
+def _get_logs(from_block, to_block):
+    return run_with_deadline(
+        "eth.get_logs", CHAIN_CALL_TIMEOUT, web3.eth.get_logs,
+        {
+            "address": contract.address,
+            "topics": [TOKEN_STORED_TOPIC],
+            "fromBlock": from_block,
+            "toBlock": to_block,
+        }
+    )
+
+def _rewind():
+    """
+    Undo indexed blocks that are no longer on the canonical chain.
+
+    Walks back through the stored checkpoints until one still matches the chain,
+    then drops every token indexed after it.
+    """
+    with _db_lock:
+        checkpoints = _get_db().execute(
+            "SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC"
+        ).fetchall()
+
+    fork_point = CHAIN_INDEXER_START_BLOCK - 1
+    for checkpoint in checkpoints:
+        if _get_block_hash(checkpoint["block_number"]) == bytes(checkpoint["block_hash"]):
+            fork_point = checkpoint["block_number"]
+            break
+
+    with _db_lock:
+        db = _get_db()
+        db.execute("BEGIN")
+        removed = db.execute("DELETE FROM tokens WHERE block_number > ?", (fork_point,)).rowcount
+        db.execute("DELETE FROM checkpoints WHERE block_number > ?", (fork_point,))
+        db.execute("COMMIT")
+    logger.warning(f"⚠️ Chain reorganisation detected, index rewound to block {fork_point} ({removed} token(s) removed)")
+
+def _store_page(logs, to_block, to_block_hash):
+    """Write one page of events and its checkpoint in a single transaction."""
+    with _db_lock:
+        db = _get_db()
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT OR IGNORE INTO tokens (token_hash, block_number, tx_hash, log_index) VALUES (?, ?, ?, ?)",
+            [
+                (bytes(log["topics"][1]), log["blockNumber"], Web3.to_hex(log["transactionHash"]), log["logIndex"])
+                for log in logs
+            ]
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO checkpoints (block_number, block_hash) VALUES (?, ?)",
+            (to_block, to_block_hash)
+        )
+        db.execute(
+            "DELETE FROM checkpoints WHERE block_number NOT IN "
+            "(SELECT block_number FROM checkpoints ORDER BY block_number DESC LIMIT ?)",
+            (CHAIN_INDEXER_REORG_DEPTH,)
+        )
+        db.execute("COMMIT")
+
+def sync_once():
+    """
+    Index every block between the checkpoint and the current chain head.
+
+    Returns:
+        int: The number of TokenStored events indexed
+    """
+    global _head_block, _synced_at
+    head = run_with_deadline("eth.block_number", CHAIN_CALL_TIMEOUT, lambda: web3.eth.block_number)
+    _head_block = head
+
+    checkpoint = _get_checkpoint()
+    if checkpoint is not None and checkpoint[0] <= head and _get_block_hash(checkpoint[0]) != checkpoint[1]:
+        _rewind()
+        checkpoint = _get_checkpoint()
+
+    from_block = checkpoint[0] + 1 if checkpoint else CHAIN_INDEXER_START_BLOCK
+    page_size = CHAIN_INDEXER_PAGE_SIZE
+    indexed = 0
+
+    while from_block <= head and not _stop_event.is_set():
+        to_block = min(from_block + page_size - 1, head)
+        try:
+            logs = _get_logs(from_block, to_block)
+        except Exception as e:
+            if page_size == 1:
+                raise
+            # Providers cap the block range or result count per call; use smaller pages for the rest of this pass
+            page_size = max(page_size // 2, 1)
+            logger.warning(f"⚠️ eth_getLogs for blocks {from_block}-{to_block} failed, retrying with {page_size} block pages: {e}")
+            continue
+
+        _store_page(logs, to_block, _get_block_hash(to_block))
+        indexed += len(logs)
+        from_block = to_block + 1
+
+    if from_block > head:
+        _synced_at = time.time()
+    if indexed:
+        logger.info(f"✅ Indexed {indexed} TokenStored event(s) up to block {head}")
+    return indexed
+
+def _run():
+    """Keep the index following the chain until stop() is called."""
+    logger.info("Chain indexer started")
+    while not _stop_event.is_set():
+        try:
+            sync_once()
+        except Exception as e:
+            logger.error(f"❌ Chain indexer iteration failed: {e}")
+            logger.debug(traceback.format_exc())
+        _stop_event.wait(CHAIN_INDEXER_POLL_INTERVAL)
+    logger.info("Chain indexer stopped")
+
+def _unavailable_reason():
+    """Why an enabled indexer cannot run, or None if it can."""
+    if not EMITS_TOKEN_STORED:
+        return "the loaded contract ABI has no TokenStored event to follow; recompile the contract"
+    if BLOCKCHAIN_DEV_MODE:
+        return "BLOCKCHAIN_DEV_MODE is on"
+    if contract is None:
+        return "no contract is configured"
+    return None
+
+def is_enabled():
+    """Whether the index can be used: enabled, connected to a real chain and the contract emits TokenStored."""
+    return CHAIN_INDEXER_ENABLED and _unavailable_reason() is None
+
+def start():
+    """Start the background indexer if it is enabled and not already running."""
+    global _thread
+    if not CHAIN_INDEXER_ENABLED or _thread is not None:
+        return
+    reason = _unavailable_reason()
+    if reason is not None:
+        logger.warning(f"⚠️ CHAIN_INDEXER_ENABLED is set but the chain indexer cannot run: {reason}")
+        return
+
+    with _start_lock:
+        if _thread is not None:
+            return
+        _stop_event.clear()
+        _thread = threading.Thread(target=_run, name="chain-indexer", daemon=True)
+        _thread.start()
+
+def stop(timeout=5):
+    """Stop the background indexer and wait for it to exit."""
+    global _thread
+    _stop_event.set()
+    if _thread is not None:
+        _thread.join(timeout)
+        _thread = None
+
+def is_fresh():
+    """Whether the index caught up with the chain head within CHAIN_INDEX_MAX_LAG seconds."""
+    return time.time() - _synced_at <= CHAIN_INDEX_MAX_LAG
+
+def lookup(token):
+    """
+    Look up a token in the local index.
+
+    Args:
+        token (str): The token to look up
+
+    Returns:
+        bool: True if the token was stored on-chain, False if it was not, misses
+        are trusted and the index is fresh, or None if the index cannot answer
+    """
+    if not is_enabled():
+        return None
+
+    with _db_lock:
+        row = _get_db().execute(
+            "SELECT 1 FROM tokens WHERE token_hash = ?", (_token_hash(token),)
+        ).fetchone()
+
+    if row is not None:
+        return True
+    return False if CHAIN_INDEX_TRUST_MISSES and is_fresh() else None
+
+def get_stats():
+    """
+    Get the index size and its freshness watermark.
+
+    Returns:
+        dict: Indexed token count, checkpoint block, chain head and sync age
+    """
+    if not is_enabled():
+        stats = {"enabled": False}
+        if CHAIN_INDEXER_ENABLED:
+            stats["unavailable_reason"] = _unavailable_reason()
+        return stats
+
+    checkpoint = _get_checkpoint()
+    with _db_lock:
+        tokens = _get_db().execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+    return {
+        "enabled": True,
+        "trust_misses": CHAIN_INDEX_TRUST_MISSES,
+        "tokens": tokens,
+        "checkpoint_block": checkpoint[0] if checkpoint else None,
+        "head_block": _head_block,
+        "seconds_since_sync": time.time() - _synced_at if _synced_at else None,
+        "fresh": is_fresh(),
+    }
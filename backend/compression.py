@@ -0,0 +1,236 @@
+"""
+Compression module for the PII Authenticator application.
+The compression stage between record serialization and storage: objects written
+through upload_to_filebase are compressed with the configured codec and the codec
+is recorded in the object's metadata, so reads decompress transparently whatever
+the writer's settings were.
+
+Codecs are pluggable (see register_codec). zlib is the default and always
+available; zstd needs the zstandard package from requirements.txt, and without it
+COMPRESSION_CODEC=zstd falls back to zlib. Objects below COMPRESSION_MIN_BYTES,
+or that do not get smaller, are stored raw. Small records compress poorly on their
+own, so zstd can use a dictionary trained on stored records:
+
+    python compression.py train [--samples N] [--size BYTES]
+
+writes <COMPRESSION_DICT_DIR>/<dict id>.dict; set COMPRESSION_DICT_ID to that id
+to compress with it. Dictionaries must be kept as long as objects use them.
+"""
+
+import os
+import zlib
+import argparse
+import threading
+from logger import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Get logger
+logger = get_logger()
+
+COMPRESSION_CODEC = os.getenv("COMPRESSION_CODEC", "zlib").lower()
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+# Below this size the codec's framing overhead outweighs the saving (lower it when using a dictionary)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "256"))
+COMPRESSION_DICT_DIR = os.getenv("COMPRESSION_DICT_DIR", "compression_dicts")
+COMPRESSION_DICT_ID = os.getenv("COMPRESSION_DICT_ID", "")
+
+# Object metadata keys (sent to S3 as x-amz-meta-*)
+META_ENCODING = "pii-encoding"
+META_DICT = "pii-dict"
+
+CODEC_NONE = "none"
+
+class ZlibCodec:
+    """DEFLATE via the standard library."""
+
+    name = "zlib"
+
+    def compress(self, data, level, dictionary=None):
+        return zlib.compress(data, level)
+
+    def decompress(self, data, dictionary=None):
+        return zlib.decompress(data)
+
+class ZstdCodec:
+    """Zstandard, with optional trained dictionaries."""
+
+    name = "zstd"
+
+    # Compressor and decompressor objects are not thread-safe, so one is created per call
+    def compress(self, data, level, dictionary=None):
+        return zstandard.ZstdCompressor(level=level, dict_data=dictionary).compress(data)
+
+    def decompress(self, data, dictionary=None):
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+
+_codecs = {ZlibCodec.name: ZlibCodec()}
+if zstandard is not None:
+    _codecs[ZstdCodec.name] = ZstdCodec()
+
+def register_codec(codec):
+    """
+    Make a codec available for writing and reading.
+
+    Args:
+        codec: An object with a name attribute and compress(data, level, dictionary=None)
+            and decompress(data, dictionary=None) methods
+    """
+    _codecs[codec.name] = codec
+
+_dicts_lock = threading.Lock()
+_dictionaries = {}
+
+def _load_dictionary(dict_id):
+    """Load a trained zstd dictionary by id from COMPRESSION_DICT_DIR, caching it."""
+    with _dicts_lock:
+        dictionary = _dictionaries.get(dict_id)
+        if dictionary is None:
+            with open(os.path.join(COMPRESSION_DICT_DIR, f"{dict_id}.dict"), "rb") as f:
+                dictionary = zstandard.ZstdCompressionDict(f.read())
+            _dictionaries[dict_id] = dictionary
+    return dictionary
+
+def _resolve_writer():
+    """Pick the codec and dictionary used for writing, falling back when they are unavailable."""
+    codec_name = COMPRESSION_CODEC
+    if codec_name != CODEC_NONE and codec_name not in _codecs:
+        logger.warning(f"⚠️ Compression codec {codec_name!r} unavailable, using zlib")
+        codec_name = ZlibCodec.name
+
+    dictionary = None
+    if COMPRESSION_DICT_ID and codec_name == ZstdCodec.name:
+        try:
+            dictionary = _load_dictionary(COMPRESSION_DICT_ID)
+            # Prepares the dictionary once instead of on every compress call
+            dictionary.precompute_compress(level=COMPRESSION_LEVEL)
+        except OSError as e:
+            logger.warning(f"⚠️ Compression dictionary {COMPRESSION_DICT_ID} unavailable, compressing without it: {e}")
+    return codec_name, dictionary
+
+_writer_codec, _writer_dictionary = _resolve_writer()
+
+_stats_lock = threading.Lock()
+_stats = {"objects": 0, "compressed": 0, "stored_raw": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+def compress_for_storage(data):
+    """
+    Compress an object for storage with the configured codec.
+
+    Args:
+        data (bytes): The serialized object
+
+    Returns:
+        tuple: (bytes to store, metadata dict to store with them)
+    """
+    stored, metadata = data, {}
+    if _writer_codec != CODEC_NONE and len(data) >= COMPRESSION_MIN_BYTES:
+        compressed = _codecs[_writer_codec].compress(data, COMPRESSION_LEVEL, _writer_dictionary)
+        # Incompressible data (e.g. already compressed) is kept as it is
+        if len(compressed) < len(data):
+            stored = compressed
+            metadata[META_ENCODING] = _writer_codec
+            if _writer_dictionary is not None:
+                metadata[META_DICT] = str(_writer_dictionary.dict_id())
+
+    with _stats_lock:
+        _stats["objects"] += 1
+        _stats["compressed" if metadata else "stored_raw"] += 1
+        _stats["raw_bytes"] += len(data)
+        _stats["stored_bytes"] += len(stored)
+    return stored, metadata
+
+def decompress_from_storage(data, metadata):
+    """
+    Undo compress_for_storage using the metadata stored with the object.
+
+    Args:
+        data (bytes): The stored object
+        metadata (dict): The object's metadata; None or empty for raw objects
+
+    Returns:
+        bytes: The original object
+
+    Raises:
+        ValueError: If the object uses a codec or dictionary that is not available
+    """
+    encoding = (metadata or {}).get(META_ENCODING, CODEC_NONE)
+    if encoding == CODEC_NONE:
+        return data
+
+    codec = _codecs.get(encoding)
+    if codec is None:
+        raise ValueError(f"Object is compressed with unavailable codec {encoding!r}")
+
+    dictionary = None
+    dict_id = metadata.get(META_DICT)
+    if dict_id:
+        try:
+            dictionary = _load_dictionary(dict_id)
+        except OSError as e:
+            raise ValueError(f"Compression dictionary {dict_id} unavailable: {e}")
+    return codec.decompress(data, dictionary)
+
+def get_stats():
+    """
+    Get counters for the compression stage.
+
+    Returns:
+        dict: Objects written, how many were compressed or stored raw, bytes before
+        and after compression and the overall ratio
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["codec"] = _writer_codec
+    stats["dict_id"] = _writer_dictionary.dict_id() if _writer_dictionary is not None else None
+    stats["ratio"] = stats["stored_bytes"] / stats["raw_bytes"] if stats["raw_bytes"] else 1.0
+    return stats
+
+def train_dictionary(samples, size=16 * 1024):
+    """
+    Train a zstd dictionary and save it in COMPRESSION_DICT_DIR.
+
+    Args:
+        samples (list): Serialized objects representative of what will be stored
+        size (int): Dictionary size in bytes
+
+    Returns:
+        int: The dictionary id, to be set as COMPRESSION_DICT_ID
+    """
+    if zstandard is None:
+        raise RuntimeError("Dictionary training requires the zstandard package")
+
+    dictionary = zstandard.train_dictionary(size, samples)
+    os.makedirs(COMPRESSION_DICT_DIR, exist_ok=True)
+    path = os.path.join(COMPRESSION_DICT_DIR, f"{dictionary.dict_id()}.dict")
+    with open(path, "wb") as f:
+        f.write(dictionary.as_bytes())
+    logger.info(f"✅ Trained compression dictionary {dictionary.dict_id()} from {len(samples)} samples: {path}")
+    return dictionary.dict_id()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage storage compression dictionaries")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="Train a zstd dictionary from stored records")
+    train.add_argument("--samples", type=int, default=2000, help="Number of stored records to sample (default: 2000)")
+    train.add_argument("--size", type=int, default=16 * 1024, help="Dictionary size in bytes (default: 16384)")
+    args = parser.parse_args()
+
+    # Imported here: w3_utils itself uses this module
+    import w3_utils
+    samples = []
+    for token in w3_utils.list_stored_tokens():
+        if len(samples) >= args.samples:
+            break
+        data = w3_utils.retrieve_from_filebase(f"{token}.json")
+        if data is not None:
+            samples.append(data)
+
+    dict_id = train_dictionary(samples, args.size)
+    print(f"COMPRESSION_DICT_ID={dict_id}")
+
+if __name__ == "__main__":
+    main()
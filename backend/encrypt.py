@@ -1,78 +1,386 @@
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-import base64
+"""
+Encryption module for the PII Authenticator application.
+Envelope encryption for stored PII records: every record is encrypted with its own
+random AES-256-GCM data key, and the data key is stored with the record wrapped
+(AES-GCM encrypted) by the master key from ENCRYPTED_AES_KEY.
+
+Sealed record layout, version 1:
+
+    version      1 byte    0x01
+    key id       4 bytes   first bytes of SHA-256 of the master key that wrapped the data key
+    wrap nonce  12 bytes
+    wrapped key 48 bytes   the data key encrypted under the master key, with its tag
+    nonce       12 bytes
+    ciphertext             the record encrypted under the data key, with its tag
+
+The record's storage key is authenticated as associated data, so a sealed record
+cannot be moved to another token. Master keys are turned into cipher objects once;
+previous master keys listed in ENCRYPTION_PREVIOUS_KEYS can still open records
+after a key rotation.
+
+Streamed objects (documents) are sealed in segments, so they can be encrypted as
+they arrive and any byte range can be decrypted without reading the whole object.
+Sealed stream layout, version 2:
+
+    version       1 byte    0x02
+    key id        4 bytes
+    wrap nonce   12 bytes
+    wrapped key  48 bytes
+    nonce prefix  7 bytes
+    segments                each STREAM_SEGMENT_SIZE bytes of plaintext (the last
+                            one 0 to STREAM_SEGMENT_SIZE bytes) encrypted under the
+                            data key, with its tag
+
+Segment i uses the nonce prefix + i (4 bytes, big-endian) + a final flag byte, so
+segments cannot be reordered, and a stream cannot be truncated at a segment boundary.
+"""
+
 import os
-import json
-import time
-import traceback
+import base64
+import hashlib
+import threading
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from logger import get_logger
 
 # Get logger
 logger = get_logger()
 
-# AES key storage (Example: to store keys associated with each ID)
-AES_KEY_STORAGE = {}
+# Development key, used when ENCRYPTED_AES_KEY is not set
+_DEV_KEY = "c2FtcGxlX2Flc19rZXlfZm9yX2RldmVsb3BtZW50X29ubHk="
+
+ENCRYPTION_ENABLED = os.getenv("ENCRYPTION_ENABLED", "true").lower() == "true"
+ENCRYPTED_AES_KEY = os.getenv("ENCRYPTED_AES_KEY", "")
+# Comma-separated base64 master keys that records may still be wrapped with
+ENCRYPTION_PREVIOUS_KEYS = [key for key in os.getenv("ENCRYPTION_PREVIOUS_KEYS", "").split(",") if key]
+
+# Object metadata recording that an object is sealed
+META_ENCRYPTION = "pii-encryption"
+ENCRYPTION_ENVELOPE_V1 = "envelope-v1"
+ENCRYPTION_STREAM_V1 = "stream-v1"
+
+ENVELOPE_V1 = 1
+_KEY_ID_SIZE = 4
+_NONCE_SIZE = 12
+_DATA_KEY_SIZE = 32
+_TAG_SIZE = 16
+_WRAPPED_KEY_SIZE = _DATA_KEY_SIZE + _TAG_SIZE
+_HEADER_SIZE = 1 + _KEY_ID_SIZE + _NONCE_SIZE + _WRAPPED_KEY_SIZE + _NONCE_SIZE
+
+STREAM_V1 = 2
+# Plaintext bytes per segment; part of the format, so changing it needs a new version
+STREAM_SEGMENT_SIZE = 64 * 1024
+_STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_HEADER_SIZE = 1 + _KEY_ID_SIZE + _NONCE_SIZE + _WRAPPED_KEY_SIZE + _STREAM_NONCE_PREFIX_SIZE
+_SEALED_SEGMENT_SIZE = STREAM_SEGMENT_SIZE + _TAG_SIZE
+
+class DecryptionError(Exception):
+    """A sealed record could not be opened: unknown format or master key, or it was tampered with."""
+
+def _load_master_key(encoded):
+    """Decode a base64 master key, deriving an AES-256 key from anything that is not a valid AES key size."""
+    raw = base64.urlsafe_b64decode(encoded)
+    if len(raw) in (16, 24, 32):
+        return raw
+    logger.warning(f"⚠️ Master key is {len(raw)} bytes, not an AES key size; deriving a 256-bit key from it")
+    return hashlib.sha256(raw).digest()
+
+def _key_id(key):
+    return hashlib.sha256(key).digest()[:_KEY_ID_SIZE]
+
+_keys_lock = threading.Lock()
+# Built on first use: key id of the current master key, and AESGCM objects by key id
+_current_key_id = None
+_master_keys = None
+
+def _get_master_keys():
+    """Return (current key id, {key id: AESGCM}), building the cipher objects once."""
+    global _current_key_id, _master_keys
+    if _master_keys is None:
+        with _keys_lock:
+            if _master_keys is None:
+                if not ENCRYPTED_AES_KEY:
+                    logger.warning("⚠️ No AES Key found in environment variables. Using development key.")
+                current = _load_master_key(ENCRYPTED_AES_KEY or _DEV_KEY)
+                keys = {_key_id(key): AESGCM(key) for key in map(_load_master_key, ENCRYPTION_PREVIOUS_KEYS)}
+                keys[_key_id(current)] = AESGCM(current)
+                _current_key_id = _key_id(current)
+                _master_keys = keys
+    return _current_key_id, _master_keys
+
+def _seal(master, key_id, data_key, wrap_nonce, nonce, plaintext, associated_data):
+    wrapped_key = master.encrypt(wrap_nonce, data_key, key_id)
+    ciphertext = AESGCM(data_key).encrypt(nonce, plaintext, associated_data)
+    return bytes([ENVELOPE_V1]) + key_id + wrap_nonce + wrapped_key + nonce + ciphertext
 
-def encrypt_and_store_id(id_number: str):
+def encrypt_record(plaintext, associated_data=b""):
     """
-    Encrypt and store an ID number.
-    
+    Encrypt one record under a new data key.
+
+    Args:
+        plaintext (bytes): The serialized record
+        associated_data (bytes): Authenticated but unencrypted context, e.g. the storage key
+
+    Returns:
+        bytes: The sealed record
+    """
+    key_id, keys = _get_master_keys()
+    material = os.urandom(_DATA_KEY_SIZE + 2 * _NONCE_SIZE)
+    return _seal(
+        keys[key_id], key_id,
+        material[:_DATA_KEY_SIZE],
+        material[_DATA_KEY_SIZE:_DATA_KEY_SIZE + _NONCE_SIZE],
+        material[_DATA_KEY_SIZE + _NONCE_SIZE:],
+        plaintext, associated_data
+    )
+
+def encrypt_records(items):
+    """
+    Encrypt many records, each under its own data key.
+
+    The master cipher is looked up once and the random key material for the
+    whole batch comes from a single os.urandom call.
+
     Args:
-        id_number (str): The ID number to encrypt and store
-        
+        items (list): (plaintext, associated_data) pairs
+
     Returns:
-        tuple: (encrypted_id, cid) - The encrypted ID and the CID where it's stored
+        list: The sealed records, in the same order
+    """
+    key_id, keys = _get_master_keys()
+    master = keys[key_id]
+    size = _DATA_KEY_SIZE + 2 * _NONCE_SIZE
+    material = memoryview(os.urandom(size * len(items)))
+
+    sealed = []
+    for index, (plaintext, associated_data) in enumerate(items):
+        offset = index * size
+        sealed.append(_seal(
+            master, key_id,
+            bytes(material[offset:offset + _DATA_KEY_SIZE]),
+            bytes(material[offset + _DATA_KEY_SIZE:offset + _DATA_KEY_SIZE + _NONCE_SIZE]),
+            bytes(material[offset + _DATA_KEY_SIZE + _NONCE_SIZE:offset + size]),
+            plaintext, associated_data
+        ))
+    return sealed
+
+def decrypt_record(sealed, associated_data=b""):
+    """
+    Open a record sealed by encrypt_record or encrypt_records.
+
+    Args:
+        sealed (bytes): The sealed record
+        associated_data (bytes): The associated data it was sealed with
+
+    Returns:
+        bytes: The serialized record
+
+    Raises:
+        DecryptionError: If the record cannot be opened
     """
-    logger.info(f"Encrypting and storing ID: {id_number[:4]}****")
-    start_time = time.time()
-    
+    if len(sealed) < _HEADER_SIZE + _TAG_SIZE or sealed[0] != ENVELOPE_V1:
+        raise DecryptionError("Not a sealed record, or an unknown envelope version")
+
+    offset = 1
+    key_id = sealed[offset:offset + _KEY_ID_SIZE]
+    offset += _KEY_ID_SIZE
+    wrap_nonce = sealed[offset:offset + _NONCE_SIZE]
+    offset += _NONCE_SIZE
+    wrapped_key = sealed[offset:offset + _WRAPPED_KEY_SIZE]
+    offset += _WRAPPED_KEY_SIZE
+    nonce = sealed[offset:offset + _NONCE_SIZE]
+    offset += _NONCE_SIZE
+
+    master = _get_master_keys()[1].get(key_id)
+    if master is None:
+        raise DecryptionError(f"Record was sealed with unknown master key {key_id.hex()}")
+
     try:
-        # Load AES Key from ENV (for simplicity, use a default key)
-        aes_key = os.getenv("ENCRYPTED_AES_KEY", "c2FtcGxlX2Flc19rZXlfZm9yX2RldmVsb3BtZW50X29ubHk=")
-        if not aes_key:
-            logger.warning("⚠️ No AES Key found in environment variables. Using development key.")
-        
-        # Generate a random IV (Initialization Vector) for encryption
-        iv = os.urandom(16)
-        logger.debug("Generated random IV for encryption")
+        data_key = master.decrypt(wrap_nonce, wrapped_key, key_id)
+        return AESGCM(data_key).decrypt(nonce, sealed[offset:], associated_data)
+    except InvalidTag:
+        raise DecryptionError("Record authentication failed")
+
+def _segment_nonce(prefix, index, final):
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if final else b"\x00")
+
+class StreamEncryptor:
+    """Seals a stream incrementally under a new data key; feed it with update() and end with finalize()."""
+
+    def __init__(self, associated_data=b""):
+        """
+        Args:
+            associated_data (bytes): Authenticated but unencrypted context, e.g. the storage key
+        """
+        key_id, keys = _get_master_keys()
+        material = os.urandom(_DATA_KEY_SIZE + _NONCE_SIZE + _STREAM_NONCE_PREFIX_SIZE)
+        data_key = material[:_DATA_KEY_SIZE]
+        wrap_nonce = material[_DATA_KEY_SIZE:_DATA_KEY_SIZE + _NONCE_SIZE]
+        self._prefix = material[_DATA_KEY_SIZE + _NONCE_SIZE:]
+        self._cipher = AESGCM(data_key)
+        self._associated_data = associated_data
+        self._pending = bytes([STREAM_V1]) + key_id + wrap_nonce + keys[key_id].encrypt(wrap_nonce, data_key, key_id) + self._prefix
+        self._buffer = bytearray()
+        self._index = 0
+
+    def _seal_segment(self, plaintext, final):
+        sealed = self._cipher.encrypt(_segment_nonce(self._prefix, self._index, final), bytes(plaintext), self._associated_data)
+        self._index += 1
+        return sealed
+
+    def update(self, chunk):
+        """
+        Add plaintext.
+
+        Returns:
+            bytes: Sealed output ready to be written (possibly empty)
+        """
+        self._buffer += chunk
+        out = bytearray(self._pending)
+        self._pending = b""
+        # A full segment is only sealed once more data follows it, since the last one is flagged final
+        while len(self._buffer) > STREAM_SEGMENT_SIZE:
+            out += self._seal_segment(self._buffer[:STREAM_SEGMENT_SIZE], False)
+            del self._buffer[:STREAM_SEGMENT_SIZE]
+        return bytes(out)
+
+    def finalize(self):
+        """
+        Seal the final segment.
+
+        Returns:
+            bytes: The rest of the sealed stream
+        """
+        out = self._pending + self._seal_segment(self._buffer, True)
+        self._pending = b""
+        self._buffer = bytearray()
+        return out
+
+def encrypt_stream(chunks, associated_data=b""):
+    """
+    Seal an iterable of plaintext chunks, yielding the sealed stream in chunks.
+
+    Args:
+        chunks: An iterable of bytes chunks
+        associated_data (bytes): Authenticated but unencrypted context, e.g. the storage key
+    """
+    encryptor = StreamEncryptor(associated_data)
+    for chunk in chunks:
+        sealed = encryptor.update(chunk)
+        if sealed:
+            yield sealed
+    yield encryptor.finalize()
+
+def stream_plaintext_size(sealed_size):
+    """Plaintext size of a sealed stream of sealed_size bytes."""
+    body = max(sealed_size - STREAM_HEADER_SIZE, 0)
+    segments = max(-(-body // _SEALED_SEGMENT_SIZE), 1)
+    return max(body - segments * _TAG_SIZE, 0)
+
+def _segment_span(start, end):
+    """First and last segment holding plaintext bytes start to end (inclusive)."""
+    return start // STREAM_SEGMENT_SIZE, max(end, start) // STREAM_SEGMENT_SIZE
+
+def stream_sealed_range(start, end):
+    """
+    The bytes of a sealed stream, after its header, needed to decrypt a plaintext range.
+
+    Args:
+        start (int): First plaintext byte
+        end (int): Last plaintext byte, inclusive
+
+    Returns:
+        tuple: (first, last) sealed byte offsets, inclusive; last may be past the end of the object
+    """
+    first, last = _segment_span(start, end)
+    return STREAM_HEADER_SIZE + first * _SEALED_SEGMENT_SIZE, STREAM_HEADER_SIZE + (last + 1) * _SEALED_SEGMENT_SIZE - 1
+
+class StreamDecryptor:
+    """
+    Opens the segments of a sealed stream that cover a plaintext range.
+
+    Feed it the sealed bytes from stream_sealed_range(start, end) with update(),
+    then call finalize() to make sure nothing was cut off.
+    """
 
+    def __init__(self, header, plaintext_size, start, end, associated_data=b""):
+        """
+        Args:
+            header (bytes): The first STREAM_HEADER_SIZE bytes of the sealed stream
+            plaintext_size (int): The stream's plaintext size, from stream_plaintext_size
+            start (int): First plaintext byte wanted
+            end (int): Last plaintext byte wanted, inclusive
+            associated_data (bytes): The associated data it was sealed with
+
+        Raises:
+            DecryptionError: If the header cannot be opened
+        """
+        if len(header) < STREAM_HEADER_SIZE or header[0] != STREAM_V1:
+            raise DecryptionError("Not a sealed stream, or an unknown stream version")
+
+        offset = 1
+        key_id = header[offset:offset + _KEY_ID_SIZE]
+        offset += _KEY_ID_SIZE
+        wrap_nonce = header[offset:offset + _NONCE_SIZE]
+        offset += _NONCE_SIZE
+        wrapped_key = header[offset:offset + _WRAPPED_KEY_SIZE]
+        offset += _WRAPPED_KEY_SIZE
+        self._prefix = header[offset:offset + _STREAM_NONCE_PREFIX_SIZE]
+
+        master = _get_master_keys()[1].get(key_id)
+        if master is None:
+            raise DecryptionError(f"Stream was sealed with unknown master key {key_id.hex()}")
         try:
-            # Encrypt the ID using AES (CBC mode)
-            logger.debug("Encrypting ID using AES (CBC mode)")
-            cipher = Cipher(algorithms.AES(base64.urlsafe_b64decode(aes_key)), modes.CBC(iv), backend=default_backend())
-            encryptor = cipher.encryptor()
-
-            # Ensure ID is 16-byte padded (AES block size is 16 bytes)
-            padded_id = id_number.encode('utf-8') + b'\x00' * (16 - len(id_number) % 16)
-            encrypted_id = encryptor.update(padded_id) + encryptor.finalize()
-            
-            logger.debug("ID encrypted successfully")
-        except Exception as e:
-            logger.error(f"⚠️ Encryption error: {str(e)}. Using development mode.")
-            logger.debug(traceback.format_exc())
-            
-            # In development mode, just use a simple encoding
-            encrypted_id = base64.b64encode(id_number.encode('utf-8'))
-            logger.debug("Using base64 encoding as fallback")
-
-        # Store the AES key and IV in a global storage for later retrieval
-        AES_KEY_STORAGE[id_number] = aes_key
-        logger.debug(f"AES key stored in memory for ID: {id_number[:4]}****")
-
-        # Store the encrypted data in Filecoin (placeholder)
-        # Replace this with the actual Filecoin storage logic
-        cid = "dummy_cid_for_now"  # This should be the CID of the uploaded file in Filecoin
-        
-        elapsed_time = time.time() - start_time
-        logger.info(f"Encrypted ID stored for {id_number[:4]}**** in {elapsed_time:.4f} seconds. CID: {cid}")
-        
-        return encrypted_id, cid
-    
-    except Exception as e:
-        logger.error(f"Encryption failed for {id_number[:4]}****: {str(e)}")
-        logger.debug(traceback.format_exc())
-        
-        # In development mode, don't crash on encryption errors
-        return base64.b64encode(id_number.encode('utf-8')), "dev_cid"
+            self._cipher = AESGCM(master.decrypt(wrap_nonce, wrapped_key, key_id))
+        except InvalidTag:
+            raise DecryptionError("Stream authentication failed")
+
+        self._associated_data = associated_data
+        self._final_index = max(-(-plaintext_size // STREAM_SEGMENT_SIZE), 1) - 1
+        self._final_sealed_length = plaintext_size - self._final_index * STREAM_SEGMENT_SIZE + _TAG_SIZE
+        self._index, self._last_index = _segment_span(start, end)
+        self._last_index = min(self._last_index, self._final_index)
+        # Plaintext to drop from the first segment, and to return in total
+        self._skip = start - self._index * STREAM_SEGMENT_SIZE
+        self._remaining = max(end - start + 1, 0)
+        self._buffer = bytearray()
+
+    def update(self, chunk):
+        """
+        Add sealed bytes.
+
+        Returns:
+            bytes: Plaintext of the requested range, as far as it can be decrypted so far
+
+        Raises:
+            DecryptionError: If a segment was tampered with
+        """
+        self._buffer += chunk
+        out = bytearray()
+        while self._index <= self._last_index:
+            final = self._index == self._final_index
+            length = self._final_sealed_length if final else _SEALED_SEGMENT_SIZE
+            if len(self._buffer) < length:
+                break
+            try:
+                plaintext = self._cipher.decrypt(
+                    _segment_nonce(self._prefix, self._index, final), bytes(self._buffer[:length]), self._associated_data
+                )
+            except InvalidTag:
+                raise DecryptionError(f"Stream segment {self._index} authentication failed")
+            del self._buffer[:length]
+            self._index += 1
+
+            plaintext = plaintext[self._skip:self._skip + self._remaining]
+            self._skip = 0
+            self._remaining -= len(plaintext)
+            out += plaintext
+        return bytes(out)
+
+    def finalize(self):
+        """
+        Raises:
+            DecryptionError: If the sealed bytes ended before the requested range
+        """
+        if self._index <= self._last_index:
+            raise DecryptionError("Sealed stream is truncated")
@@ -0,0 +1,154 @@
+"""
+I/O executor module for the PII Authenticator application.
+A shared, sized thread pool for blocking remote calls (Filebase S3, Ethereum RPC)
+that enforces real deadlines: a caller waits at most its timeout, and a call
+that overruns is cancelled if it has not started or abandoned if it has.
+
+Calls run in a copy of the submitting thread's context, so the request's trace
+and request ID follow them into the worker, and each call is a trace span.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from logger import get_logger
+from tracing import span
+
+# Get logger
+logger = get_logger()
+
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a remote call does not finish within its deadline.
+
+    cancelled is True if the call had not started and will never run, and False
+    if it was abandoned while running and may still complete.
+    """
+
+    def __init__(self, message, cancelled=False):
+        super().__init__(message)
+        self.cancelled = cancelled
+
+_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="io")
+
+_stats_lock = threading.Lock()
+_in_flight = 0
+_max_in_flight = 0
+_abandoned_running = 0
+_calls = defaultdict(lambda: {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "cancelled": 0})
+
+def _track(name, fn, args, kwargs, submitted_at):
+    """Run fn in a worker thread while keeping the in-flight gauges up to date."""
+    global _in_flight, _max_in_flight
+    with _stats_lock:
+        _in_flight += 1
+        _max_in_flight = max(_max_in_flight, _in_flight)
+    try:
+        with span(name, queued_ms=round((time.time() - submitted_at) * 1000, 3)):
+            result = fn(*args, **kwargs)
+        with _stats_lock:
+            _calls[name]["completed"] += 1
+        return result
+    except Exception:
+        with _stats_lock:
+            _calls[name]["failed"] += 1
+        raise
+    finally:
+        with _stats_lock:
+            _in_flight -= 1
+
+def _on_abandoned_done(future):
+    global _abandoned_running
+    with _stats_lock:
+        _abandoned_running -= 1
+
+def submit(name, fn, *args, **kwargs):
+    """
+    Schedule a call on the shared executor without waiting for it.
+
+    Args:
+        name (str): A short label for the call, used in the metrics (e.g. "s3.put_object")
+        fn (callable): The blocking function to run
+
+    Returns:
+        Future: The future for the call
+    """
+    with _stats_lock:
+        _calls[name]["submitted"] += 1
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, _track, name, fn, args, kwargs, time.time())
+
+def wait_with_deadline(name, future, timeout):
+    """
+    Wait for a future from submit() for at most timeout seconds.
+
+    Args:
+        name (str): The label the call was submitted with
+        future (Future): The future returned by submit()
+        timeout (float): Seconds to wait
+
+    Returns:
+        The call's result
+
+    Raises:
+        DeadlineExceeded: If the call did not finish in time; its cancelled
+            attribute tells whether the call will still run
+    """
+    global _abandoned_running
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            outcome = "cancelled"
+            with _stats_lock:
+                _calls[name]["cancelled"] += 1
+        else:
+            # Already running: leave it to finish in the background, but stop waiting
+            outcome = "abandoned"
+            with _stats_lock:
+                _abandoned_running += 1
+            future.add_done_callback(_on_abandoned_done)
+        with _stats_lock:
+            _calls[name]["timeouts"] += 1
+        logger.warning(f"⚠️ {name} exceeded its {timeout}s deadline and was {outcome}")
+        raise DeadlineExceeded(f"{name} did not complete within {timeout} seconds", cancelled=outcome == "cancelled")
+
+def run_with_deadline(name, timeout, fn, *args, **kwargs):
+    """
+    Run a blocking call on the shared executor and wait at most timeout seconds.
+
+    Args:
+        name (str): A short label for the call, used in the metrics
+        timeout (float): Seconds to wait for the call
+        fn (callable): The blocking function to run
+
+    Returns:
+        The call's result
+
+    Raises:
+        DeadlineExceeded: If the call did not finish in time
+        Exception: Whatever fn raised
+    """
+    return wait_with_deadline(name, submit(name, fn, *args, **kwargs), timeout)
+
+def get_stats():
+    """
+    Get executor gauges and per-call counters.
+
+    Returns:
+        dict: Pool size, in-flight and queued calls, and counters per call name
+    """
+    with _stats_lock:
+        return {
+            "workers": IO_EXECUTOR_WORKERS,
+            "in_flight": _in_flight,
+            "max_in_flight": _max_in_flight,
+            "queued": _executor._work_queue.qsize(),
+            "abandoned_running": _abandoned_running,
+            "calls": {name: dict(counters) for name, counters in _calls.items()},
+        }
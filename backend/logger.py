@@ -1,19 +1,74 @@
 """
 Logger module for the PII Authenticator application.
 Provides centralized logging functionality with different log levels and formats.
+
+Records are handed to a bounded in-memory queue and written to the console and
+log files by a background listener thread, so request threads never wait on
+disk I/O or log rotation. The message is still formatted on the calling thread
+when the record is enqueued. When the queue is full, records are either dropped
+and counted (LOG_QUEUE_POLICY=drop) or the caller waits for space (block).
+Under drop, warnings and errors wait up to LOG_QUEUE_PUT_TIMEOUT seconds for
+space before they are dropped and counted too. File records carry
+the ID of the request being handled, so one request can be followed across modules.
+
+Access records do not go through the logging pipeline. Each request gets one
+JSON line in logs/access.jsonl, written by a separate AccessLogWriter that
+buffers lines and flushes them in batches.
+
+Per-request log lines on hot paths go through log sites (log_site), which format
+their %-style arguments lazily and can be sampled or rate limited per call site.
+The logger level can be changed while running with set_log_level, or by sending
+SIGUSR1 to toggle between DEBUG and INFO.
 """
 
 import os
+import json
+import time
+import queue
+import signal
+import atexit
+import contextvars
 import logging
 import datetime
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 # Create logs directory if it doesn't exist
 os.makedirs('logs', exist_ok=True)
 
+# Queued logging
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop").lower()
+# Under drop: seconds a warning or error waits for queue space before it is dropped
+LOG_QUEUE_PUT_TIMEOUT = float(os.getenv("LOG_QUEUE_PUT_TIMEOUT", "1.0"))
+
+POLICY_DROP = "drop"
+POLICY_BLOCK = "block"
+
+def _parse_site_settings(value):
+    """Parse "site=N,site=N" into a dict of site name to int."""
+    settings = {}
+    for item in value.split(","):
+        name, _, number = item.partition("=")
+        if name.strip() and number.strip().isdigit():
+            settings[name.strip()] = int(number)
+    return settings
+
+# Logger level at startup; DEBUG keeps every record for pii_authenticator.log
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+# Per log site: log 1 in N calls ("token.valid=100,storage.exists=10")
+LOG_SAMPLE_RATES = _parse_site_settings(os.getenv("LOG_SAMPLE_RATES", ""))
+# Per log site: log at most N calls per second
+LOG_RATE_LIMITS = _parse_site_settings(os.getenv("LOG_RATE_LIMITS", ""))
+
+# Structured access log
+ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv("ACCESS_LOG_FLUSH_INTERVAL", "1.0"))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "256"))
+
 # Configure the main logger
 logger = logging.getLogger('pii_authenticator')
-logger.setLevel(logging.DEBUG)
+# getLevelName maps a known level name to its number
+logger.setLevel(LOG_LEVEL if isinstance(logging.getLevelName(LOG_LEVEL), int) else logging.DEBUG)
 
 # Create formatters
 standard_formatter = logging.Formatter(
@@ -22,7 +77,7 @@ standard_formatter = logging.Formatter(
 )
 
 detailed_formatter = logging.Formatter(
-    '%(asctime)s [%(levelname)s] %(module)s.%(funcName)s:%(lineno)d - %(message)s',
+    '%(asctime)s [%(levelname)s] %(module)s.%(funcName)s:%(lineno)d [%(request_id)s] - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
@@ -30,7 +85,6 @@ detailed_formatter = logging.Formatter(
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(standard_formatter)
-logger.addHandler(console_handler)
 
 # Create file handlers
 # Main log file - contains all logs
@@ -40,7 +94,6 @@ main_file_handler = RotatingFileHandler(
 )
 main_file_handler.setLevel(logging.DEBUG)
 main_file_handler.setFormatter(detailed_formatter)
-logger.addHandler(main_file_handler)
 
 # Error log file - contains only errors
 error_log_file = os.path.join('logs', 'errors.log')
@@ -49,29 +102,278 @@ error_file_handler = RotatingFileHandler(
 )
 error_file_handler.setLevel(logging.ERROR)
 error_file_handler.setFormatter(detailed_formatter)
-logger.addHandler(error_file_handler)
 
-# Access log file - contains only access logs
-access_log_file = os.path.join('logs', 'access.log')
-access_file_handler = RotatingFileHandler(
-    access_log_file, maxBytes=10*1024*1024, backupCount=5
+# Retrieval log file - contains only record retrieval timings
+retrieval_log_file = os.path.join('logs', 'retrieval.log')
+retrieval_file_handler = RotatingFileHandler(
+    retrieval_log_file, maxBytes=10*1024*1024, backupCount=5
 )
-access_file_handler.setLevel(logging.INFO)
-access_file_handler.setFormatter(standard_formatter)
+retrieval_file_handler.setLevel(logging.INFO)
+retrieval_file_handler.setFormatter(standard_formatter)
 
-# Create a filter for access logs
-class AccessLogFilter(logging.Filter):
+# Create a filter for retrieval logs
+class RetrievalLogFilter(logging.Filter):
     def filter(self, record):
-        return hasattr(record, 'access_log') and record.access_log
+        return hasattr(record, 'retrieval_log') and record.retrieval_log
+
+retrieval_file_handler.addFilter(RetrievalLogFilter())
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler for a bounded queue that drops or waits when the queue is full."""
+
+    def __init__(self, log_queue, policy=POLICY_DROP, put_timeout=1.0):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.dropped_by_level = {}
+
+    def enqueue(self, record):
+        if self.policy == POLICY_BLOCK:
+            self.queue.put(record)
+            return
+        try:
+            if record.levelno >= logging.WARNING:
+                # Wait a bounded time so a stalled listener cannot hang request threads
+                self.queue.put(record, timeout=self.put_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self.dropped_by_level[record.levelname] = self.dropped_by_level.get(record.levelname, 0) + 1
 
-access_file_handler.addFilter(AccessLogFilter())
-logger.addHandler(access_file_handler)
+# The access entry of the request being handled, filled in by log_access
+_current_access = contextvars.ContextVar('current_access', default=None)
+
+class RequestContextFilter(logging.Filter):
+    """Stamps each record with the ID of the request being handled, or "-" outside requests."""
+
+    def filter(self, record):
+        entry = _current_access.get()
+        record.request_id = entry["request_id"] if entry is not None and entry["request_id"] else "-"
+        return True
+
+# Request threads format the message (QueueHandler.prepare) and enqueue it;
+# the listener thread applies the handlers' formatters and does all writing
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = BoundedQueueHandler(
+    log_queue,
+    LOG_QUEUE_POLICY if LOG_QUEUE_POLICY in (POLICY_DROP, POLICY_BLOCK) else POLICY_DROP,
+    LOG_QUEUE_PUT_TIMEOUT
+)
+# Runs in the logging thread, where the request's context is current
+queue_handler.addFilter(RequestContextFilter())
+logger.addHandler(queue_handler)
+
+class BoundedQueueListener(QueueListener):
+    """QueueListener whose stop() waits for queue space instead of failing when the queue is full."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+log_listener = BoundedQueueListener(
+    log_queue,
+    console_handler,
+    main_file_handler,
+    error_file_handler,
+    retrieval_file_handler,
+    respect_handler_level=True
+)
+log_listener.start()
+_listener_running = True
+
+if queue_handler.policy != LOG_QUEUE_POLICY:
+    logger.warning(f"⚠️ Unknown LOG_QUEUE_POLICY {LOG_QUEUE_POLICY!r}, using {queue_handler.policy}")
+
+class AccessLogWriter:
+    """
+    Writes access entries as JSON lines.
+
+    Callers only append the entry dict to a buffer; a background thread serializes
+    the buffered entries and writes them with one write and one flush per batch,
+    every flush_interval seconds or as soon as batch_size entries are waiting.
+    The file is rotated like the RotatingFileHandler logs.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=256, max_bytes=10*1024*1024, backup_count=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._buffer = []
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, entry):
+        """Queue one access entry (a JSON-serializable dict) for writing."""
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every buffered entry to the file."""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+
+        lines = "".join(json.dumps(entry, separators=(',', ':'), default=str) + "\n" for entry in entries)
+        with self._write_lock:
+            try:
+                self._file.write(lines)
+                self._file.flush()
+                self.written += len(entries)
+                self.batches += 1
+                if self.max_bytes and self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Failed to write {len(entries)} access log entries: {e}")
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        """Write out the buffered entries and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        with self._write_lock:
+            self._file.close()
+
+# Access log file - one JSON object per request
+access_log_file = os.path.join('logs', 'access.jsonl')
+access_writer = AccessLogWriter(access_log_file, ACCESS_LOG_FLUSH_INTERVAL, ACCESS_LOG_BATCH_SIZE)
+
+def stop_logging():
+    """Write out every queued record and access entry and stop the writer threads."""
+    global _listener_running
+    access_writer.close()
+    if _listener_running:
+        _listener_running = False
+        log_listener.stop()
+
+# Flush the queue on interpreter exit so the last records are not lost
+atexit.register(stop_logging)
+
+def get_log_queue_stats():
+    """
+    Get the state of the logging queue.
+    
+    Returns:
+        dict: Queued records, queue capacity, policy and dropped record counters
+    """
+    with queue_handler._lock:
+        dropped = queue_handler.dropped
+        dropped_by_level = dict(queue_handler.dropped_by_level)
+    return {
+        "queued": log_queue.qsize(),
+        "max_size": LOG_QUEUE_SIZE,
+        "policy": queue_handler.policy,
+        "dropped": dropped,
+        "dropped_by_level": dropped_by_level,
+    }
+
+def log_retrieval(key, token=None, status=None, byte_range=None, bytes_sent=0, first_byte_time=None, total_time=None):
+    """
+    Log the timing of a record retrieval.
+    
+    Args:
+        key (str): The storage key that was read
+        token (str, optional): The token the record belongs to
+        status (int, optional): The HTTP status of the response
+        byte_range (str, optional): The Content-Range served, for partial responses
+        bytes_sent (int, optional): Bytes streamed to the client
+        first_byte_time (float, optional): Seconds until the first byte was ready
+        total_time (float, optional): Seconds until the response was complete
+    """
+    first_byte = f"{first_byte_time:.4f}s" if first_byte_time is not None else "N/A"
+    total = f"{total_time:.4f}s" if total_time is not None else "N/A"
+    logger.info(
+        f"RETRIEVAL: {key} | Token: {token or 'N/A'} | Status: {status or 'N/A'} | Range: {byte_range or 'full'} | "
+        f"Bytes: {bytes_sent} | First byte: {first_byte} | Total: {total}",
+        extra={'retrieval_log': True}
+    )
+
+def begin_access(request_id, method=None, path=None, ip_address=None):
+    """
+    Start the access entry for the request being handled.
+    
+    log_access calls made while the request runs fill in the entry, and
+    end_access writes it as one line.
+    
+    Args:
+        request_id (str): The request ID
+        method (str, optional): The HTTP method
+        path (str, optional): The requested path
+        ip_address (str, optional): The IP address of the requester
+    """
+    _current_access.set({
+        "ts": time.time(),
+        "request_id": request_id,
+        "method": method,
+        "endpoint": path,
+        "status": None,
+        "http_status": None,
+        "latency_ms": None,
+        "user_id": None,
+        "token": None,
+        "ip": ip_address,
+        "details": None,
+    })
+
+def end_access(http_status):
+    """
+    Finish the current request's access entry and queue it for writing.
+    
+    Args:
+        http_status (int): The response status code
+    """
+    entry = _current_access.get()
+    if entry is None:
+        return
+    _current_access.set(None)
+    entry["http_status"] = http_status
+    entry["latency_ms"] = round((time.time() - entry["ts"]) * 1000, 3)
+    access_writer.write(entry)
 
-# Create a function to log access attempts
 def log_access(endpoint, user_id=None, token=None, ip_address=None, status=None, details=None):
     """
     Log an access attempt to the system.
     
+    Inside a request started with begin_access, the details are recorded on that
+    request's entry (a later call overrides the status and details); otherwise a
+    separate entry is written.
+    
     Args:
         endpoint (str): The API endpoint that was accessed
         user_id (str, optional): The user ID if available
@@ -80,21 +382,166 @@ def log_access(endpoint, user_id=None, token=None, ip_address=None, status=None,
         status (str, optional): The status of the request (success/failure)
         details (str, optional): Additional details about the request
     """
-    log_record = logging.LogRecord(
-        name='pii_authenticator',
-        level=logging.INFO,
-        pathname='',
-        lineno=0,
-        msg=f"ACCESS: {endpoint} | User: {user_id or 'N/A'} | Token: {token or 'N/A'} | IP: {ip_address or 'N/A'} | Status: {status or 'N/A'} | Details: {details or 'N/A'}",
-        args=(),
-        exc_info=None
-    )
-    log_record.access_log = True
+    entry = _current_access.get()
+    if entry is None:
+        access_writer.write({
+            "ts": time.time(),
+            "request_id": None,
+            "method": None,
+            "endpoint": endpoint,
+            "status": status,
+            "http_status": None,
+            "latency_ms": None,
+            "user_id": user_id,
+            "token": token,
+            "ip": ip_address,
+            "details": details,
+        })
+        return
+
+    entry["endpoint"] = endpoint
+    entry["status"] = status
+    entry["details"] = details
+    if user_id is not None:
+        entry["user_id"] = user_id
+    if token is not None:
+        entry["token"] = token
+    if ip_address is not None:
+        entry["ip"] = ip_address
+
+def get_access_log_stats():
+    """
+    Get counters for the access log writer.
+    
+    Returns:
+        dict: Buffered entries, entries written and write batches
+    """
+    with access_writer._lock:
+        buffered = len(access_writer._buffer)
+    return {
+        "buffered": buffered,
+        "written": access_writer.written,
+        "batches": access_writer.batches,
+    }
+
+class LogSite:
+    """
+    A hot-path logging call site with its own sampling and rate limit.
     
-    # Pass the record to all handlers
-    for handler in logger.handlers:
-        if handler.level <= logging.INFO:
-            handler.handle(log_record)
+    Calls take a %-style message and arguments, which are only formatted when the
+    record is written. Calls ruled out by the logger level, the sample rate or
+    the rate limit return before a LogRecord is created.
+    """
+
+    def __init__(self, name, level=logging.INFO, sample=1, per_second=0):
+        self.name = name
+        self.level = level
+        self.sample = max(1, LOG_SAMPLE_RATES.get(name, sample))
+        self.per_second = LOG_RATE_LIMITS.get(name, per_second)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._window = None
+        self._window_count = 0
+        self.emitted = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def __call__(self, msg, *args, **kwargs):
+        # The logger always has its own level, so this is all isEnabledFor would check
+        if self.level < logger.level:
+            return
+        with self._lock:
+            self._calls += 1
+            if self.sample > 1 and (self._calls - 1) % self.sample:
+                self.sampled_out += 1
+                return
+            if self.per_second:
+                window = int(time.monotonic())
+                if window != self._window:
+                    self._window = window
+                    self._window_count = 0
+                if self._window_count >= self.per_second:
+                    self.rate_limited += 1
+                    return
+                self._window_count += 1
+            self.emitted += 1
+        logger.log(self.level, msg, *args, stacklevel=2, **kwargs)
+
+_log_sites = {}
+_log_sites_lock = threading.Lock()
+
+def log_site(name, level=logging.INFO, sample=1, per_second=0):
+    """
+    Get the log site with the given name, creating it on first use.
+    
+    LOG_SAMPLE_RATES and LOG_RATE_LIMITS override the defaults given here.
+    
+    Args:
+        name (str): Site name, e.g. "token.valid"
+        level (int, optional): The level its records are logged at
+        sample (int, optional): Log 1 in this many calls
+        per_second (int, optional): Log at most this many calls per second (0 = no limit)
+        
+    Returns:
+        LogSite: The site; call it like logger.info
+    """
+    with _log_sites_lock:
+        site = _log_sites.get(name)
+        if site is None:
+            site = _log_sites[name] = LogSite(name, level, sample, per_second)
+    return site
+
+def get_log_site_stats():
+    """
+    Get counters for every log site.
+    
+    Returns:
+        dict: Per site name, its level, sample rate, rate limit and the number of
+        calls emitted, sampled out and rate limited
+    """
+    with _log_sites_lock:
+        sites = list(_log_sites.values())
+    return {
+        site.name: {
+            "level": logging.getLevelName(site.level),
+            "sample": site.sample,
+            "per_second": site.per_second,
+            "emitted": site.emitted,
+            "sampled_out": site.sampled_out,
+            "rate_limited": site.rate_limited,
+        }
+        for site in sites
+    }
+
+def set_log_level(level):
+    """
+    Change the logger level while running.
+    
+    Args:
+        level (str or int): A level name such as "INFO", or a logging level number
+        
+    Returns:
+        bool: True if the level was changed, False if it is not a valid level
+    """
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    if not isinstance(level, int):
+        return False
+    logger.setLevel(level)
+    logger.warning(f"⚠️ Log level set to {logging.getLevelName(level)}")
+    return True
+
+def get_log_level():
+    """Get the current logger level name."""
+    return logging.getLevelName(logger.level)
+
+def _toggle_debug(signum, frame):
+    # No logging here: the interrupted thread may hold the log queue's lock
+    logger.setLevel(logging.INFO if logger.level <= logging.DEBUG else logging.DEBUG)
+
+# Signal handlers can only be installed from the main thread, and not on Windows
+if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGUSR1, _toggle_debug)
 
 # Export the logger
 def get_logger():
@@ -0,0 +1,81 @@
+"""
+Merkle tree module for the PII Authenticator application.
+Builds the trees whose roots are anchored by TokenAuth.anchorRoot and checks
+inclusion proofs the same way TokenAuth.verifyTokenProof does.
+"""
+
+from web3 import Web3
+
+def hash_leaf(token):
+    """
+    Hash a token into a Merkle leaf.
+
+    Leaves are double hashed so a leaf can never be confused with an inner node.
+
+    Args:
+        token (str): The token
+
+    Returns:
+        bytes: The 32-byte leaf hash
+    """
+    return bytes(Web3.keccak(Web3.keccak(text=token)))
+
+def hash_pair(left, right):
+    """Hash two sibling nodes in sorted order, so proofs need no left/right flags."""
+    if right < left:
+        left, right = right, left
+    return bytes(Web3.keccak(left + right))
+
+def build_tree(tokens):
+    """
+    Build a Merkle tree over a list of tokens.
+
+    Args:
+        tokens (list): The tokens to include, in order
+
+    Returns:
+        tuple: (root, proofs) - the root as a 0x-prefixed hex string and a dict
+        mapping each token to its proof, a list of 0x-prefixed sibling hashes
+    """
+    if not tokens:
+        raise ValueError("Cannot build a Merkle tree with no tokens")
+
+    level = [hash_leaf(token) for token in tokens]
+    # Index of the node each token's path currently passes through
+    positions = {token: index for index, token in enumerate(tokens)}
+    proofs = {token: [] for token in tokens}
+
+    while len(level) > 1:
+        for token, position in positions.items():
+            sibling = position ^ 1
+            # An unpaired last node is promoted unchanged and needs no sibling
+            if sibling < len(level):
+                proofs[token].append("0x" + level[sibling].hex())
+            positions[token] = position // 2
+
+        next_level = []
+        for index in range(0, len(level), 2):
+            if index + 1 < len(level):
+                next_level.append(hash_pair(level[index], level[index + 1]))
+            else:
+                next_level.append(level[index])
+        level = next_level
+
+    return "0x" + level[0].hex(), proofs
+
+def verify_proof(token, proof, root):
+    """
+    Check that a token is included under a Merkle root.
+
+    Args:
+        token (str): The token to check
+        proof (list): Sibling hashes from build_tree, as hex strings
+        root (str): The expected root, as a hex string
+
+    Returns:
+        bool: True if the proof leads from the token to the root
+    """
+    computed = hash_leaf(token)
+    for sibling in proof:
+        computed = hash_pair(computed, bytes.fromhex(sibling.removeprefix("0x")))
+    return computed == bytes.fromhex(root.removeprefix("0x"))
@@ -0,0 +1,310 @@
+"""
+Metrics module for the PII Authenticator application.
+Request counters, latency histograms and in-flight gauges kept in process, plus
+the counters other modules already keep (caches, I/O executor, S3 pool, logging),
+served by GET /metrics in the Prometheus text exposition format.
+
+Stages inside a request are timed with the stage() context manager:
+
+    with stage("record_upload"):
+        upload_to_filebase(...)
+
+which feeds pii_stage_duration_seconds{stage="record_upload"} and is also a
+span in the request's trace (see tracing.py). Module stats are
+read when /metrics is scraped, so they cost nothing between scrapes; their
+numeric values are exported as gauges named pii_<collector>_<key>.
+"""
+
+import os
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from logger import get_logger
+import tracing
+
+# Get logger
+logger = get_logger()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Upper bounds in seconds of the latency histogram buckets
+METRICS_BUCKETS = [
+    float(bound) for bound in os.getenv(
+        "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",")
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NAME_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+def _metric_name(name):
+    return _NAME_INVALID.sub("_", name)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+class _Metric:
+    """A metric family with a fixed set of label names."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _labels(self, labelvalues):
+        return tuple(zip(self.labelnames, labelvalues))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{_format_labels(self._labels(labelvalues))} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+
+    type = "gauge"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets or METRICS_BUCKETS)
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = [(labelvalues, list(series)) for labelvalues, series in self._values.items()]
+        for labelvalues, series in values:
+            labels = self._labels(labelvalues)
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+_registry_lock = threading.Lock()
+_metrics = []
+_collectors = []
+
+def _register(metric):
+    with _registry_lock:
+        _metrics.append(metric)
+    return metric
+
+def counter(name, documentation, labelnames=()):
+    """Create and register a Counter."""
+    return _register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=()):
+    """Create and register a Gauge."""
+    return _register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=None):
+    """Create and register a Histogram."""
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+http_requests = counter(
+    "pii_http_requests_total", "HTTP requests handled", ("endpoint", "method", "status")
+)
+http_request_duration = histogram(
+    "pii_http_request_duration_seconds", "HTTP request latency until the response is ready", ("endpoint", "status")
+)
+http_requests_in_flight = gauge(
+    "pii_http_requests_in_flight", "HTTP requests being handled", ("endpoint",)
+)
+stage_duration = histogram(
+    "pii_stage_duration_seconds", "Time spent in each stage of request handling and background work", ("stage",)
+)
+
+def request_started(endpoint):
+    """Count a request as in flight."""
+    if METRICS_ENABLED:
+        http_requests_in_flight.inc(endpoint)
+
+def request_finished(endpoint, method, status, seconds):
+    """
+    Record a handled request.
+
+    Args:
+        endpoint (str): The route pattern, not the raw path, to keep the label set small
+        method (str): The HTTP method
+        status (int): The response status code
+        seconds (float): Time until the response was ready
+    """
+    if METRICS_ENABLED:
+        http_requests_in_flight.dec(endpoint)
+        http_requests.inc(endpoint, method, str(status))
+        http_request_duration.observe(seconds, endpoint, str(status))
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block into pii_stage_duration_seconds and as a trace span; failed blocks are timed too."""
+    start_time = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        if METRICS_ENABLED:
+            stage_duration.observe(time.perf_counter() - start_time, name)
+
+def register_collector(prefix, fn, label=None):
+    """
+    Export a module's stats dict on every scrape.
+
+    Numbers and booleans become gauges named pii_<prefix>_<key>; nested dicts
+    extend the name, and dicts of dicts (e.g. per-call counters) put their keys
+    in a "name" label. Strings and None are skipped.
+
+    Args:
+        prefix (str): Name prefix, e.g. "record_cache"
+        fn (callable): Returns the stats dict, or None when the component is off
+        label (str, optional): If set, fn returns a dict of stats dicts and its
+            keys are exported in this label
+    """
+    with _registry_lock:
+        _collectors.append((prefix, fn, label))
+
+def _flatten(name, stats, labels, samples):
+    for key, value in stats.items():
+        key_name = f"{name}_{_metric_name(str(key))}"
+        if isinstance(value, bool):
+            samples.setdefault(key_name, []).append((labels, int(value)))
+        elif isinstance(value, (int, float)):
+            samples.setdefault(key_name, []).append((labels, value))
+        elif isinstance(value, dict):
+            if value and all(isinstance(item, dict) for item in value.values()):
+                for item_name, item in value.items():
+                    _flatten(key_name, item, labels + (("name", item_name),), samples)
+            else:
+                _flatten(key_name, value, labels, samples)
+
+def _collect():
+    samples = {}
+    with _registry_lock:
+        collectors = list(_collectors)
+    for prefix, fn, label in collectors:
+        try:
+            stats = fn()
+        except Exception as e:
+            logger.warning(f"⚠️ Metrics collector {prefix} failed: {e}")
+            continue
+        if not stats:
+            continue
+        name = f"pii_{_metric_name(prefix)}"
+        if label:
+            for key, item in stats.items():
+                if isinstance(item, dict):
+                    _flatten(name, item, ((label, key),), samples)
+        else:
+            _flatten(name, stats, (), samples)
+    return samples
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The /metrics response body
+    """
+    lines = []
+    with _registry_lock:
+        metrics = list(_metrics)
+    for metric in metrics:
+        lines.extend(metric.render())
+
+    for name, series in _collect().items():
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in series:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+_defaults_registered = False
+
+def register_default_collectors():
+    """Export the stats of the caches, executors, clients and logging pipeline; safe to call repeatedly."""
+    global _defaults_registered
+    with _registry_lock:
+        if _defaults_registered:
+            return
+        _defaults_registered = True
+
+    # Imported here: these modules time their stages with this module
+    import io_executor
+    import token_auth
+    import token_filter
+    import chain_indexer
+    import compression
+    import s3_client
+    import w3_utils
+    import logger as logger_module
+
+    register_collector("io_executor", io_executor.get_stats)
+    register_collector("verify_cache", token_auth.get_verification_cache_stats)
+    register_collector("token_filter", token_filter.get_stats)
+    register_collector("nonce_manager", w3_utils.nonce_manager.get_stats)
+    register_collector("verify_coalescer", w3_utils.get_verify_coalescer_stats)
+    register_collector("s3_client", s3_client.get_stats, label="endpoint")
+    register_collector("exists_cache", w3_utils.get_existence_cache_stats)
+    register_collector("record_cache", w3_utils.get_record_cache_stats)
+    register_collector("compression", compression.get_stats)
+    register_collector("log_queue", logger_module.get_log_queue_stats)
+    register_collector("access_log", logger_module.get_access_log_stats)
+    register_collector("log_site", logger_module.get_log_site_stats, label="site")
+    register_collector("chain_indexer", chain_indexer.get_stats)
+    register_collector("tracing", tracing.get_stats)
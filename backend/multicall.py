@@ -0,0 +1,197 @@
+"""
+Multicall module for the PII Authenticator application.
+Coalesces concurrent TokenAuth.verifyToken reads: calls arriving within a short
+window are sent together as one Multicall3 aggregate3 eth_call, and each caller
+gets its own result back.
+"""
+
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from eth_abi import decode
+from hexbytes import HexBytes
+import io_executor
+from io_executor import DeadlineExceeded
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+# Multicall3 is deployed at the same address on Sepolia, mainnet and most other chains
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+class VerifyTokenCoalescer:
+    """Batches concurrent verifyToken calls into Multicall3 aggregate3 calls."""
+
+    def __init__(self, web3, contract, window=0.005, max_batch=200):
+        """
+        Args:
+            web3 (Web3): The connected Web3 instance
+            contract: The TokenAuth contract
+            window (float): Seconds to wait for more calls after the first one arrives
+            max_batch (int): Most tokens sent in one aggregate3 call
+        """
+        self.contract = contract
+        self.multicall = web3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        self.window = window
+        self.max_batch = max_batch
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+        self.requested = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.tokens_sent = 0
+        self.failures = 0
+
+    def submit(self, token):
+        """
+        Queue a verifyToken read.
+
+        Args:
+            token (str): The token to verify
+
+        Returns:
+            Future: Resolves to the contract's answer for the token
+        """
+        with self._lock:
+            self.requested += 1
+            future = self._pending.get(token)
+            if future is None:
+                future = Future()
+                self._pending[token] = future
+            else:
+                # Another caller is already waiting on the same token
+                self.deduplicated += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="verify-coalescer", daemon=True)
+                self._thread.start()
+
+        self._wake.set()
+        return future
+
+    def verify(self, token, timeout):
+        """
+        Verify a token through the coalescer and wait for the result.
+
+        Args:
+            token (str): The token to verify
+            timeout (float): Seconds to wait
+
+        Returns:
+            bool: The contract's answer
+
+        Raises:
+            DeadlineExceeded: If no answer arrived in time
+        """
+        try:
+            return self.submit(token).result(timeout=timeout)
+        except FutureTimeoutError:
+            raise DeadlineExceeded(f"verifyToken for {token} did not complete within {timeout} seconds")
+
+    def _run(self):
+        """Collect calls for one window at a time and dispatch them."""
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+
+            with self._lock:
+                full = len(self._pending) >= self.max_batch
+            if not full:
+                time.sleep(self.window)
+
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+
+            tokens = list(batch)
+            for start in range(0, len(tokens), self.max_batch):
+                chunk = {token: batch[token] for token in tokens[start:start + self.max_batch]}
+                io_executor.submit("multicall.aggregate3", self._execute, chunk)
+
+    def _execute(self, batch):
+        """Send one aggregate3 call and resolve the waiting futures."""
+        tokens = list(batch)
+        try:
+            calls = [
+                (self.contract.address, True, HexBytes(self.contract.encode_abi("verifyToken", args=[token])))
+                for token in tokens
+            ]
+            results = self.multicall.functions.aggregate3(calls).call()
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.error(f"❌ Multicall verifyToken batch of {len(tokens)} failed: {e}")
+            logger.debug(traceback.format_exc())
+            for future in batch.values():
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.tokens_sent += len(tokens)
+        logger.debug(f"Multicall resolved {len(tokens)} verifyToken reads in one eth_call")
+
+        for index, token in enumerate(tokens):
+            future = batch[token]
+            if index >= len(results):
+                future.set_exception(RuntimeError(f"aggregate3 returned no result for {token}"))
+                continue
+            success, return_data = results[index]
+            if not success:
+                future.set_exception(RuntimeError(f"verifyToken reverted for {token}"))
+                continue
+            try:
+                # Empty returnData with success means the contract has no code at that address
+                future.set_result(decode(["bool"], return_data)[0])
+            except Exception as e:
+                future.set_exception(RuntimeError(f"verifyToken returned undecodable data for {token}: {e}"))
+
+    def get_stats(self):
+        """Return counters showing how many RPC requests coalescing saved."""
+        with self._lock:
+            return {
+                "requested": self.requested,
+                "deduplicated": self.deduplicated,
+                "batches": self.batches,
+                "tokens_sent": self.tokens_sent,
+                "failures": self.failures,
+                "rpc_calls_saved": max(self.requested - self.batches - self.failures, 0),
+            }
@@ -0,0 +1,94 @@
+"""
+Nonce manager module for the PII Authenticator application.
+Hands out transaction nonces for the service account from a local counter so
+transactions can be pipelined without a get_transaction_count round trip each.
+"""
+
+import threading
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+# Substrings of node errors that mean our local nonce is out of step with the chain
+NONCE_ERROR_MARKERS = (
+    "nonce too low",
+    "nonce too high",
+    "replacement transaction underpriced",
+    "already known",
+    "known transaction",
+    "invalid nonce",
+)
+
+def is_nonce_error(error):
+    """
+    Check whether an exception raised while sending a transaction is a nonce conflict.
+
+    Args:
+        error (Exception): The exception raised by the provider
+
+    Returns:
+        bool: True if the local nonce should be resynced from the chain
+    """
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERROR_MARKERS)
+
+class NonceManager:
+    """Thread-safe, monotonically increasing nonce allocator for one account."""
+
+    def __init__(self, web3, address):
+        self.web3 = web3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+        self.allocated = 0
+        self.resyncs = 0
+
+    def _sync(self):
+        """Load the next nonce from the chain, counting transactions still in the mempool."""
+        self._next_nonce = self.web3.eth.get_transaction_count(self.address, "pending")
+        self.resyncs += 1
+        logger.info(f"Nonce manager synced for {self.address}: next nonce {self._next_nonce}")
+
+    def allocate(self):
+        """
+        Reserve the next nonce.
+
+        Returns:
+            int: A nonce no other caller in this process will receive
+        """
+        with self._lock:
+            if self._next_nonce is None:
+                self._sync()
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            self.allocated += 1
+            return nonce
+
+    def release(self, nonce):
+        """
+        Give back a nonce whose transaction never reached the network.
+
+        Only the most recently allocated nonce can be reused; anything older
+        leaves a gap, so the counter is resynced on next allocation instead.
+        """
+        with self._lock:
+            if self._next_nonce is not None and nonce == self._next_nonce - 1:
+                self._next_nonce = nonce
+            else:
+                self._next_nonce = None
+
+    def resync(self):
+        """Forget the local counter so the next allocation reloads it from the chain."""
+        with self._lock:
+            self._next_nonce = None
+        logger.warning(f"⚠️ Nonce manager for {self.address} will resync from the chain")
+
+    def get_stats(self):
+        """Return counters describing allocator activity."""
+        with self._lock:
+            return {
+                "next_nonce": self._next_nonce,
+                "allocated": self.allocated,
+                "resyncs": self.resyncs,
+            }
@@ -0,0 +1,145 @@
+"""
+Record cache module for the PII Authenticator application.
+A size-bounded LRU cache of retrieved records, keyed by storage key and ETag, with
+a time-to-live. Entries are kept AES-GCM encrypted under a key that exists only in
+this process's memory and are decrypted on each hit, so caching a record does not
+leave its plaintext sitting in the heap.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# AES-GCM nonce and tag sizes, stored alongside each entry
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+
+class EncryptedRecordCache:
+    """Byte-bounded LRU cache whose entries are encrypted at rest in memory and expire after a TTL."""
+
+    def __init__(self, max_bytes, ttl, max_object_bytes):
+        """
+        Args:
+            max_bytes (int): Maximum plaintext bytes held before the least recently used entries are evicted
+            ttl (float): Seconds an entry may be served without asking storage again
+            max_object_bytes (int): Larger objects are not cached
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_object_bytes = max_object_bytes
+        # Generated per process and never persisted; a restart makes old entries unreadable anyway
+        self._aead = AESGCM(AESGCM.generate_key(bit_length=256))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    @staticmethod
+    def _aad(key, etag):
+        # Binds each ciphertext to its key and version, so entries cannot be swapped
+        return f"{key}\0{etag}".encode("utf-8")
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry[2]
+
+    def get(self, key, etag=None):
+        """
+        Look up an object, counting a hit or a miss.
+
+        Args:
+            key (str): The storage key
+            etag (str, optional): The version the caller needs; any cached version
+                within the TTL is accepted when omitted
+
+        Returns:
+            tuple: (bytes, etag), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            cached_etag, blob, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if etag is not None and etag != cached_etag:
+                # The object was replaced in storage
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        # Decrypt outside the lock; AESGCM is safe to share between threads
+        data = self._aead.decrypt(blob[:_NONCE_SIZE], blob[_NONCE_SIZE:], self._aad(key, cached_etag))
+        return data, cached_etag
+
+    def set(self, key, data, etag):
+        """
+        Store an object.
+
+        Args:
+            key (str): The storage key
+            data (bytes): The object contents
+            etag (str): The entity tag of this version
+        """
+        size = len(data)
+        if size > self.max_object_bytes or size > self.max_bytes:
+            return
+
+        nonce = os.urandom(_NONCE_SIZE)
+        blob = nonce + self._aead.encrypt(nonce, bytes(data), self._aad(key, etag))
+        expires_at = time.monotonic() + self.ttl
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (etag, blob, size, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove a key if present."""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        """Remove every entry; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        """Return the cache counters and memory gauges."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                # Ciphertext plus nonce and tag for every entry
+                "encrypted_bytes": self.bytes + len(self._entries) * (_NONCE_SIZE + _TAG_SIZE),
+                "utilization": self.bytes / self.max_bytes if self.max_bytes else 0.0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale": self.stale,
+            }
@@ -0,0 +1,178 @@
+"""
+Record format module for the PII Authenticator application.
+Serializes stored PII records in a compact, versioned binary layout and reads both
+that layout and the indented JSON records written by earlier versions.
+
+Format version 1 (first byte 0x01):
+
+    header    34 bytes  struct ">BBd10HI": the version, flags (bit 0: the record
+                        has a document), the timestamp as a float64 (NaN if
+                        absent), the length in characters of each slot (0xFFFF =
+                        null), and the length in characters of the extras
+    text      UTF-8     the slots, then a compact JSON object with every other
+                        key, or nothing if there is none
+
+The slots are name, email, dob, phone, id_type, id_number and user_id, followed
+by the document's file_url, file_name and content_type.
+
+The text is decoded in one pass and sliced by the header lengths, so reading a
+record is a single struct unpack and a single UTF-8 decode.
+
+A legacy record is a JSON object, so its first non-whitespace byte is "{" and it
+can never be mistaken for a versioned record. Records holding strings that cannot
+be encoded as UTF-8, such as lone surrogates, are still written as compact JSON
+with ASCII escapes, so they round-trip unchanged.
+"""
+
+import json
+import math
+import struct
+
+FORMAT_V1 = 1
+CURRENT_FORMAT = FORMAT_V1
+
+# Fixed slots, in the order they are written
+FIELDS = ("name", "email", "dob", "phone", "id_type", "id_number", "user_id")
+DOCUMENT_FIELDS = ("file_url", "file_name", "content_type")
+
+_HEADER = struct.Struct(">BBd10HI")
+_NULL = 0xFFFF
+_HAS_DOCUMENT = 0x01
+_COMPACT_JSON = {"separators": (",", ":"), "ensure_ascii": False}
+
+def _fits_slots(document):
+    """Whether document metadata can be stored in the document slots."""
+    return (
+        isinstance(document, dict)
+        and set(document) <= set(DOCUMENT_FIELDS)
+        and all(value is None or (isinstance(value, str) and len(value) < _NULL) for value in document.values())
+    )
+
+def encode_record(pii_data):
+    """
+    Serialize a PII record in the current format.
+
+    Args:
+        pii_data (dict): The record, as built by /encrypt
+
+    Returns:
+        bytes: The encoded record
+    """
+    lengths = []
+    texts = []
+    extras = {}
+
+    for field in FIELDS:
+        value = pii_data.get(field)
+        if isinstance(value, str) and len(value) < _NULL:
+            lengths.append(len(value))
+            texts.append(value)
+        else:
+            # Non-string and oversized values keep their JSON form in the extras
+            lengths.append(_NULL)
+            if value is not None:
+                extras[field] = value
+
+    flags = 0
+    document = pii_data.get("document")
+    if "document" in pii_data and _fits_slots(document):
+        flags |= _HAS_DOCUMENT
+        for field in DOCUMENT_FIELDS:
+            value = document.get(field)
+            lengths.append(_NULL if value is None else len(value))
+            if value is not None:
+                texts.append(value)
+    else:
+        lengths.extend([_NULL] * len(DOCUMENT_FIELDS))
+
+    timestamp = pii_data.get("timestamp")
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        timestamp = float(timestamp)
+    else:
+        if "timestamp" in pii_data:
+            extras["timestamp"] = timestamp
+        timestamp = math.nan
+
+    for key, value in pii_data.items():
+        if key not in FIELDS and key != "timestamp" and not (key == "document" and flags & _HAS_DOCUMENT):
+            extras[key] = value
+
+    extras_json = json.dumps(extras, **_COMPACT_JSON) if extras else ""
+    texts.append(extras_json)
+
+    try:
+        text = "".join(texts).encode("utf-8")
+    except UnicodeEncodeError:
+        # Lone surrogates (e.g. from a "\ud800" escape in request JSON) have no
+        # UTF-8 form; keep them as JSON escapes in a legacy record instead
+        return json.dumps(pii_data, separators=(",", ":")).encode("ascii")
+
+    header = _HEADER.pack(CURRENT_FORMAT, flags, timestamp, *lengths, len(extras_json))
+    return header + text
+
+def is_legacy_record(data):
+    """Whether stored bytes are a legacy JSON record."""
+    return data.lstrip()[:1] == b"{"
+
+def decode_record(data):
+    """
+    Parse a stored record in any supported format.
+
+    Args:
+        data (bytes): The stored object
+
+    Returns:
+        dict: The PII record
+
+    Raises:
+        ValueError: If the format version is unknown or the record is truncated
+    """
+    if not data:
+        raise ValueError("Empty record")
+    if is_legacy_record(data):
+        return json.loads(data)
+    if data[0] != FORMAT_V1:
+        raise ValueError(f"Unknown record format version {data[0]}")
+
+    try:
+        _, flags, timestamp, *lengths, extras_length = _HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f"Truncated record: {e}")
+    text = data[_HEADER.size:].decode("utf-8")
+
+    values = []
+    offset = 0
+    for length in lengths:
+        if length == _NULL:
+            values.append(None)
+        else:
+            values.append(text[offset:offset + length])
+            offset += length
+    if offset + extras_length != len(text):
+        raise ValueError("Truncated record: text does not match the header lengths")
+
+    record = dict(zip(FIELDS, values))
+    if not math.isnan(timestamp):
+        record["timestamp"] = timestamp
+    if flags & _HAS_DOCUMENT:
+        record["document"] = dict(zip(DOCUMENT_FIELDS, values[len(FIELDS):]))
+    if extras_length:
+        record.update(json.loads(text[offset:]))
+    return record
+
+def record_to_json(data):
+    """
+    Get a stored record as JSON bytes for API responses.
+
+    Legacy records are returned unchanged; versioned ones are decoded and
+    re-serialized as compact JSON.
+
+    Args:
+        data (bytes): The stored object
+
+    Returns:
+        bytes: The record as JSON
+    """
+    if is_legacy_record(data):
+        return data
+    return json.dumps(decode_record(data), **_COMPACT_JSON).encode("utf-8")
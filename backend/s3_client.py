@@ -0,0 +1,154 @@
+"""
+S3 client module for the PII Authenticator application.
+Builds the Filebase S3 clients with a tuned botocore configuration (connection
+pool size, timeouts, adaptive retries, TCP keep-alive) and shares one client per
+set of credentials across threads, with metrics that show when the connection
+pool is the bottleneck.
+"""
+
+import os
+import threading
+import boto3
+from botocore.config import Config
+from io_executor import IO_EXECUTOR_WORKERS
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+# Every I/O executor thread should be able to hold a connection at once
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", str(IO_EXECUTOR_WORKERS)))
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "3"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "10"))
+# Retries after the first attempt, as botocore counts them
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "3"))
+# "adaptive" adds client-side rate limiting on top of the standard retry rules
+S3_RETRY_MODE = os.getenv("S3_RETRY_MODE", "adaptive")
+S3_TCP_KEEPALIVE = os.getenv("S3_TCP_KEEPALIVE", "true").lower() == "true"
+
+def config_kwargs():
+    """
+    Get the tuned client settings as keyword arguments.
+
+    Shared with the async backend, which passes them to aiobotocore's AioConfig.
+
+    Returns:
+        dict: Keyword arguments for botocore.config.Config
+    """
+    return {
+        "max_pool_connections": S3_MAX_POOL_CONNECTIONS,
+        "connect_timeout": S3_CONNECT_TIMEOUT,
+        "read_timeout": S3_READ_TIMEOUT,
+        "retries": {"max_attempts": S3_MAX_ATTEMPTS, "mode": S3_RETRY_MODE},
+        "tcp_keepalive": S3_TCP_KEEPALIVE,
+    }
+
+class PoolMetrics:
+    """Counts HTTP requests in flight on a client to show connection pool saturation."""
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        # Requests sent while every pooled connection was busy, so they waited for one
+        self.saturated = 0
+
+    def on_before_send(self, **kwargs):
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.pool_size:
+                self.saturated += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def on_response_received(self, exception=None, **kwargs):
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if exception is not None:
+                self.errors += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "saturated": self.saturated,
+                "utilization": self.in_flight / self.pool_size if self.pool_size else 0.0,
+            }
+
+_clients_lock = threading.Lock()
+_clients = {}
+_metrics = {}
+
+def create_s3_client(access_key, secret_key, endpoint_url):
+    """
+    Create an S3 client with the tuned configuration.
+
+    Args:
+        access_key (str): The access key ID
+        secret_key (str): The secret access key
+        endpoint_url (str): The S3 endpoint, e.g. https://s3.filebase.com
+
+    Returns:
+        tuple: (client, PoolMetrics)
+    """
+    # boto3's default session is not thread-safe, so each client gets its own
+    session = boto3.session.Session()
+    client = session.client(
+        "s3",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        endpoint_url=endpoint_url,
+        config=Config(**config_kwargs()),
+    )
+
+    metrics = PoolMetrics(S3_MAX_POOL_CONNECTIONS)
+    client.meta.events.register("before-send.s3", metrics.on_before_send)
+    client.meta.events.register("response-received.s3", metrics.on_response_received)
+
+    logger.debug(
+        f"S3 client for {endpoint_url}: pool={S3_MAX_POOL_CONNECTIONS}, "
+        f"timeouts={S3_CONNECT_TIMEOUT}/{S3_READ_TIMEOUT}s, retries={S3_MAX_ATTEMPTS} ({S3_RETRY_MODE})"
+    )
+    return client, metrics
+
+def get_shared_client(access_key, secret_key, endpoint_url):
+    """
+    Get the process-wide S3 client for a set of credentials, creating it once.
+
+    Clients are thread-safe once created, so every thread uses the same client
+    and its connection pool.
+
+    Args:
+        access_key (str): The access key ID
+        secret_key (str): The secret access key
+        endpoint_url (str): The S3 endpoint
+
+    Returns:
+        The shared boto3 S3 client
+    """
+    key = (access_key, endpoint_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client, metrics = create_s3_client(access_key, secret_key, endpoint_url)
+            _clients[key] = client
+            _metrics[endpoint_url] = metrics
+    return client
+
+def get_stats():
+    """
+    Get connection pool metrics for every shared client.
+
+    Returns:
+        dict: Pool metrics keyed by endpoint URL
+    """
+    with _clients_lock:
+        metrics = dict(_metrics)
+    return {endpoint_url: m.get_stats() for endpoint_url, m in metrics.items()}
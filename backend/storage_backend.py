@@ -0,0 +1,584 @@
+"""
+Storage backend module for the PII Authenticator application.
+Defines the StorageBackend interface used for PII records and its implementations:
+
+    FilebaseBackend       - the Filebase S3 bucket used in production
+    LocalDirectoryBackend - a sharded local directory with atomic writes, a stand-in
+                            for S3 that runs at disk speed
+    MemoryBackend         - a process-local dict, for load tests
+
+All three are used through the same code path in w3_utils, so switching between
+them only changes where the bytes go.
+"""
+
+import io
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+# Local directory layout and durability
+LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", "storage")
+# Number of two-character directory levels above each file, e.g. storage/3f/a2/<key>
+LOCAL_STORAGE_FANOUT = int(os.getenv("LOCAL_STORAGE_FANOUT", "2"))
+# none: leave flushing to the OS; file: fsync each file before it is renamed into
+# place; full: also fsync the directory so the rename itself survives a crash
+LOCAL_STORAGE_FSYNC = os.getenv("LOCAL_STORAGE_FSYNC", "file").lower()
+
+# Streams larger than the threshold go to S3 as multipart uploads, sending parts in parallel
+STORAGE_MULTIPART_THRESHOLD = int(os.getenv("STORAGE_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+STORAGE_MULTIPART_CHUNK_SIZE = int(os.getenv("STORAGE_MULTIPART_CHUNK_SIZE", str(8 * 1024 * 1024)))
+STORAGE_MULTIPART_CONCURRENCY = int(os.getenv("STORAGE_MULTIPART_CONCURRENCY", "4"))
+# Read size when copying a stream to local storage
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+FSYNC_NONE = "none"
+FSYNC_FILE = "file"
+FSYNC_FULL = "full"
+
+_TMP_SUFFIX = ".tmp"
+# Local objects start with a header holding their metadata, so the object and its
+# metadata are replaced together by one rename:
+#     magic (8 bytes) | metadata length (4 bytes, big-endian) | metadata JSON | data
+_HEADER_MAGIC = b"\x00PIIOBJ1"
+_HEADER_LENGTH_BYTES = 4
+# Older versions kept the metadata in a JSON file next to a headerless object
+_META_SUFFIX = ".meta"
+
+class IterableStream(io.RawIOBase):
+    """Read-only file-like view of an iterable of byte chunks, e.g. a generator."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            try:
+                self._buffer = bytes(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        # Lets a generator release what it holds, e.g. a stream it reads from
+        if hasattr(self._chunks, "close"):
+            self._chunks.close()
+        super().close()
+
+class _RangeReader(io.RawIOBase):
+    """Reads at most length bytes from an open file, then reports end of file."""
+
+    def __init__(self, f, length):
+        self._file = f
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        data = self._file.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def as_stream(data):
+    """
+    Wrap an upload source as a readable binary stream.
+
+    Args:
+        data: A file-like object with read(), or an iterable of bytes chunks
+
+    Returns:
+        A file-like object
+    """
+    if hasattr(data, "read"):
+        return data
+    return io.BufferedReader(IterableStream(data), buffer_size=STREAM_CHUNK_SIZE)
+
+class StorageBackend:
+    """Interface for record storage. Errors other than a missing key are raised to the caller."""
+
+    name = "storage"
+
+    def put(self, key, data, metadata=None):
+        """
+        Store an object, replacing any existing object with the same key.
+
+        Args:
+            key (str): The object key, e.g. "<token>.json"
+            data (bytes): The object contents
+            metadata (dict, optional): String key/value pairs stored with the object
+        """
+        raise NotImplementedError
+
+    def put_stream(self, key, stream, metadata=None):
+        """
+        Store an object from a stream without holding it all in memory.
+
+        Args:
+            key (str): The object key
+            stream: A readable binary file-like object
+            metadata (dict, optional): String key/value pairs stored with the object
+        """
+        self.put(key, stream.read(), metadata)
+
+    def get(self, key):
+        """
+        Read an object.
+
+        Args:
+            key (str): The object key
+
+        Returns:
+            bytes: The object contents, or None if there is no such object
+        """
+        raise NotImplementedError
+
+    def get_with_metadata(self, key):
+        """
+        Read an object together with the entity tag and metadata of the version that was read.
+
+        Args:
+            key (str): The object key
+
+        Returns:
+            tuple: (bytes, etag, metadata dict), or None if there is no such object
+        """
+        raise NotImplementedError
+
+    def stat(self, key):
+        """
+        Get an object's size, entity tag and metadata without reading it.
+
+        Args:
+            key (str): The object key
+
+        Returns:
+            dict: {"size": int, "etag": str, "metadata": dict}, or None if there is no such object
+        """
+        raise NotImplementedError
+
+    def open(self, key, start=0, end=None):
+        """
+        Open an object, or a byte range of it, for streaming reads.
+
+        Args:
+            key (str): The object key
+            start (int): First byte to read
+            end (int, optional): Last byte to read, inclusive; None reads to the end
+
+        Returns:
+            A readable binary file-like object the caller must close, or None if
+            there is no such object
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        """
+        Check whether an object exists.
+
+        Args:
+            key (str): The object key
+
+        Returns:
+            bool: True if the object exists
+        """
+        raise NotImplementedError
+
+    def list_keys(self):
+        """
+        List every object key.
+
+        Returns:
+            iterable: The keys
+        """
+        raise NotImplementedError
+
+def _is_not_found(error):
+    """Whether an S3 ClientError means the key does not exist (HEAD errors carry no body, only the status)."""
+    return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "NotFound", "404")
+
+class FilebaseBackend(StorageBackend):
+    """Objects in a Filebase (S3-compatible) bucket."""
+
+    name = "filebase"
+
+    def __init__(self, client, bucket):
+        """
+        Args:
+            client: A boto3 S3 client, normally from s3_client.get_shared_client
+            bucket (str): The bucket name
+        """
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = TransferConfig(
+            multipart_threshold=STORAGE_MULTIPART_THRESHOLD,
+            multipart_chunksize=STORAGE_MULTIPART_CHUNK_SIZE,
+            max_concurrency=STORAGE_MULTIPART_CONCURRENCY,
+        )
+
+    def put(self, key, data, metadata=None):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, Metadata=metadata or {})
+
+    def put_stream(self, key, stream, metadata=None):
+        # upload_fileobj switches to a parallel multipart upload above the threshold
+        self.client.upload_fileobj(
+            stream, self.bucket, key,
+            ExtraArgs={"Metadata": metadata or {}},
+            Config=self.transfer_config
+        )
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def get_with_metadata(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return response["Body"].read(), response["ETag"].strip('"'), response.get("Metadata", {})
+
+    def stat(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return {"size": response["ContentLength"], "etag": response["ETag"].strip('"'), "metadata": response.get("Metadata", {})}
+
+    def open(self, key, start=0, end=None):
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        # StreamingBody reads from the connection as the caller consumes it
+        return response["Body"]
+
+    def exists(self, key):
+        # HEAD matches the exact key, unlike a prefix listing, and is a lighter request
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if _is_not_found(e):
+                return False
+            raise
+        return True
+
+    def list_keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket):
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+class LocalDirectoryBackend(StorageBackend):
+    """
+    Objects as files in a sharded directory tree.
+
+    Keys are spread over LOCAL_STORAGE_FANOUT levels of two-character directories
+    taken from a hash of the key, so no directory grows large. Writes go to a
+    temporary file that is renamed into place, so readers never see a partial
+    object, and the metadata is a header in the same file. An in-memory index of
+    keys answers lookups of known keys without touching the disk; other keys are
+    looked for on disk, since other processes may share the directory. Files
+    written flat into the root directory by older versions are still found.
+
+    Keys come from request tokens, so a key must be a plain file name and every
+    path used must resolve inside the root; anything else raises ValueError.
+    """
+
+    name = "local"
+
+    def __init__(self, root=LOCAL_STORAGE_PATH, fanout=LOCAL_STORAGE_FANOUT, fsync=LOCAL_STORAGE_FSYNC):
+        """
+        Args:
+            root (str): The root directory
+            fanout (int): Directory levels above each file
+            fsync (str): One of "none", "file" or "full"
+        """
+        if fsync not in (FSYNC_NONE, FSYNC_FILE, FSYNC_FULL):
+            logger.warning(f"⚠️ Unknown LOCAL_STORAGE_FSYNC {fsync!r}, using {FSYNC_FILE}")
+            fsync = FSYNC_FILE
+        self.root = root
+        self._real_root = os.path.realpath(root)
+        self.fanout = fanout
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # key -> path, built on first use
+        self._index = None
+
+    @staticmethod
+    def _check_key(key):
+        """Reject keys that are not a plain file name, such as "../x.json" or "a/b.json"."""
+        if (
+            not isinstance(key, str) or not key or ".." in key or "/" in key or "\0" in key
+            or os.sep in key or (os.altsep and os.altsep in key)
+        ):
+            raise ValueError(f"Invalid storage key: {key!r}")
+
+    def _is_contained(self, path):
+        """Whether path, with symlinks resolved, is inside the root directory."""
+        return os.path.realpath(path).startswith(self._real_root + os.sep)
+
+    def _shard_path(self, key):
+        self._check_key(key)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        shards = [digest[2 * level:2 * level + 2] for level in range(self.fanout)]
+        return os.path.join(self.root, *shards, key)
+
+    def _build_index(self):
+        """Scan the directory tree once; afterwards put() keeps the index current."""
+        index = {}
+        if os.path.isdir(self.root):
+            for directory, _, file_names in os.walk(self.root):
+                depth = os.path.relpath(directory, self.root).count(os.sep) + 1 if directory != self.root else 0
+                if depth not in (0, self.fanout):
+                    continue
+                for file_name in file_names:
+                    if file_name.endswith((_TMP_SUFFIX, _META_SUFFIX)):
+                        continue
+                    path = os.path.join(directory, file_name)
+                    # Sharded files take precedence over legacy flat ones
+                    if depth == self.fanout or file_name not in index:
+                        index[file_name] = path
+        logger.info(f"✅ Local storage index built with {len(index)} objects under {self.root}")
+        return index
+
+    def _get_index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+        return self._index
+
+    def _find(self, key):
+        """Return the path of the key's file, or None if there is none."""
+        shard_path = self._shard_path(key)
+        index = self._get_index()
+        path = index.get(key)
+        if path == shard_path and self._is_contained(path):
+            return path
+        # Not written by this process since the index was built: another process
+        # sharing the directory may have written it, sharded or (older versions) flat
+        for candidate in (shard_path, path, os.path.join(self.root, key)):
+            if candidate is not None and os.path.isfile(candidate) and self._is_contained(candidate):
+                with self._lock:
+                    index[key] = candidate
+                return candidate
+        return None
+
+    def put(self, key, data, metadata=None):
+        self._write(key, lambda f: f.write(data), metadata)
+
+    def put_stream(self, key, stream, metadata=None):
+        self._write(key, lambda f: shutil.copyfileobj(stream, f, STREAM_CHUNK_SIZE), metadata)
+
+    def _replace(self, path, write):
+        """Write path through a temporary file that is renamed into place."""
+        tmp_path = f"{path}.{uuid.uuid4().hex}{_TMP_SUFFIX}"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+                if self.fsync != FSYNC_NONE:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write(self, key, write, metadata=None):
+        """Write a file with its metadata header atomically."""
+        path = self._shard_path(key)
+        if not self._is_contained(path):
+            raise ValueError(f"Storage key {key!r} resolves outside {self.root}")
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        header = json.dumps(metadata or {}).encode()
+
+        def write_object(f):
+            f.write(_HEADER_MAGIC + len(header).to_bytes(_HEADER_LENGTH_BYTES, "big") + header)
+            write(f)
+
+        self._replace(path, write_object)
+        # Left over from an older version; the header now takes precedence
+        if os.path.exists(path + _META_SUFFIX):
+            os.remove(path + _META_SUFFIX)
+
+        if self.fsync == FSYNC_FULL:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+        index = self._get_index()
+        with self._lock:
+            index[key] = path
+
+    @staticmethod
+    def _read_header(f, path):
+        """
+        Read an open object's metadata and leave f at the start of its data.
+
+        Returns:
+            tuple: (metadata, header_size)
+        """
+        prefix = f.read(len(_HEADER_MAGIC) + _HEADER_LENGTH_BYTES)
+        if prefix[:len(_HEADER_MAGIC)] == _HEADER_MAGIC and len(prefix) == len(_HEADER_MAGIC) + _HEADER_LENGTH_BYTES:
+            length = int.from_bytes(prefix[len(_HEADER_MAGIC):], "big")
+            return json.loads(f.read(length)), len(prefix) + length
+
+        # Written by an older version: no header, metadata in a file alongside
+        f.seek(0)
+        try:
+            with open(path + _META_SUFFIX, "rb") as meta:
+                return json.loads(meta.read()), 0
+        except FileNotFoundError:
+            return {}, 0
+
+    def get(self, key):
+        result = self.get_with_metadata(key)
+        return None if result is None else result[0]
+
+    def get_with_metadata(self, key):
+        path = self._find(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                # The open file is the version being read, even if it is replaced meanwhile
+                metadata, _ = self._read_header(f, path)
+                data, etag = f.read(), self._etag(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            return None
+        return data, etag, metadata
+
+    @staticmethod
+    def _etag(info):
+        # Files are only ever replaced whole, so size and mtime identify the contents
+        return f"{info.st_size:x}-{info.st_mtime_ns:x}"
+
+    def stat(self, key):
+        path = self._find(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                metadata, header_size = self._read_header(f, path)
+                info = os.fstat(f.fileno())
+        except FileNotFoundError:
+            return None
+        return {"size": info.st_size - header_size, "etag": self._etag(info), "metadata": metadata}
+
+    def open(self, key, start=0, end=None):
+        path = self._find(key)
+        if path is None:
+            return None
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        _, header_size = self._read_header(f, path)
+        f.seek(header_size + start)
+        if end is None:
+            return f
+        return _RangeReader(f, end - start + 1)
+
+    def exists(self, key):
+        return self._find(key) is not None
+
+    def list_keys(self):
+        # Rescan so keys written by other processes are listed too
+        keys = set(self._build_index())
+        index = self._get_index()
+        with self._lock:
+            keys.update(index)
+        return list(keys)
+
+class MemoryBackend(StorageBackend):
+    """Objects in a dict; nothing survives a restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+        self._metadata = {}
+
+    def put(self, key, data, metadata=None):
+        with self._lock:
+            self._objects[key] = bytes(data)
+            if metadata:
+                self._metadata[key] = dict(metadata)
+            else:
+                self._metadata.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            return self._objects.get(key)
+
+    def get_with_metadata(self, key):
+        with self._lock:
+            data = self._objects.get(key)
+            metadata = self._metadata.get(key, {})
+        return None if data is None else (data, hashlib.md5(data).hexdigest(), dict(metadata))
+
+    def stat(self, key):
+        with self._lock:
+            data = self._objects.get(key)
+            metadata = self._metadata.get(key, {})
+        if data is None:
+            return None
+        return {"size": len(data), "etag": hashlib.md5(data).hexdigest(), "metadata": dict(metadata)}
+
+    def open(self, key, start=0, end=None):
+        with self._lock:
+            data = self._objects.get(key)
+        if data is None:
+            return None
+        return io.BytesIO(data[start:None if end is None else end + 1])
+
+    def exists(self, key):
+        with self._lock:
+            return key in self._objects
+
+    def list_keys(self):
+        with self._lock:
+            return list(self._objects)
@@ -5,6 +5,7 @@ This script provides functions to test the backend API endpoints.
 It can be run as a standalone script or used interactively in a Python shell.
 """
 
+import os
 import requests
 import json
 import time
@@ -114,6 +115,154 @@ def test_token_generation(user_id=None, id_number=None):
         print_error(f"Error: {str(e)}")
         return None
 
+def test_batch_encryption(count=3):
+    """
+    Test the bulk enrollment endpoint, including one invalid record.
+    
+    Args:
+        count (int, optional): Number of valid records to send
+    
+    Returns:
+        list: The tokens generated for the valid records
+    """
+    print_header("Testing Batch Token Generation Endpoint")
+    
+    records = [
+        {
+            "user_id": f"batch_user_{int(time.time())}_{index}",
+            "name": f"Batch User {index}",
+            "id_number": f"ID{int(time.time())}{index}"
+        }
+        for index in range(count)
+    ]
+    # A record missing required fields should fail on its own
+    records.append({"user_id": "batch_user_invalid"})
+    
+    print_info(f"Sending {len(records)} records ({count} valid, 1 invalid)")
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/encrypt_batch",
+            json={"records": records},
+            headers={"Content-Type": "application/json"}
+        )
+        print_response(response)
+        
+        if response.status_code in (200, 207):
+            body = response.json()
+            tokens = [result["token"] for result in body.get("results", []) if "token" in result]
+            
+            if body.get("succeeded") == count and body.get("failed") == 1:
+                print_success(f"Batch enrolled {count} records and rejected the invalid one")
+            else:
+                print_error(f"Unexpected batch result: {body.get('succeeded')} succeeded, {body.get('failed')} failed")
+            
+            return tokens
+        else:
+            print_error(f"Batch token generation failed with status code {response.status_code}")
+            return []
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return []
+
+def test_document_upload(size=5 * 1024 * 1024):
+    """
+    Test enrolling a record together with an uploaded document.
+    
+    Args:
+        size (int, optional): Size in bytes of the generated test document
+    
+    Returns:
+        str: The generated token, or None if the request failed
+    """
+    print_header("Testing Token Generation With Document Upload")
+    
+    fields = {
+        "user_id": f"doc_user_{int(time.time())}",
+        "name": "Document User",
+        "id_type": "passport",
+        "id_number": f"ID{int(time.time())}"
+    }
+    document = b"\x89PNG\r\n\x1a\n" + os.urandom(size)
+    
+    print_info(f"Sending form with a {len(document)} byte document")
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/encrypt",
+            data=fields,
+            files={"document": ("id_scan.png", document, "image/png")}
+        )
+        print_response(response)
+        
+        if response.status_code == 200:
+            body = response.json()
+            
+            if body.get("document_url"):
+                print_success(f"Token {body.get('token')} generated with document at {body['document_url']}")
+            else:
+                print_error("Response has no document_url")
+            
+            return body.get("token")
+        else:
+            print_error(f"Document upload failed with status code {response.status_code}")
+            return None
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return None
+
+def test_retrieval(token=None):
+    """
+    Test the streaming retrieval endpoint with full, ranged and conditional requests.
+    
+    Args:
+        token (str, optional): Token with a stored document. If None, a new one will be enrolled.
+    
+    Returns:
+        bool: True if every retrieval check passed, False otherwise
+    """
+    print_header("Testing Retrieval Endpoint")
+    
+    if token is None:
+        print_info("No token provided, enrolling a record with a document...")
+        token = test_document_upload(size=64 * 1024)
+        
+        if token is None:
+            print_error("Failed to enroll a record for retrieval")
+            return False
+    
+    print_info(f"Retrieving record and document of token: {token}")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/retrieve", params={"token": token})
+        print_response(response)
+        if response.status_code != 200:
+            print_error(f"Record retrieval failed with status code {response.status_code}")
+            return False
+        etag = response.headers.get("ETag")
+        print_success(f"Record retrieved ({len(response.content)} bytes, ETag {etag})")
+        
+        response = requests.get(f"{BASE_URL}/retrieve", params={"token": token}, headers={"If-None-Match": etag})
+        if response.status_code != 304:
+            print_error(f"Expected 304 for a matching ETag, got {response.status_code}")
+            return False
+        print_success("Correctly returned 304 for a matching ETag")
+        
+        response = requests.get(
+            f"{BASE_URL}/retrieve",
+            params={"token": token, "part": "document"},
+            headers={"Range": "bytes=0-1023"}
+        )
+        if response.status_code != 206 or len(response.content) != 1024:
+            print_error(f"Expected 206 with 1024 bytes, got {response.status_code} with {len(response.content)} bytes")
+            return False
+        print_success(f"Document range retrieved: {response.headers.get('Content-Range')}")
+        
+        return True
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return False
+
 def test_token_validation(token=None):
     """
     Test the token validation endpoint.
@@ -164,6 +313,103 @@ def test_token_validation(token=None):
         print_error(f"Error: {str(e)}")
         return False
 
+def test_token_status(token=None):
+    """
+    Test the token anchoring status endpoint.
+    
+    Args:
+        token (str, optional): Token to look up. If None, a new token will be generated.
+    
+    Returns:
+        str: The anchor status of the token, or None if the lookup failed
+    """
+    print_header("Testing Token Status Endpoint")
+    
+    if token is None:
+        print_info("No token provided, generating a new one...")
+        token = test_token_generation()
+        
+        if token is None:
+            print_error("Failed to generate a token for the status check")
+            return None
+    
+    print_info(f"Checking anchor status of token: {token}")
+    
+    try:
+        response = requests.get(
+            f"{BASE_URL}/token_status",
+            params={"token": token}
+        )
+        print_response(response)
+        
+        if response.status_code == 200:
+            anchor_status = response.json().get("anchor_status")
+            
+            if anchor_status in ("pending", "submitted", "anchored"):
+                print_success(f"Token {token} anchor status: {anchor_status}")
+            else:
+                print_error(f"Token {token} anchor status: {anchor_status}")
+            
+            return anchor_status
+        else:
+            print_error(f"Token status check failed with status code {response.status_code}")
+            return None
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return None
+
+def test_batch_validation(tokens=None):
+    """
+    Test the bulk validation endpoint with valid, invalid and duplicate tokens.
+    
+    Args:
+        tokens (list, optional): Valid tokens to include. If None, new ones will be generated.
+    
+    Returns:
+        dict: The token to validity map, or None if the request failed
+    """
+    print_header("Testing Batch Token Validation Endpoint")
+    
+    if not tokens:
+        print_info("No tokens provided, generating new ones...")
+        tokens = test_batch_encryption(2)
+        
+        if not tokens:
+            print_error("Failed to generate tokens for batch validation")
+            return None
+    
+    # Repeat the first token to check deduplication
+    payload = {
+        "tokens": list(tokens) + [tokens[0], "INVALID123"]
+    }
+    print_info(f"Validating {len(payload['tokens'])} tokens")
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/validate_tokens",
+            json=payload,
+            headers={"Content-Type": "application/json"}
+        )
+        print_response(response)
+        
+        if response.status_code == 200:
+            results = response.json().get("results", {})
+            expected = {token: True for token in tokens}
+            expected["INVALID123"] = False
+            
+            if results == expected:
+                print_success(f"Batch validation returned the expected {len(expected)} distinct results")
+            else:
+                print_error(f"Unexpected batch validation results: {results}")
+            
+            return results
+        else:
+            print_error(f"Batch token validation failed with status code {response.status_code}")
+            return None
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+        return None
+
 def test_invalid_token():
     """Test validation with an invalid token."""
     print_header("Testing Invalid Token Validation")
@@ -264,6 +510,27 @@ def test_empty_token():
     except Exception as e:
         print_error(f"Error: {str(e)}")
 
+def test_metrics():
+    """Test the Prometheus metrics endpoint after the other tests have sent requests."""
+    print_header("Testing Metrics Endpoint")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/metrics")
+        print(f"\n{Fore.BLUE}Response Status: {response.status_code}{Style.RESET_ALL}")
+        
+        # The full exposition is long; show the request counters only
+        for line in response.text.splitlines():
+            if line.startswith("pii_http_requests_total"):
+                print(line)
+        print()
+        
+        if response.status_code == 200 and "pii_http_request_duration_seconds_bucket" in response.text:
+            print_success("Metrics exported")
+        else:
+            print_error(f"Metrics request failed with status code {response.status_code}")
+    except Exception as e:
+        print_error(f"Error: {str(e)}")
+
 def run_all_tests():
     """Run all tests in sequence."""
     print_header("Running All Tests")
@@ -277,6 +544,17 @@ def run_all_tests():
     # Test token validation with the generated token
     if token:
         test_token_validation(token)
+        test_token_status(token)
+    
+    # Test bulk enrollment and bulk validation
+    batch_tokens = test_batch_encryption()
+    if batch_tokens:
+        test_batch_validation(batch_tokens)
+    
+    # Test enrollment with a document attached, then stream it back
+    document_token = test_document_upload()
+    if document_token:
+        test_retrieval(document_token)
     
     # Test with invalid token
     test_invalid_token()
@@ -287,6 +565,9 @@ def run_all_tests():
     # Test with empty token
     test_empty_token()
     
+    # Check the request counters and latency histograms the tests produced
+    test_metrics()
+    
     print_header("All Tests Completed")
 
 def main():
@@ -295,11 +576,11 @@ def main():
     
     parser = argparse.ArgumentParser(description="Test PII Authenticator Backend API")
     parser.add_argument("--url", help="Base URL of the API (default: http://127.0.0.1:5000)", default=BASE_URL)
-    parser.add_argument("--test", choices=["all", "health", "generate", "validate", "invalid", "missing", "empty"], 
+    parser.add_argument("--test", choices=["all", "health", "generate", "validate", "status", "batch", "batch-validate", "document", "retrieve", "invalid", "missing", "empty", "metrics"], 
                         help="Specific test to run (default: all)", default="all")
     parser.add_argument("--user-id", help="User ID for token generation")
     parser.add_argument("--id-number", help="ID number for token generation")
-    parser.add_argument("--token", help="Token for validation")
+    parser.add_argument("--token", help="Token for validation, status lookup or retrieval")
     
     args = parser.parse_args()
     BASE_URL = args.url
@@ -312,12 +593,24 @@ def main():
         test_token_generation(args.user_id, args.id_number)
     elif args.test == "validate":
         test_token_validation(args.token)
+    elif args.test == "status":
+        test_token_status(args.token)
+    elif args.test == "batch":
+        test_batch_encryption()
+    elif args.test == "batch-validate":
+        test_batch_validation([args.token] if args.token else None)
+    elif args.test == "document":
+        test_document_upload()
+    elif args.test == "retrieve":
+        test_retrieval(args.token)
     elif args.test == "invalid":
         test_invalid_token()
     elif args.test == "missing":
         test_missing_fields()
     elif args.test == "empty":
         test_empty_token()
+    elif args.test == "metrics":
+        test_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+Shared pytest setup for the backend unit tests.
+The backend modules import each other as top-level modules, so the backend
+directory is put on the import path here.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
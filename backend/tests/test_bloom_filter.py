@@ -0,0 +1,43 @@
+"""Unit tests for bloom_filter: no false negatives and the false positive bound."""
+
+import pytest
+from bloom_filter import BloomFilter
+
+CAPACITY = 10000
+ERROR_RATE = 0.01
+
+@pytest.fixture(scope="module")
+def full_filter():
+    bloom = BloomFilter(capacity=CAPACITY, error_rate=ERROR_RATE)
+    for index in range(CAPACITY):
+        bloom.add(f"ISSUED{index:06d}")
+    return bloom
+
+def test_no_false_negatives(full_filter):
+    assert all(f"ISSUED{index:06d}" in full_filter for index in range(CAPACITY))
+
+def test_false_positive_rate_within_bound_at_capacity(full_filter):
+    trials = 50000
+    false_positives = sum(f"NEVER{index:07d}" in full_filter for index in range(trials))
+
+    # Expected about 500; the margin keeps the test stable without hiding a broken filter
+    assert false_positives / trials <= ERROR_RATE * 1.5
+    assert full_filter.estimated_false_positive_rate() == pytest.approx(ERROR_RATE, rel=0.2)
+
+def test_snapshot_round_trip(full_filter, tmp_path):
+    path = str(tmp_path / "filter.bloom")
+    full_filter.save(path)
+    restored = BloomFilter.load(path)
+
+    assert (restored.num_bits, restored.num_hashes, restored.count) == (
+        full_filter.num_bits, full_filter.num_hashes, full_filter.count
+    )
+    assert "ISSUED000042" in restored
+
+def test_truncated_snapshot_is_rejected(full_filter, tmp_path):
+    path = tmp_path / "filter.bloom"
+    full_filter.save(str(path))
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError):
+        BloomFilter.load(str(path))
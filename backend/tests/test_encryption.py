@@ -0,0 +1,141 @@
+"""Unit tests for encrypt: envelope and stream round-trips and master key rotation."""
+
+import os
+import base64
+import pytest
+import encrypt
+from encrypt import (
+    STREAM_HEADER_SIZE, STREAM_SEGMENT_SIZE, DecryptionError, StreamDecryptor,
+    decrypt_record, encrypt_record, encrypt_records, encrypt_stream,
+    stream_plaintext_size, stream_sealed_range,
+)
+
+OLD_KEY = base64.urlsafe_b64encode(b"o" * 32).decode()
+NEW_KEY = base64.urlsafe_b64encode(b"n" * 32).decode()
+
+@pytest.fixture
+def use_keys(monkeypatch):
+    """Switch the master keys; the cipher objects are rebuilt on next use."""
+    def use(current, previous=()):
+        monkeypatch.setattr(encrypt, "ENCRYPTED_AES_KEY", current)
+        monkeypatch.setattr(encrypt, "ENCRYPTION_PREVIOUS_KEYS", list(previous))
+        monkeypatch.setattr(encrypt, "_master_keys", None)
+        monkeypatch.setattr(encrypt, "_current_key_id", None)
+    use(NEW_KEY)
+    return use
+
+def seal_stream(plaintext, associated_data=b"", chunk_size=10000):
+    chunks = (plaintext[i:i + chunk_size] for i in range(0, len(plaintext), chunk_size))
+    return b"".join(encrypt_stream(chunks, associated_data))
+
+def open_range(sealed, start, end, associated_data=b"", chunk_size=7000):
+    """Decrypt plaintext bytes start to end the way /retrieve does, from only the sealed bytes needed."""
+    first, last = stream_sealed_range(start, end)
+    body = sealed[first:last + 1]
+    decryptor = StreamDecryptor(
+        sealed[:STREAM_HEADER_SIZE], stream_plaintext_size(len(sealed)), start, end, associated_data
+    )
+    out = b"".join(decryptor.update(body[i:i + chunk_size]) for i in range(0, len(body), chunk_size))
+    decryptor.finalize()
+    return out
+
+def test_envelope_round_trip(use_keys):
+    sealed = encrypt_record(b"record", b"TOKEN.json")
+
+    assert b"record" not in sealed
+    assert decrypt_record(sealed, b"TOKEN.json") == b"record"
+
+def test_envelope_uses_a_new_data_key_each_time(use_keys):
+    assert encrypt_record(b"record") != encrypt_record(b"record")
+
+def test_batch_round_trip(use_keys):
+    items = [(f"record {i}".encode(), f"T{i}.json".encode()) for i in range(5)]
+    sealed = encrypt_records(items)
+
+    assert [decrypt_record(s, aad) for s, (_, aad) in zip(sealed, items)] == [p for p, _ in items]
+
+@pytest.mark.parametrize("mutate", [
+    lambda sealed: sealed[:-1] + bytes([sealed[-1] ^ 1]),
+    lambda sealed: sealed[:30] + bytes([sealed[30] ^ 1]) + sealed[31:],
+    lambda sealed: b"\x09" + sealed[1:],
+    lambda sealed: sealed[:20],
+], ids=["ciphertext", "wrapped-key", "version", "truncated"])
+def test_envelope_rejects_tampering(use_keys, mutate):
+    with pytest.raises(DecryptionError):
+        decrypt_record(mutate(encrypt_record(b"record", b"A.json")), b"A.json")
+
+def test_envelope_is_bound_to_its_storage_key(use_keys):
+    with pytest.raises(DecryptionError):
+        decrypt_record(encrypt_record(b"record", b"A.json"), b"B.json")
+
+def test_key_rotation(use_keys):
+    use_keys(OLD_KEY)
+    old_record = encrypt_record(b"old", b"A.json")
+    old_stream = seal_stream(b"old document", b"D.bin")
+
+    use_keys(NEW_KEY, [OLD_KEY])
+    new_record = encrypt_record(b"new", b"B.json")
+    assert decrypt_record(old_record, b"A.json") == b"old"
+    assert open_range(old_stream, 0, 11, b"D.bin") == b"old document"
+    assert new_record[1:5] != old_record[1:5]
+
+    use_keys(NEW_KEY)
+    assert decrypt_record(new_record, b"B.json") == b"new"
+    with pytest.raises(DecryptionError):
+        decrypt_record(old_record, b"A.json")
+    with pytest.raises(DecryptionError):
+        open_range(old_stream, 0, 11, b"D.bin")
+
+@pytest.mark.parametrize("size", [
+    1, STREAM_SEGMENT_SIZE - 1, STREAM_SEGMENT_SIZE, STREAM_SEGMENT_SIZE + 1, 3 * STREAM_SEGMENT_SIZE + 123
+])
+def test_stream_round_trip(use_keys, size):
+    plaintext = os.urandom(size)
+    sealed = seal_stream(plaintext, b"D.bin")
+
+    assert stream_plaintext_size(len(sealed)) == size
+    assert open_range(sealed, 0, size - 1, b"D.bin") == plaintext
+
+def test_empty_stream(use_keys):
+    sealed = seal_stream(b"")
+
+    assert stream_plaintext_size(len(sealed)) == 0
+    assert open_range(sealed, 0, -1) == b""
+
+@pytest.mark.parametrize("start, end", [
+    (0, 0),
+    (100, 200),
+    (STREAM_SEGMENT_SIZE - 5, STREAM_SEGMENT_SIZE + 5),
+    (STREAM_SEGMENT_SIZE, 2 * STREAM_SEGMENT_SIZE - 1),
+    (2 * STREAM_SEGMENT_SIZE + 10, 2 * STREAM_SEGMENT_SIZE + 49),
+])
+def test_stream_ranges(use_keys, start, end):
+    plaintext = os.urandom(2 * STREAM_SEGMENT_SIZE + 50)
+    sealed = seal_stream(plaintext)
+
+    assert open_range(sealed, start, end) == plaintext[start:end + 1]
+
+def test_stream_rejects_truncation_and_reordering(use_keys):
+    plaintext = os.urandom(2 * STREAM_SEGMENT_SIZE + 50)
+    sealed = seal_stream(plaintext)
+    segment = STREAM_SEGMENT_SIZE + 16
+    header, first, second, rest = (
+        sealed[:STREAM_HEADER_SIZE],
+        sealed[STREAM_HEADER_SIZE:STREAM_HEADER_SIZE + segment],
+        sealed[STREAM_HEADER_SIZE + segment:STREAM_HEADER_SIZE + 2 * segment],
+        sealed[STREAM_HEADER_SIZE + 2 * segment:],
+    )
+
+    with pytest.raises(DecryptionError):
+        open_range(header + second + first + rest, 0, len(plaintext) - 1)
+    # Cut at a segment boundary, the second segment is read as the final one
+    with pytest.raises(DecryptionError):
+        open_range(header + first + second, 0, 2 * STREAM_SEGMENT_SIZE - 1)
+    with pytest.raises(DecryptionError):
+        open_range(sealed[:-10], 0, len(plaintext) - 1)
+
+def test_stream_is_bound_to_its_storage_key(use_keys):
+    sealed = seal_stream(b"document", b"A.bin")
+
+    with pytest.raises(DecryptionError):
+        open_range(sealed, 0, 7, b"B.bin")
@@ -0,0 +1,59 @@
+"""Unit tests for merkle: roots and proofs against sorted-pair keccak hashing."""
+
+import pytest
+from web3 import Web3
+from merkle import build_tree, verify_proof
+
+def keccak(data):
+    return bytes(Web3.keccak(data))
+
+def reference_root(tokens):
+    """Root computed the way TokenAuth.verifyTokenProof hashes, with unpaired nodes promoted."""
+    level = [keccak(keccak(token.encode())) for token in tokens]
+    while len(level) > 1:
+        pairs = [level[i:i + 2] for i in range(0, len(level), 2)]
+        level = [keccak(min(pair) + max(pair)) if len(pair) == 2 else pair[0] for pair in pairs]
+    return "0x" + level[0].hex()
+
+def contract_verify(token, proof, root):
+    """Mirror of TokenAuth.verifyTokenProof."""
+    computed = keccak(keccak(token.encode()))
+    for sibling in proof:
+        sibling = bytes.fromhex(sibling[2:])
+        computed = keccak(computed + sibling) if computed <= sibling else keccak(sibling + computed)
+    return "0x" + computed.hex() == root
+
+def make_tokens(count):
+    return [f"TOKEN{index:05d}" for index in range(count)]
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 5, 7, 8, 9, 33])
+def test_root_and_proofs_match_sorted_pair_hashing(count):
+    tokens = make_tokens(count)
+    root, proofs = build_tree(tokens)
+
+    assert root == reference_root(tokens)
+    for token in tokens:
+        assert verify_proof(token, proofs[token], root)
+        assert contract_verify(token, proofs[token], root)
+
+def test_proof_rejects_other_tokens_and_roots():
+    tokens = make_tokens(6)
+    root, proofs = build_tree(tokens)
+    other_root, _ = build_tree(make_tokens(7))
+
+    assert not verify_proof("NOTINTREE0", proofs[tokens[0]], root)
+    assert not verify_proof(tokens[0], proofs[tokens[1]], root)
+    assert not verify_proof(tokens[0], proofs[tokens[0]], other_root)
+
+def test_tampered_proof_is_rejected():
+    tokens = make_tokens(8)
+    root, proofs = build_tree(tokens)
+    proof = list(proofs[tokens[3]])
+    proof[1] = "0x" + bytes(32).hex()
+
+    assert not verify_proof(tokens[3], proof, root)
+    assert not verify_proof(tokens[3], proofs[tokens[3]][:-1], root)
+
+def test_empty_tree_is_rejected():
+    with pytest.raises(ValueError):
+        build_tree([])
@@ -0,0 +1,83 @@
+"""Unit tests for nonce_manager: allocation, release and resync."""
+
+import threading
+from types import SimpleNamespace
+from nonce_manager import NonceManager, is_nonce_error
+
+class FakeEth:
+    """Stands in for web3.eth, returning a settable pending transaction count."""
+
+    def __init__(self, count):
+        self.count = count
+        self.calls = 0
+
+    def get_transaction_count(self, address, block):
+        assert block == "pending"
+        self.calls += 1
+        return self.count
+
+def make_manager(count=5):
+    eth = FakeEth(count)
+    return NonceManager(SimpleNamespace(eth=eth), "0xabc"), eth
+
+def test_allocate_syncs_once_then_counts_locally():
+    manager, eth = make_manager(5)
+
+    assert [manager.allocate() for _ in range(3)] == [5, 6, 7]
+    assert eth.calls == 1
+
+def test_release_of_latest_nonce_reuses_it():
+    manager, eth = make_manager(5)
+    manager.allocate()
+    nonce = manager.allocate()
+
+    manager.release(nonce)
+
+    assert manager.allocate() == nonce
+    assert eth.calls == 1
+
+def test_release_of_older_nonce_resyncs():
+    manager, eth = make_manager(5)
+    first = manager.allocate()
+    manager.allocate()
+
+    manager.release(first)
+    # The later transaction reached the mempool, so the chain now reports 7
+    eth.count = 7
+
+    assert manager.allocate() == 7
+    assert eth.calls == 2
+
+def test_resync_reloads_from_chain():
+    manager, eth = make_manager(5)
+    manager.allocate()
+    eth.count = 9
+
+    manager.resync()
+
+    assert manager.allocate() == 9
+    assert manager.get_stats()["resyncs"] == 2
+
+def test_concurrent_allocations_are_unique():
+    manager, _ = make_manager(0)
+    nonces = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(200):
+            nonce = manager.allocate()
+            with lock:
+                nonces.append(nonce)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(nonces) == list(range(1600))
+
+def test_is_nonce_error():
+    assert is_nonce_error(ValueError({"message": "Nonce too low"}))
+    assert is_nonce_error(Exception("replacement transaction underpriced"))
+    assert not is_nonce_error(Exception("insufficient funds for gas"))
@@ -0,0 +1,67 @@
+"""Unit tests for record_cache: encrypted entries, ETag checks, eviction and expiry."""
+
+import pytest
+import record_cache
+from cryptography.exceptions import InvalidTag
+from record_cache import EncryptedRecordCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(record_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def make_cache(max_bytes=100, ttl=60, max_object_bytes=50):
+    return EncryptedRecordCache(max_bytes=max_bytes, ttl=ttl, max_object_bytes=max_object_bytes)
+
+def test_hit_returns_plaintext_but_stores_ciphertext():
+    cache = make_cache()
+    cache.set("A.json", b"secret record", "etag1")
+
+    assert cache.get("A.json") == (b"secret record", "etag1")
+    _, blob, size, _ = cache._entries["A.json"]
+    assert b"secret record" not in blob
+    assert size == len(b"secret record")
+
+def test_changed_etag_is_a_stale_miss():
+    cache = make_cache()
+    cache.set("A.json", b"v1", "etag1")
+
+    assert cache.get("A.json", "etag2") is None
+    assert cache.get("A.json") is None
+    assert cache.get_stats()["stale"] == 1
+
+def test_entries_expire(clock):
+    cache = make_cache(ttl=10)
+    cache.set("A.json", b"record", "etag1")
+
+    clock[0] += 11
+    assert cache.get("A.json") is None
+    assert cache.get_stats()["expirations"] == 1
+
+def test_byte_bound_evicts_least_recently_used():
+    cache = make_cache(max_bytes=100)
+    cache.set("A.json", b"a" * 40, "a")
+    cache.set("B.json", b"b" * 40, "b")
+    cache.get("A.json")
+    cache.set("C.json", b"c" * 40, "c")
+
+    assert cache.get("B.json") is None
+    assert cache.get("A.json") is not None
+    assert cache.get_stats()["bytes"] == 80
+
+def test_large_objects_are_not_cached():
+    cache = make_cache(max_object_bytes=50)
+    cache.set("A.json", b"x" * 51, "etag1")
+
+    assert cache.get("A.json") is None
+    assert cache.get_stats()["bytes"] == 0
+
+def test_entries_are_bound_to_their_key():
+    cache = make_cache()
+    cache.set("A.json", b"record a", "etag")
+    cache.set("B.json", b"record b", "etag")
+    cache._entries["A.json"] = cache._entries["B.json"]
+
+    with pytest.raises(InvalidTag):
+        cache.get("A.json")
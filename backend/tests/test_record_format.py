@@ -0,0 +1,62 @@
+"""Unit tests for record_format: round-trips through the v1 and legacy layouts."""
+
+import json
+import pytest
+from record_format import FIELDS, encode_record, decode_record, record_to_json, is_legacy_record
+
+def make_record(**overrides):
+    record = {
+        "name": "Jane Doe",
+        "email": "jane@example.com",
+        "dob": "1990-01-01",
+        "phone": "+1 555 0100",
+        "id_type": "passport",
+        "id_number": "X1234567",
+        "user_id": "jane",
+        "timestamp": 1760000000.25,
+    }
+    record.update(overrides)
+    return record
+
+@pytest.mark.parametrize("record", [
+    make_record(),
+    make_record(name="Zoë Ångström 日本 🎉"),
+    make_record(phone=None, email=""),
+    make_record(document={"file_url": "https://example.com/doc", "file_name": "a.pdf", "content_type": None}),
+    make_record(document={"file_url": "x", "extra": 1}),
+    make_record(id_number=12345, notes={"nested": [1, 2]}),
+    make_record(name="n" * 70000),
+    make_record(timestamp="2026-01-01"),
+], ids=["plain", "unicode", "null-and-empty", "document", "odd-document", "extras", "oversized", "string-timestamp"])
+def test_round_trip(record):
+    data = encode_record(record)
+
+    assert not is_legacy_record(data)
+    assert decode_record(data) == record
+    assert json.loads(record_to_json(data)) == record
+
+def test_missing_fields_decode_as_none_and_int_timestamp_as_float():
+    decoded = decode_record(encode_record({"name": "Jane", "timestamp": 5}))
+
+    assert decoded == {**dict.fromkeys(FIELDS), "name": "Jane", "timestamp": 5.0}
+
+def test_lone_surrogate_round_trips():
+    record = make_record(name="bad \ud800 name", notes="\udfff")
+    data = encode_record(record)
+
+    assert decode_record(data) == record
+    assert json.loads(record_to_json(data)) == record
+    data.decode("utf-8")
+
+def test_legacy_json_records_are_read():
+    record = make_record()
+    data = json.dumps(record, indent=2).encode()
+
+    assert is_legacy_record(data)
+    assert decode_record(data) == record
+    assert record_to_json(data) == data
+
+@pytest.mark.parametrize("data", [b"", b"\x07rest", encode_record(make_record())[:20], encode_record(make_record())[:-1]])
+def test_corrupt_records_raise(data):
+    with pytest.raises(ValueError):
+        decode_record(data)
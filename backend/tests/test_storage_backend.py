@@ -0,0 +1,62 @@
+"""Unit tests for storage_backend: key validation and path containment."""
+
+import os
+import pytest
+from storage_backend import LocalDirectoryBackend, MemoryBackend
+
+BAD_KEYS = ["../outside.json", "..", "a/b.json", "/etc/passwd", "x\0.json", "", None]
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalDirectoryBackend(root=str(tmp_path / "store"), fanout=2, fsync="none")
+
+@pytest.fixture
+def outside(tmp_path):
+    path = tmp_path / "outside.json"
+    path.write_bytes(b'{"secret": true}')
+    return path
+
+@pytest.mark.parametrize("key", BAD_KEYS)
+def test_local_rejects_keys_that_are_not_file_names(backend, key):
+    with pytest.raises(ValueError):
+        backend.exists(key)
+    with pytest.raises(ValueError):
+        backend.get(key)
+    with pytest.raises(ValueError):
+        backend.put(key, b"data")
+
+def test_local_cannot_read_outside_root(backend, outside):
+    with pytest.raises(ValueError):
+        backend.get_with_metadata("../outside.json")
+    with pytest.raises(ValueError):
+        backend.open("../outside.json")
+
+def test_local_ignores_symlinks_out_of_root(backend, outside):
+    os.makedirs(backend.root)
+    os.symlink(outside, os.path.join(backend.root, "LINK.json"))
+
+    assert not backend.exists("LINK.json")
+    assert backend.get("LINK.json") is None
+
+def test_local_round_trip(backend):
+    backend.put("ABCDEFGHIJ.json", b"record", {"pii-encryption": "envelope-v1"})
+
+    assert backend.exists("ABCDEFGHIJ.json")
+    assert backend.get("ABCDEFGHIJ.json") == b"record"
+    data, _, metadata = backend.get_with_metadata("ABCDEFGHIJ.json")
+    assert data == b"record"
+    assert metadata == {"pii-encryption": "envelope-v1"}
+    assert list(backend.list_keys()) == ["ABCDEFGHIJ.json"]
+
+def test_local_finds_keys_written_by_another_instance(backend):
+    backend.put("ABCDEFGHIJ.json", b"record")
+    other = LocalDirectoryBackend(root=backend.root, fanout=2, fsync="none")
+
+    assert other.get("ABCDEFGHIJ.json") == b"record"
+
+def test_memory_round_trip():
+    backend = MemoryBackend()
+    backend.put("ABCDEFGHIJ.json", b"record")
+
+    assert backend.get("ABCDEFGHIJ.json") == b"record"
+    assert backend.get("../ABCDEFGHIJ.json") is None
@@ -0,0 +1,56 @@
+"""Unit tests for ttl_cache: LRU eviction and per-entry expiry."""
+
+import pytest
+import ttl_cache
+from ttl_cache import TTLCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.monotonic for the cache module."""
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get_stats()["evictions"] == 1
+
+def test_negative_entries_expire_while_positive_ones_stay(clock):
+    cache = TTLCache(max_size=10)
+    cache.set("VALID", True)
+    cache.set("INVALID", False, ttl=30)
+
+    clock[0] += 29
+    assert cache.get("INVALID", "missing") is False
+
+    clock[0] += 2
+    assert cache.get("INVALID", "missing") == "missing"
+    assert cache.get("VALID") is True
+    assert cache.get_stats()["expirations"] == 1
+
+def test_default_ttl_and_invalidate(clock):
+    cache = TTLCache(max_size=10, default_ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("b")
+
+    assert cache.get("b") is None
+    clock[0] += 6
+    assert cache.get("a") is None
+
+def test_hit_ratio():
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
@@ -1,22 +1,79 @@
 # backend/token_auth.py
-from w3_utils import store_token_on_blockchain, verify_token_on_blockchain
-import random
+from w3_utils import verify_token_on_blockchain, verify_tokens_on_blockchain
+from anchor_queue import (
+    enqueue_token,
+    enqueue_tokens,
+    get_anchor_status,
+    start_worker,
+    ANCHOR_MODE,
+    MODE_MERKLE,
+    STATUS_ANCHORED,
+    STATUS_FAILED,
+)
+from ttl_cache import TTLCache
+import token_filter
+import chain_indexer
+import os
+import re
+import secrets
 import string
 import time
-from logger import get_logger
+import logging
+from logger import get_logger, log_site
+from metrics import stage
 
 # Get logger
 logger = get_logger()
 
+# Per-request log lines, sampled and rate limited by name with LOG_SAMPLE_RATES and LOG_RATE_LIMITS
+_log_generate = log_site("token.generate")
+_log_generated = log_site("token.generated", logging.DEBUG)
+_log_queued = log_site("token.queued")
+_log_timing = log_site("token.timing", logging.DEBUG)
+_log_resolved = log_site("token.resolved_locally", logging.DEBUG)
+_log_verify = log_site("token.verify")
+_log_valid = log_site("token.valid")
+_log_invalid = log_site("token.invalid")
+
+# Verification results: anchored tokens never become un-anchored, so positives
+# stay until evicted, while negatives expire quickly in case the token shows up
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "100000"))
+VERIFY_NEGATIVE_TTL = float(os.getenv("VERIFY_NEGATIVE_TTL", "30"))
+_verify_cache = TTLCache(max_size=VERIFY_CACHE_SIZE)
+_NOT_CACHED = object()
+
+# A token is the only credential /retrieve asks for, so it must be unguessable:
+# 24 characters from a CSPRNG over A-Z0-9 carry about 124 bits
+TOKEN_ALPHABET = string.ascii_uppercase + string.digits
+TOKEN_LENGTH = 24
+# Issued tokens: 24 characters, or 10 for tokens issued by earlier versions.
+# Tokens become storage keys, so nothing else may reach a storage lookup.
+TOKEN_FORMAT = re.compile(r"[A-Z0-9]{10}|[A-Z0-9]{24}")
+
+def start_background_services():
+    """Start the anchor worker, the issued-token filter and the chain indexer; safe to call repeatedly."""
+    start_worker()
+    token_filter.start()
+    chain_indexer.start()
+
 def generate_unique_token():
     """Generate a random unique token."""
-    token = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-    logger.debug(f"Generated token: {token}")
+    token = ''.join(secrets.choice(TOKEN_ALPHABET) for _ in range(TOKEN_LENGTH))
+    _log_generated("Generated token: %s", token)
     return token
 
+def _record_issued(token):
+    """Update the local lookups that must know about every issued token."""
+    token_filter.add_token(token)
+    # Drop any negative result cached before this token existed
+    _verify_cache.invalidate(token)
+
 def get_or_generate_token(user_id):
     """
-    Generate a unique token for a user and store it on the blockchain.
+    Generate a unique token for a user without issuing it.
+    
+    The caller stores the user's record first and then calls issue_token, so a
+    token is never anchored or reported valid without a stored record.
     
     Args:
         user_id (str): The user ID to associate with the token
@@ -24,33 +81,148 @@ def get_or_generate_token(user_id):
     Returns:
         str: The generated token
     """
-    logger.info(f"Generating token for user: {user_id}")
+    _log_generate("Generating token for user: %s", user_id)
     start_time = time.time()
     
-    # In production, we would check for existing tokens
-    # For better performance, we'll generate a new token with high entropy
-    # The chance of collision with 10 alphanumeric chars is extremely low
+    # Tokens are not checked against existing ones: 24 characters drawn with
+    # secrets.choice carry about 124 bits, so a collision is negligible
     token = generate_unique_token()
-    logger.debug(f"Generated token for user {user_id}: {token}")
+    _log_generated("Generated token for user %s: %s", user_id, token)
     
-    # Store token on blockchain asynchronously
-    # We'll return the token immediately and let the blockchain storage happen in the background
-    # This significantly improves user experience
+    elapsed_time = time.time() - start_time
+    _log_timing("Token generation completed in %.4f seconds", elapsed_time)
     
-    # For now, we'll still call this synchronously but with a shorter timeout
-    tx_hash = store_token_on_blockchain(token)
+    return token
+
+def issue_token(token, user_id):
+    """
+    Queue a generated token for storage on the blockchain once its record is stored.
     
-    if tx_hash:
-        logger.info(f"Token {token} stored on blockchain for user {user_id}. TX: {tx_hash}")
-    else:
-        logger.warning(f"Failed to store token {token} on blockchain for user {user_id}")
-        # Even if blockchain storage fails, we still return the token
-        # The token can be re-stored later if needed
+    The anchor worker stores it on-chain in the background and
+    get_token_status() reports the progress.
     
-    elapsed_time = time.time() - start_time
-    logger.debug(f"Token generation completed in {elapsed_time:.4f} seconds")
+    Args:
+        token (str): Token returned by get_or_generate_token
+        user_id (str): The user ID the token was generated for
+    """
+    # Queue the token for anchoring; the background worker submits the
+    # transaction and retries it if the chain is unavailable
+    enqueue_token(token)
+    _record_issued(token)
+    _log_queued("Token %s queued for blockchain storage for user %s", token, user_id)
+
+def generate_tokens(count):
+    """
+    Generate tokens without issuing them.
     
-    return token
+    Used by bulk enrollment, which uploads the records first and only issues
+    the tokens whose records were stored (see issue_tokens).
+    
+    Args:
+        count (int): How many tokens to generate
+        
+    Returns:
+        list: The generated tokens, all distinct
+    """
+    tokens = set()
+    while len(tokens) < count:
+        tokens.add(generate_unique_token())
+    return list(tokens)
+
+def issue_tokens(tokens):
+    """
+    Queue generated tokens for storage on the blockchain as one batch.
+    
+    In batch and merkle anchor modes the whole batch goes out in a single
+    transaction without waiting for the anchor window to fill.
+    
+    Args:
+        tokens (list): Tokens returned by generate_tokens
+    """
+    if not tokens:
+        return
+    
+    logger.info("Issuing %d tokens", len(tokens))
+    enqueue_tokens(tokens, flush=True)
+    for token in tokens:
+        _record_issued(token)
+
+def get_token_status(token):
+    """
+    Get the on-chain anchoring status of a token issued by this service.
+    
+    Args:
+        token (str): The token to look up
+        
+    Returns:
+        dict: The anchor status record, or None if the token is unknown
+    """
+    return get_anchor_status(token)
+
+def is_well_formed_token(token):
+    """Whether a token has the format of an issued token (see TOKEN_FORMAT)."""
+    return isinstance(token, str) and TOKEN_FORMAT.fullmatch(token) is not None
+
+def resolve_token_locally(token):
+    """
+    Try to answer a token verification from local state alone.
+    
+    Rejects tokens that are not well formed, then checks the verification cache,
+    the anchor queue, the issued-token filter and the local index of on-chain
+    TokenStored events.
+    Shared by verify_token and the async backend so both give the same answers.
+    
+    Args:
+        token (str): The token to verify
+        
+    Returns:
+        tuple: (is_valid, proof, root) - is_valid is True or False when it was
+        decided locally, or None when verify_token_on_blockchain must be called
+        with the returned proof and root
+    """
+    if not is_well_formed_token(token):
+        # Never issued, and must not be used to build a storage key
+        _log_resolved("Token %r rejected: not a well-formed token", token)
+        return False, None, None
+    
+    cached = _verify_cache.get(token, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        _log_resolved("Token %s verification served from cache: %s", token, cached)
+        return cached, None, None
+    
+    anchor_status = get_anchor_status(token)
+    if anchor_status and anchor_status["status"] == STATUS_ANCHORED and anchor_status["proof"] is not None:
+        # Root-anchored tokens are checked against their Merkle proof
+        return None, anchor_status["proof"], anchor_status["root"]
+    if anchor_status and anchor_status["status"] != STATUS_FAILED:
+        # Tokens are only queued once their record is stored (issue_token), so
+        # tokens issued here that are still waiting to be anchored are valid.
+        # This is a local lookup and can still change, so it is not cached.
+        _log_resolved("Token %s is valid (anchor status: %s)", token, anchor_status["status"])
+        return True, None, None
+    if not token_filter.might_exist(token):
+        # Never issued, so there is nothing to look up remotely
+        _log_resolved("Token %s rejected by issued-token filter", token)
+        return False, None, None
+    
+    indexed = chain_indexer.lookup(token)
+    # A miss is only False when the index is trusted to have seen every token (see
+    # chain_indexer). Merkle-anchored tokens never emit TokenStored, so only a hit counts in that mode.
+    if indexed or (indexed is False and ANCHOR_MODE != MODE_MERKLE):
+        _log_resolved("Token %s answered from the chain index: %s", token, indexed)
+        return indexed, None, None
+    
+    return None, None, None
+
+def record_verification(token, is_valid):
+    """
+    Cache the result of a remote token verification.
+    
+    Args:
+        token (str): The token that was verified
+        is_valid (bool): The result from verify_token_on_blockchain
+    """
+    _verify_cache.set(token, is_valid, ttl=None if is_valid else VERIFY_NEGATIVE_TTL)
 
 def verify_token(token):
     """
@@ -62,18 +234,72 @@ def verify_token(token):
     Returns:
         bool: True if the token is valid, False otherwise
     """
-    logger.info(f"Verifying token: {token}")
+    _log_verify("Verifying token: %s", token)
     start_time = time.time()
     
-    # Verify token on blockchain
-    is_valid = verify_token_on_blockchain(token)
+    with stage("local_resolve"):
+        is_valid, proof, root = resolve_token_locally(token)
+    if is_valid is None:
+        # Verify token on blockchain
+        with stage("remote_verify"):
+            is_valid = verify_token_on_blockchain(token, proof, root)
+        record_verification(token, is_valid)
     
     elapsed_time = time.time() - start_time
-    logger.debug(f"Token verification completed in {elapsed_time:.4f} seconds")
+    _log_timing("Token verification completed in %.4f seconds", elapsed_time)
     
     if is_valid:
-        logger.info(f"Token {token} is valid")
+        _log_valid("Token %s is valid", token)
     else:
-        logger.info(f"Token {token} is invalid")
+        _log_invalid("Token %s is invalid", token)
     
     return is_valid
+
+def verify_tokens(tokens):
+    """
+    Verify a list of tokens, answering each exactly as verify_token would.
+    
+    Duplicates are checked once. Tokens that need a remote lookup are resolved
+    together with verify_tokens_on_blockchain instead of one call per token.
+    
+    Args:
+        tokens (list): The tokens to verify
+        
+    Returns:
+        dict: Mapping of each distinct token to True if valid, False otherwise
+    """
+    unique_tokens = list(dict.fromkeys(tokens))
+    logger.info("Verifying %d distinct tokens (%d requested)", len(unique_tokens), len(tokens))
+    start_time = time.time()
+    
+    results = {}
+    remote = []
+    for token in unique_tokens:
+        is_valid, proof, root = resolve_token_locally(token)
+        if is_valid is not None:
+            results[token] = is_valid
+        elif proof is not None:
+            # Proof checks are local apart from a cached root lookup
+            results[token] = verify_token_on_blockchain(token, proof, root)
+            record_verification(token, results[token])
+        else:
+            remote.append(token)
+    
+    if remote:
+        for token, is_valid in verify_tokens_on_blockchain(remote).items():
+            results[token] = is_valid
+            record_verification(token, is_valid)
+    
+    elapsed_time = time.time() - start_time
+    logger.debug("Batch token verification completed in %.4f seconds (%d remote lookups)", elapsed_time, len(remote))
+    
+    return results
+
+def get_verification_cache_stats():
+    """
+    Get hit/miss counters for the token verification cache.
+    
+    Returns:
+        dict: Cache size, hits, misses, hit ratio, evictions and expirations
+    """
+    return _verify_cache.get_stats()
@@ -0,0 +1,202 @@
+"""
+Issued-token filter module for the PII Authenticator application.
+Keeps a Bloom filter of every token this deployment has issued, so validation
+can reject tokens that were never issued without any remote I/O.
+
+The filter is rebuilt from storage and the anchor queue at startup, or restored
+from a snapshot file, and updated as tokens are issued. Until it is ready every
+token is treated as possibly issued.
+
+A miss rejects the token outright, so the filter only sees tokens issued by this
+process. It is therefore off unless TOKEN_FILTER_ENABLED=true, which is only safe
+when this process is the sole issuer of tokens: not with several workers, hosts,
+or the Flask and aiohttp apps running against the same storage.
+"""
+
+import os
+import time
+import threading
+import traceback
+from bloom_filter import BloomFilter
+from w3_utils import list_stored_tokens
+from anchor_queue import get_queued_tokens
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+# Opt-in: only for single-instance deployments, see above
+TOKEN_FILTER_ENABLED = os.getenv("TOKEN_FILTER_ENABLED", "false").lower() == "true"
+TOKEN_FILTER_PATH = os.getenv("TOKEN_FILTER_PATH", os.path.join("storage", "token_filter.bloom"))
+TOKEN_FILTER_CAPACITY = int(os.getenv("TOKEN_FILTER_CAPACITY", "1000000"))
+TOKEN_FILTER_ERROR_RATE = float(os.getenv("TOKEN_FILTER_ERROR_RATE", "0.001"))
+# Snapshots older than this trigger a full rescan at startup
+TOKEN_FILTER_MAX_SNAPSHOT_AGE = float(os.getenv("TOKEN_FILTER_MAX_SNAPSHOT_AGE", "86400"))
+TOKEN_FILTER_SNAPSHOT_INTERVAL = float(os.getenv("TOKEN_FILTER_SNAPSHOT_INTERVAL", "60"))
+# Periodic full rescans pick up tokens issued by other instances; 0 disables them
+TOKEN_FILTER_REBUILD_INTERVAL = float(os.getenv("TOKEN_FILTER_REBUILD_INTERVAL", "0"))
+
+_lock = threading.Lock()
+_filter = None
+_building = False
+# Tokens issued while a rebuild is running, replayed into the new filter
+_issued_during_build = []
+_dirty = False
+_last_snapshot = 0.0
+_thread = None
+
+def _new_filter():
+    return BloomFilter(capacity=TOKEN_FILTER_CAPACITY, error_rate=TOKEN_FILTER_ERROR_RATE)
+
+def _install(bloom):
+    """Replace the active filter, replaying tokens issued during the build."""
+    global _filter, _building, _dirty
+    with _lock:
+        for token in _issued_during_build:
+            bloom.add(token)
+        _issued_during_build.clear()
+        _filter = bloom
+        _building = False
+        _dirty = True
+
+def _rebuild():
+    """Build a fresh filter from storage and the anchor queue."""
+    global _building
+    with _lock:
+        _building = True
+
+    logger.info("Rebuilding issued-token filter...")
+    start_time = time.time()
+    bloom = _new_filter()
+    for token in list_stored_tokens():
+        bloom.add(token)
+    for token in get_queued_tokens():
+        bloom.add(token)
+    _install(bloom)
+
+    elapsed_time = time.time() - start_time
+    logger.info(f"✅ Issued-token filter rebuilt with {bloom.count} tokens in {elapsed_time:.4f} seconds")
+
+def _load_snapshot():
+    """Restore the filter from its snapshot if one is recent enough."""
+    global _building
+    if not os.path.exists(TOKEN_FILTER_PATH):
+        return False
+
+    snapshot_time = os.path.getmtime(TOKEN_FILTER_PATH)
+    if time.time() - snapshot_time > TOKEN_FILTER_MAX_SNAPSHOT_AGE:
+        logger.info("Issued-token filter snapshot is too old, rescanning")
+        return False
+
+    with _lock:
+        _building = True
+    bloom = BloomFilter.load(TOKEN_FILTER_PATH)
+    # Tokens queued after the snapshot was written are not in it yet
+    for token in get_queued_tokens(since=snapshot_time - TOKEN_FILTER_SNAPSHOT_INTERVAL):
+        bloom.add(token)
+    _install(bloom)
+
+    logger.info(f"✅ Issued-token filter restored from {TOKEN_FILTER_PATH} with {bloom.count} tokens")
+    return True
+
+def save_snapshot():
+    """Write the current filter to its snapshot file if it changed."""
+    global _dirty, _last_snapshot
+    with _lock:
+        bloom = _filter
+        if bloom is None or not _dirty:
+            return
+        _dirty = False
+        _last_snapshot = time.time()
+
+    try:
+        bloom.save(TOKEN_FILTER_PATH)
+        logger.debug(f"Issued-token filter snapshot written to {TOKEN_FILTER_PATH}")
+    except Exception as e:
+        logger.error(f"❌ Failed to write issued-token filter snapshot: {e}")
+        logger.debug(traceback.format_exc())
+
+def _run():
+    """Load or build the filter, then keep snapshots and rebuilds going."""
+    global _building
+    try:
+        if not _load_snapshot():
+            _rebuild()
+        save_snapshot()
+    except Exception as e:
+        with _lock:
+            _building = False
+        logger.error(f"❌ Failed to build issued-token filter, invalid tokens will not be pre-checked: {e}")
+        logger.debug(traceback.format_exc())
+        return
+
+    last_rebuild = time.time()
+    while True:
+        time.sleep(TOKEN_FILTER_SNAPSHOT_INTERVAL)
+        try:
+            if TOKEN_FILTER_REBUILD_INTERVAL and time.time() - last_rebuild >= TOKEN_FILTER_REBUILD_INTERVAL:
+                _rebuild()
+                last_rebuild = time.time()
+            save_snapshot()
+        except Exception as e:
+            logger.error(f"❌ Issued-token filter maintenance failed: {e}")
+            logger.debug(traceback.format_exc())
+
+def start():
+    """Load or build the filter in the background if it is enabled and not started yet."""
+    global _thread
+    if not TOKEN_FILTER_ENABLED or _thread is not None:
+        return
+
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_run, name="token-filter", daemon=True)
+        _thread.start()
+
+def add_token(token):
+    """
+    Record a newly issued token.
+
+    Args:
+        token (str): The token that was issued
+    """
+    global _dirty
+    with _lock:
+        if _building:
+            _issued_during_build.append(token)
+        bloom = _filter
+        _dirty = True
+
+    if bloom is not None:
+        bloom.add(token)
+
+def might_exist(token):
+    """
+    Check whether a token could have been issued.
+
+    Args:
+        token (str): The token to check
+
+    Returns:
+        bool: False only if the token was definitely never issued
+    """
+    bloom = _filter
+    if bloom is None:
+        return True
+    return token in bloom
+
+def get_stats():
+    """Return the filter's size and estimated false positive rate."""
+    bloom = _filter
+    if bloom is None:
+        return {"enabled": TOKEN_FILTER_ENABLED, "ready": False}
+    return {
+        "enabled": TOKEN_FILTER_ENABLED,
+        "ready": True,
+        "tokens": bloom.count,
+        "bits": bloom.num_bits,
+        "hashes": bloom.num_hashes,
+        "estimated_false_positive_rate": bloom.estimated_false_positive_rate(),
+        "last_snapshot": _last_snapshot,
+    }
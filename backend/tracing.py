@@ -0,0 +1,291 @@
+"""
+Tracing module for the PII Authenticator application.
+Lightweight per-request spans kept in a context variable, so a request can be
+followed through app, token_auth, w3_utils and the I/O executor without passing
+anything around.
+
+Each request gets a trace whose root span carries the request ID. Nested spans
+come from span() blocks, metrics.stage() blocks and every call run through
+io_executor, whose workers run in a copy of the caller's context. Code running
+outside a request (the anchor worker, the chain indexer) records no spans.
+
+Finished traces can be exported as JSON lines to a local file, or sent in OTLP
+JSON to an OTLP/HTTP collector (or anything that accepts the same POST). Traces
+slower than TRACE_SLOW_THRESHOLD_MS are always logged as a span tree.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from logger import get_logger
+
+# Get logger
+logger = get_logger()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Where finished traces go: "none", "file" or "otlp"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "none").lower()
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", os.path.join("logs", "traces.jsonl"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+# Fraction of traces exported; slow traces are always exported
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2.0"))
+TRACE_SLOW_THRESHOLD_MS = float(os.getenv("TRACE_SLOW_THRESHOLD_MS", "1000"))
+
+EXPORT_NONE = "none"
+EXPORT_FILE = "file"
+EXPORT_OTLP = "otlp"
+
+SERVICE_NAME = "pii-authenticator"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed operation in a trace, with its attributes and child spans."""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "attributes", "children",
+        "start_time", "end_time", "_start_perf", "duration", "error",
+    )
+
+    def __init__(self, trace_id, parent_id, name, attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.start_time = time.time()
+        self.end_time = None
+        self._start_perf = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start_perf
+        self.end_time = self.start_time + self.duration
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def walk(self, depth=0):
+        """Yield (depth, span) for this span and its descendants, children in start order."""
+        yield depth, self
+        # Children may be appended from worker threads while the tree is walked
+        for child in sorted(list(self.children), key=lambda span: span.start_time):
+            yield from child.walk(depth + 1)
+
+def current_span():
+    """Get the innermost open span of the current request, or None."""
+    return _current_span.get()
+
+def current_trace_id():
+    """Get the trace ID of the current request, or None."""
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+def start_trace(name, request_id=None, **attributes):
+    """
+    Open the root span of a request and make it current.
+
+    Args:
+        name (str): Span name, e.g. "POST /encrypt"
+        request_id (str, optional): The request ID, stored as an attribute
+
+    Returns:
+        Span: The root span, or None if tracing is off
+    """
+    if not TRACING_ENABLED:
+        return None
+    if request_id is not None:
+        attributes["request_id"] = request_id
+    root = Span(os.urandom(16).hex(), None, name, attributes)
+    _current_span.set(root)
+    return root
+
+def end_trace(status=None):
+    """
+    Close the current request's root span, then export and check it.
+
+    Args:
+        status (int, optional): The HTTP status code of the response
+    """
+    root = _current_span.get()
+    # span() blocks restore their parent, so only the root can be current here
+    if root is None or root.parent_id is not None:
+        return
+    _current_span.set(None)
+    if status is not None:
+        root.attributes["http_status"] = status
+    root.finish()
+
+    slow = root.duration * 1000 >= TRACE_SLOW_THRESHOLD_MS
+    if slow:
+        logger.warning(f"⚠️ Slow request {root.attributes.get('request_id', root.trace_id)} took {root.duration * 1000:.1f} ms:\n{format_tree(root)}")
+    if _exporter is not None and (slow or random.random() < TRACE_SAMPLE_RATE):
+        _exporter.export(root)
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a child of the current span.
+
+    Outside a traced request this does nothing and yields None. Exceptions are
+    recorded on the span and re-raised.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace_id, parent.span_id, name, attributes)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+def format_tree(root):
+    """Render a trace as an indented tree with each span's duration and attributes."""
+    lines = []
+    for depth, item in root.walk():
+        duration = f"{item.duration * 1000:.1f} ms" if item.duration is not None else "unfinished"
+        offset = (item.start_time - root.start_time) * 1000
+        details = " ".join(f"{key}={value}" for key, value in item.attributes.items())
+        error = f" ERROR {item.error}" if item.error else ""
+        lines.append(f"{'  ' * depth}{item.name} +{offset:.1f} ms {duration}{(' ' + details) if details else ''}{error}")
+    return "\n".join(lines)
+
+def _to_unix_nano(seconds):
+    return str(int(seconds * 1e9))
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp_spans(root):
+    """Convert a finished trace to a list of OTLP JSON span objects."""
+    spans = []
+    for _, item in root.walk():
+        end_time = item.end_time if item.end_time is not None else time.time()
+        spans.append({
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "parentSpanId": item.parent_id or "",
+            "name": item.name,
+            # SPAN_KIND_SERVER for the request, SPAN_KIND_INTERNAL below it
+            "kind": 2 if item.parent_id is None else 1,
+            "startTimeUnixNano": _to_unix_nano(item.start_time),
+            "endTimeUnixNano": _to_unix_nano(end_time),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+            # STATUS_CODE_ERROR or STATUS_CODE_UNSET
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 0},
+        })
+    return spans
+
+class TraceExporter:
+    """Exports finished traces from a background thread, in batches."""
+
+    def __init__(self, mode, max_queued=10000):
+        self.mode = mode
+        self._queue = queue.Queue(maxsize=max_queued)
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, root):
+        """Queue a finished trace; traces are dropped while the queue is full."""
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_EXPORT_INTERVAL
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"⚠️ Failed to export {len(batch)} traces to {self.mode}: {e}")
+
+    def _write(self, batch):
+        if self.mode == EXPORT_FILE:
+            with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+                for root in batch:
+                    f.write(json.dumps({"traceId": root.trace_id, "spans": to_otlp_spans(root)}, separators=(",", ":")) + "\n")
+        else:
+            payload = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{
+                        "scope": {"name": "pii_authenticator.tracing"},
+                        "spans": [item for root in batch for item in to_otlp_spans(root)],
+                    }],
+                }]
+            }
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+    def get_stats(self):
+        return {
+            "mode": self.mode,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+_exporter = None
+if TRACING_ENABLED and TRACE_EXPORT in (EXPORT_FILE, EXPORT_OTLP):
+    _exporter = TraceExporter(TRACE_EXPORT)
+elif TRACE_EXPORT not in (EXPORT_NONE, EXPORT_FILE, EXPORT_OTLP):
+    logger.warning(f"⚠️ Unknown TRACE_EXPORT {TRACE_EXPORT!r}, traces are not exported")
+
+def get_stats():
+    """
+    Get counters for trace export.
+
+    Returns:
+        dict: Export mode and the numbers of traces queued, exported, dropped and failed
+    """
+    if _exporter is None:
+        return {"enabled": TRACING_ENABLED, "exporting": False}
+    stats = _exporter.get_stats()
+    stats["enabled"] = TRACING_ENABLED
+    stats["exporting"] = True
+    return stats
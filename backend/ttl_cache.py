@@ -0,0 +1,98 @@
+"""
+TTL cache module for the PII Authenticator application.
+A small thread-safe LRU cache with optional per-entry expiry and hit/miss counters.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    """Bounded LRU cache whose entries may also expire after a time-to-live."""
+
+    def __init__(self, max_size, default_ttl=None):
+        """
+        Args:
+            max_size (int): Maximum number of entries before the least recently used is evicted
+            default_ttl (float, optional): Seconds an entry lives; None means until evicted
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Look up a key, counting a hit or a miss.
+
+        Args:
+            key: The cache key
+            default: Returned when the key is missing or expired
+
+        Returns:
+            The cached value, or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value.
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl (float, optional): Seconds the entry lives; defaults to default_ttl
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove a key if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """Return the cache counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -54,8 +54,8 @@ if "%choice%"=="3" (
     echo Access Logs:
     echo ============
     echo.
-    if exist logs\access.log (
-        type logs\access.log | more
+    if exist logs\access.jsonl (
+        type logs\access.jsonl | more
     ) else (
         echo No access logs found.
     )
@@ -86,8 +86,8 @@ if "%choice%"=="4" (
     echo.
     echo --- ACCESS LOGS ---
     echo.
-    if exist logs\access.log (
-        type logs\access.log
+    if exist logs\access.jsonl (
+        type logs\access.jsonl
     ) else (
         echo No access logs found.
     )
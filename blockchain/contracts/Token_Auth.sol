@@ -3,9 +3,13 @@ pragma solidity ^0.8.0;
 
 contract TokenAuth {
     mapping(bytes32 => bool) private tokenExists;
+    mapping(bytes32 => bool) private rootAnchored;
 
     address private owner;
 
+    // Lets off-chain indexers follow stored tokens without calling verifyToken
+    event TokenStored(bytes32 indexed tokenHash);
+
     constructor() {
         owner = msg.sender; // Only deployer can store tokens
     }
@@ -19,10 +23,52 @@ contract TokenAuth {
         bytes32 tokenHash = keccak256(abi.encodePacked(token));
         require(!tokenExists[tokenHash], "Token already exists");
         tokenExists[tokenHash] = true;
+        emit TokenStored(tokenHash);
+    }
+
+    // Store many tokens in one transaction; tokens that already exist are skipped
+    // so a retried batch does not revert as a whole.
+    function storeTokens(string[] memory tokens) public onlyOwner {
+        for (uint256 i = 0; i < tokens.length; i++) {
+            bytes32 tokenHash = keccak256(abi.encodePacked(tokens[i]));
+            if (!tokenExists[tokenHash]) {
+                tokenExists[tokenHash] = true;
+                emit TokenStored(tokenHash);
+            }
+        }
     }
 
     function verifyToken(string memory token) public view returns (bool) {
         bytes32 tokenHash = keccak256(abi.encodePacked(token));
         return tokenExists[tokenHash];
     }
+
+    // Anchor the Merkle root of a window of tokens issued off-chain.
+    function anchorRoot(bytes32 root) public onlyOwner {
+        require(!rootAnchored[root], "Root already anchored");
+        rootAnchored[root] = true;
+    }
+
+    function isRootAnchored(bytes32 root) public view returns (bool) {
+        return rootAnchored[root];
+    }
+
+    // Leaves are keccak256(keccak256(token)) and pairs are hashed in sorted order,
+    // matching backend/merkle.py.
+    function verifyTokenProof(string memory token, bytes32[] memory proof, bytes32 root) public view returns (bool) {
+        if (!rootAnchored[root]) {
+            return false;
+        }
+
+        bytes32 computed = keccak256(bytes.concat(keccak256(abi.encodePacked(token))));
+        for (uint256 i = 0; i < proof.length; i++) {
+            bytes32 sibling = proof[i];
+            if (computed < sibling) {
+                computed = keccak256(abi.encodePacked(computed, sibling));
+            } else {
+                computed = keccak256(abi.encodePacked(sibling, computed));
+            }
+        }
+        return computed == root;
+    }
 }